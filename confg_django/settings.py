@@ -14,14 +14,21 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 import os
+import sys
+import tempfile
 
 from distutils.util import strtobool # type: ignore
 import dj_database_url
+from celery.schedules import crontab
 
 
 # Load the .env file
 load_dotenv()
 
+# Test runs keep the scraper caches in a throwaway directory
+if "test" in sys.argv[1:2]:
+    os.environ["SCRAPER_CACHE_DIR"] = tempfile.mkdtemp(prefix="scraper-cache-")
+
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -280,6 +287,21 @@ PASSWORD_RESET_TIMEOUT = 60 * 1   # 24 hours, you can change this as needed
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND")
 
+# Directory for the files the scrape pipeline's stages hand to each other: the cleaned price
+# file, each shard's records and the merged records. Its stages run on any Celery worker, so
+# it must be storage every worker mounts at this same path (an NFS or EFS share, say);
+# prepare_scrape_data refuses to start without it. Unset, a local scrape_data run uses
+# scraper/fetch_data.
+SCRAPER_DATA_DIR = os.environ.get("SCRAPER_DATA_DIR")
+
+CELERY_BEAT_SCHEDULE = {
+    # The dashboard's contract expiry windows move with the date, so recompute them nightly
+    "refresh-dashboard-summary": {
+        "task": "data_provider.task.refresh_dashboard_summary_async",
+        "schedule": crontab(hour=0, minute=5),
+    },
+}
+
 # CELERY_BROKER_URL = 'amqp://localhost'
 
 
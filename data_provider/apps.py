@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DataProviderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'data_provider'
+
+    def ready(self):
+        from . import signals  # noqa: F401
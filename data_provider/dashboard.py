@@ -0,0 +1,101 @@
+import logging
+from dateutil.relativedelta import relativedelta
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from scraper.models import PRICE_TYPES, DataInsertionRecord, DODDrugData, FOIAUniqueNDCData, FSSDrug, FSSPricing
+from .models import DashboardSummary
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_PERIODS = [3, 6, 9, 12]
+INSERTION_DRUG_TYPES = ["FSS", "FOIA", "DOD"]
+
+
+def get_expiry_counts(today):
+    """
+    Pricings per price type of the drugs whose contracts expire in each 3-month window up
+    to 12 months out, in one aggregate.
+    """
+    windows = {}
+    for months in EXPIRY_PERIODS:
+        start_date = today if months == 3 else today + relativedelta(months=months - 3)
+        end_date = today + relativedelta(months=months)
+        windows[months] = Q(drug__contract__contract_stop_date__gt=start_date, drug__contract__contract_stop_date__lte=end_date)
+
+    counts = FSSPricing.objects.aggregate(**{
+        f"{months}_{price_type}": Count("id", filter=window & Q(price_type=price_type))
+        for months, window in windows.items()
+        for price_type in PRICE_TYPES
+    })
+    expiry_counts = {}
+    for months in EXPIRY_PERIODS:
+        period_counts = {price_type: counts[f"{months}_{price_type}"] for price_type in PRICE_TYPES}
+        expiry_counts[f"{months}_months"] = {"total": sum(period_counts.values()), **period_counts}
+    return expiry_counts
+
+
+def count_unique_ndcs(model):
+    # Distinct canonical NDCs, so a code stored in two formats counts once; codes that can't be
+    # normalized are counted by their raw value
+    unique_ndcs = Count(Coalesce("ndc_key", model.ndc_source_field), distinct=True)
+    return model.objects.aggregate(count=unique_ndcs)["count"]
+
+
+def get_unique_ndc_counts():
+    return {
+        "FSS": count_unique_ndcs(FSSDrug),
+        "FOIA": count_unique_ndcs(FOIAUniqueNDCData),
+        "DOD": count_unique_ndcs(DODDrugData),
+    }
+
+
+def get_price_type_counts():
+    counts = dict.fromkeys(PRICE_TYPES, 0)
+    grouped = FSSPricing.objects.filter(price_type__in=PRICE_TYPES).values("price_type").annotate(
+        count=Count("id")
+    ).order_by()
+    for price_type_count in grouped:
+        counts[price_type_count["price_type"]] = price_type_count["count"]
+    return counts
+
+
+def get_last_updates():
+    last_updates = dict.fromkeys(INSERTION_DRUG_TYPES)
+    latest = DataInsertionRecord.objects.filter(drug_type__in=INSERTION_DRUG_TYPES).values("drug_type").annotate(
+        date_inserted=Max("date_inserted")
+    ).order_by()
+    for record in latest:
+        last_updates[record["drug_type"]] = record["date_inserted"].strftime("%Y-%m-%d %H:%M:%S")
+    return last_updates
+
+
+def compute_dashboard_data(today=None):
+    today = today or timezone.now().date()
+    return {
+        "expiring_contracts": get_expiry_counts(today),
+        "unique_ndcs": get_unique_ndc_counts(),
+        "price_type_counts": get_price_type_counts(),
+        "last_updates": get_last_updates(),
+    }
+
+
+def refresh_dashboard_summary():
+    today = timezone.now().date()
+    summary, _ = DashboardSummary.objects.update_or_create(
+        pk=DashboardSummary.SINGLETON_ID,
+        defaults={"data": compute_dashboard_data(today), "computed_on": today},
+    )
+    logger.info(f"Dashboard summary refreshed for {today}.")
+    return summary
+
+
+def get_dashboard_summary():
+    """
+    The stored dashboard figures, recomputed first if there are none yet or their expiry
+    windows are from an earlier day (e.g. the nightly refresh did not run).
+    """
+    summary = DashboardSummary.objects.filter(pk=DashboardSummary.SINGLETON_ID).first()
+    if summary is None or summary.computed_on != timezone.now().date():
+        summary = refresh_dashboard_summary()
+    return summary
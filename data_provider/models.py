@@ -1,3 +1,18 @@
 from django.db import models
 
 # Create your models here.
+
+
+class DashboardSummary(models.Model):
+    """
+    The dashboard figures, computed by data_provider.dashboard and kept in a single row so the
+    dashboard is one primary-key read. The expiry windows count from `computed_on`.
+    """
+    SINGLETON_ID = 1
+
+    data = models.JSONField(default=dict)
+    computed_on = models.DateField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard summary refreshed at {self.refreshed_at}"
@@ -1,4 +1,5 @@
 # serializers.py
+from django.db.models import OuterRef, Prefetch, Subquery
 from django.utils import timezone
 from rest_framework import serializers
 from scraper.models import *
@@ -221,18 +222,46 @@ class DrugSerializer(serializers.ModelSerializer):
             'manufactured_for', 'distributed_by', 'days_until_expiry', 'expire_in_month','contract_expire_date', 'price_type'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load everything the serializer reads with the drugs themselves: vendor and contract are
+        joined, the FSS/FOIA/DOD prices are annotated as subqueries and the pricings are
+        prefetched, so serializing a page costs the same number of queries at any size.
+        """
+        return queryset.select_related("vendor", "contract").annotate(
+            fss_price=Subquery(
+                FSSPricing.objects.filter(drug=OuterRef("pk")).order_by("pk").values("price")[:1]
+            ),
+            foia_price=Subquery(
+                FOIAUniqueNDCData.objects.filter(ndc_key=OuterRef("ndc_key"))
+                .order_by("pk").values("total_publishable_dollars_spent")[:1]
+            ),
+            dod_price=Subquery(
+                DODDrugData.objects.filter(ndc_key=OuterRef("ndc_key")).order_by("pk").values("price")[:1]
+            ),
+        ).prefetch_related(Prefetch("pricings", queryset=FSSPricing.objects.order_by("pk")))
+
     def get_price_on_fss(self, obj):
+        if hasattr(obj, "fss_price"):
+            return obj.fss_price
         pricing = FSSPricing.objects.filter(drug=obj).first()
         return pricing.price if pricing else None
 
     def get_price_on_foia(self, obj):
-        ndc_code = obj.ndc_with_dashes.replace("-", "")
-        foia_data = FOIAUniqueNDCData.objects.filter(ndc_code=ndc_code).first()
+        if hasattr(obj, "foia_price"):
+            return obj.foia_price
+        if not obj.ndc_key:
+            return None
+        foia_data = FOIAUniqueNDCData.objects.filter(ndc_key=obj.ndc_key).first()
         return foia_data.total_publishable_dollars_spent if foia_data else None
 
     def get_price_on_dod(self, obj):
-        ndc_code = obj.ndc_with_dashes.replace("-", "")
-        dod_data = DODDrugData.objects.filter(ndc_code=ndc_code).first()
+        if hasattr(obj, "dod_price"):
+            return obj.dod_price
+        if not obj.ndc_key:
+            return None
+        dod_data = DODDrugData.objects.filter(ndc_key=obj.ndc_key).first()
         return dod_data.price if dod_data else None
     
     def get_days_until_expiry(self, obj):
@@ -275,14 +304,17 @@ class DrugSerializer(serializers.ModelSerializer):
         # Get the price type filter from context
         price_type_filter = self.context.get('price_type', None)
         
+        # Read from the prefetched pricings, in id order like .first(), instead of querying per drug
+        pricings = sorted(obj.pricings.all(), key=lambda pricing: pricing.pk)
+
         # If price_type_filter is provided, find the matching pricing
         if price_type_filter:
-            pricing = obj.pricings.filter(price_type=price_type_filter).first()
+            pricing = next((pricing for pricing in pricings if pricing.price_type == price_type_filter), None)
             return pricing.price_type if pricing else None
         
         # If no filter is applied, check if any price type exists
         # Return the price type of the first pricing entry if available
-        pricing = obj.pricings.first()
+        pricing = pricings[0] if pricings else None
         return pricing.price_type if pricing else None
 
 
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from scraper.models import DataInsertionRecord
+from .task import refresh_dashboard_summary_async
+
+
+@receiver(post_save, sender=DataInsertionRecord)
+def refresh_dashboard_after_insertion(sender, instance, created, **kwargs):
+    # A data load finished; recompute the dashboard once the load's transaction commits
+    if created:
+        transaction.on_commit(refresh_dashboard_summary_async.delay)
@@ -0,0 +1,7 @@
+from celery import shared_task
+from .dashboard import refresh_dashboard_summary
+
+
+@shared_task
+def refresh_dashboard_summary_async():
+    refresh_dashboard_summary()
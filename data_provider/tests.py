@@ -1,3 +1,113 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from data_provider.dashboard import refresh_dashboard_summary
+from scraper.fetch_data.price_rollups import refresh_price_rollups
+from scraper.models import DataInsertionRecord, DODDrugData, FOIAUniqueNDCData, FSSContract, FSSDrug, FSSPricing, FSSVendor
+
+
+class DrugQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("user@example.com", "password"))
+        vendor = FSSVendor.objects.create(vendor_name="Acme")
+        self.contract = FSSContract.objects.create(
+            contract_number="36F79722D0001",
+            contract_start_date=timezone.now().date() - timedelta(days=365),
+            contract_stop_date=timezone.now().date() + timedelta(days=45),
+            vendor=vendor,
+        )
+        self.vendor = vendor
+
+    def create_drugs(self, count):
+        for index in range(count):
+            ndc = f"00000-0000-{len(FSSDrug.objects.all()):02d}"
+            drug = FSSDrug.objects.create(
+                contract=self.contract, vendor=self.vendor, ndc_with_dashes=ndc, trade_name=f"Drug {ndc}",
+                dosage_form="TAB", strength="10MG", route="ORAL", va_class="CN101", covered=True,
+                prime_vendor=False, ingredient="ASPIRIN",
+            )
+            for price_type, price in (("NC", "2.00"), ("FSS", "1.00")):
+                FSSPricing.objects.create(
+                    drug=drug, price=Decimal(price), price_start_date=self.contract.contract_start_date,
+                    price_stop_date=self.contract.contract_stop_date, price_type=price_type, non_taa_compliance="",
+                )
+            FOIAUniqueNDCData.objects.create(
+                ndc_code=ndc.replace("-", ""), description=ndc, total_publishable_dollars_spent=Decimal("3.00")
+            )
+            DODDrugData.objects.create(ndc_code=ndc.replace("-", ""), description=ndc, price=Decimal("4.00"), quantity=1)
+
+    def get_drugs(self, **params):
+        return self.client.get(reverse("data_provider:drugs_by_duration"), {"months": 3, **params})
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_drugs(2)
+        with self.assertNumQueries(8) as small:
+            self.get_drugs()
+        self.create_drugs(8)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.get_drugs(price_type="FSS")
+
+        results = response.data["results"]
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[0]["price_on_fss"], Decimal("2.00"))
+        self.assertEqual(results[0]["price_on_foia"], Decimal("3.00"))
+        self.assertEqual(results[0]["price_on_dod"], Decimal("4.00"))
+        self.assertEqual(results[0]["price_type"], "FSS")
+        self.assertEqual(results[0]["vendor_name"], "Acme")
+
+    def test_detail_price_ranges_from_rollups(self):
+        self.create_drugs(2)
+        drug = FSSDrug.objects.order_by("pk").first()
+        url = reverse("data_provider:drug_details", args=[drug.pk])
+        refresh_price_rollups()
+        with self.assertNumQueries(3) as small:
+            self.client.post(url)
+        self.create_drugs(8)
+        FSSPricing.objects.filter(drug=drug, price_type="NC").update(price=Decimal("0.50"))
+        refresh_price_rollups()
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.client.post(url)
+
+        self.assertEqual(
+            response.data["data"]["price_info"]["price_ranges"],
+            {
+                "FSS": {"min": Decimal("1.00"), "max": Decimal("1.00")},
+                "NC": {"min": Decimal("0.50"), "max": Decimal("2.00")},
+                "Big4": {"min": 0, "max": 0},
+            },
+        )
+
+    def test_dashboard_is_served_from_the_summary(self):
+        self.create_drugs(3)
+        refresh_dashboard_summary()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("data_provider:dashboard-data"))
+
+        data = response.data["data"]
+        self.assertEqual(data["expiring_contracts"]["3_months"], {"total": 6, "FSS": 3, "NC": 3, "Big4": 0})
+        self.assertEqual(data["expiring_contracts"]["6_months"]["total"], 0)
+        self.assertEqual(data["unique_ndcs"], {"FSS": 3, "FOIA": 3, "DOD": 3})
+        self.assertEqual(data["price_type_counts"], {"FSS": 3, "NC": 3, "Big4": 0})
+
+    def test_unique_ndcs_count_codes_that_cannot_be_normalized(self):
+        self.create_drugs(2)
+        # The same NDC in another format counts once, malformed codes by their raw value
+        for code in ("00000000000", "N/A", "N/A", "BAD-CODE"):
+            DODDrugData.objects.create(ndc_code=code, description=code, price=Decimal("4.00"), quantity=1)
+        refresh_dashboard_summary()
+        data = self.client.get(reverse("data_provider:dashboard-data")).data["data"]
+        self.assertEqual(data["unique_ndcs"], {"FSS": 2, "FOIA": 2, "DOD": 4})
 
-# Create your tests here.
+    def test_data_insertion_refreshes_the_summary(self):
+        with mock.patch("data_provider.signals.refresh_dashboard_summary_async") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                DataInsertionRecord.objects.create(drug_type="FSS")
+        task.delay.assert_called_once_with()
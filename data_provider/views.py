@@ -8,6 +8,7 @@ from rest_framework import status
 from django.db.models import Min
 from scraper.models import *
 from .serializers import *
+from .dashboard import get_dashboard_summary
 from rest_framework.permissions import IsAuthenticated
 from .pagination import StandardResultsPagination, DashboardResultsPagination
 from drf_yasg import openapi
@@ -754,7 +755,10 @@ class DrugFullDetailViewSet(viewsets.ModelViewSet):
     def details(self, request, drug_id=None):
         try:
             # Fetch the drug by its primary key (ID)
-            drug = get_object_or_404(FSSDrug, id=drug_id)
+            drug = get_object_or_404(
+                FSSDrug.objects.select_related("contract", "manufactured_by", "manufactured_for", "distributed_by"),
+                id=drug_id,
+            )
             
             contract_type = request.data.get('price_type')  # Get contract_type from request body
             price = request.data.get('price')  # Get price from request body
@@ -775,31 +779,10 @@ class DrugFullDetailViewSet(viewsets.ModelViewSet):
             ingredient = drug.ingredient
             strength = drug.strength
 
-            # Initialize dictionaries to hold min and max prices for each price type
-            price_type_ranges = {
-                "FSS": {"min": 0, "max": 0},
-                "NC": {"min": 0, "max": 0},
-                "Big4": {"min": 0, "max": 0},
-            }
-
-            # Query for other drugs with the same ingredient and strength
-            related_drugs = FSSDrug.objects.filter(
+            # Min and max prices of each price type across drugs with the same ingredient and strength
+            price_type_ranges = PriceRangeRollup.objects.filter(
                 ingredient=ingredient, strength=strength
-            )
-
-            # Iterate over related drugs to find min and max prices
-            for related_drug in related_drugs:
-                pricings = FSSPricing.objects.filter(drug=related_drug)
-                for pricing in pricings:
-                    if pricing.price_type in price_type_ranges:
-                        if (
-                            price_type_ranges[pricing.price_type]["min"] == 0
-                            or pricing.price
-                            < price_type_ranges[pricing.price_type]["min"]
-                        ):
-                            price_type_ranges[pricing.price_type]["min"] = pricing.price
-                        if pricing.price > price_type_ranges[pricing.price_type]["max"]:
-                            price_type_ranges[pricing.price_type]["max"] = pricing.price
+            ).price_type_ranges()
 
             # Prepare response data from the drug and its related models
             response_data = {
@@ -1473,12 +1456,10 @@ class DrugsByDurationView(viewsets.ModelViewSet):
 
         total_drugs = FSSDrug.objects.count()
         percentage = (drugs.count() / total_drugs) * 100 if total_drugs > 0 else 0
-        serializer = DrugSerializer(
-            drugs, many=True, context={"price_type": price_type}
-        )
 
+        # Only the page is serialized, with its prices and pricings loaded in bulk
         paginator = self.pagination_class()
-        paginated_drugs = paginator.paginate_queryset(drugs, request)
+        paginated_drugs = paginator.paginate_queryset(DrugSerializer.setup_eager_loading(drugs), request)
         serializer = DrugSerializer(
             paginated_drugs, many=True, context={"price_type": price_type}
         )
@@ -1574,7 +1555,7 @@ class DrugsByDurationView(viewsets.ModelViewSet):
 
             # Serialize the data
             serializer = DrugSerializer(
-                drugs, many=True, context={"price_type": price_type}
+                DrugSerializer.setup_eager_loading(drugs), many=True, context={"price_type": price_type}
             )
 
             # Create a workbook and worksheet
@@ -2078,89 +2059,17 @@ class DODDrugDataViewSet(viewsets.ModelViewSet):
 class DashboardDataView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get_expiry_counts(self):
-        now = timezone.now().date()
-        expiry_counts = {}
-
-        # Calculate expiring contracts for 3, 6, 9, and 12 months
-        periods = [3, 6, 9, 12]
-        for months in periods:
-            start_date = now if months == 3 else now + relativedelta(months=months - 3)
-            end_date = now + relativedelta(months=months)
-            contracts = FSSContract.objects.filter(
-                contract_stop_date__gt=start_date, contract_stop_date__lte=end_date
-            )
-            
-            # Filter drugs related to these expiring contracts
-            drugs = FSSDrug.objects.filter(contract__in=contracts)
-            
-            # Count the number of drugs by price type within the expiring contracts
-            fss_count = drugs.filter(pricings__price_type='FSS').count()
-            nc_count = drugs.filter(pricings__price_type='NC').count()
-            big4_count = drugs.filter(pricings__price_type='Big4').count()
-            
-            # Calculate the total number of expiring drugs for this period
-            total_count = fss_count + nc_count + big4_count
-            
-            # Store the counts in a dictionary
-            expiry_counts[f"{months}_months"] = {
-                "total": total_count,
-                "FSS": fss_count,
-                "NC": nc_count,
-                "Big4": big4_count
-            }
-
-        return expiry_counts
-
-
-    def get_unique_ndc_counts(self):
-        fss_count = FSSDrug.objects.values("ndc_with_dashes").distinct().count()
-        foia_count = FOIAUniqueNDCData.objects.values("ndc_code").distinct().count()
-        dod_count = DODDrugData.objects.values("ndc_code").distinct().count()
-        return {"FSS": fss_count, "FOIA": foia_count, "DOD": dod_count}
-    
-    def get_price_type_counts(self):
-        drugs = FSSDrug.objects.all()
-        fss_count = drugs.filter(pricings__price_type='FSS').count()
-        nc_count = drugs.filter(pricings__price_type='NC').count()
-        big4_count = drugs.filter(pricings__price_type='Big4').count()
-        return {"FSS": fss_count, "NC": nc_count, "Big4": big4_count}
-    def get_last_updates(self):
-        last_updates = {}
-        drug_types = ["FSS", "FOIA", "DOD"]
-        for drug_type in drug_types:
-            record = (
-                DataInsertionRecord.objects.filter(drug_type=drug_type)
-                .order_by("-date_inserted")
-                .first()
-            )
-            last_updates[drug_type] = (
-                record.date_inserted.strftime("%Y-%m-%d %H:%M:%S") if record else None
-            )
-        return last_updates
-
     def get(self, request):
         """
-        API endpoint to get dashboard data.
+        API endpoint to get dashboard data, served from the stored dashboard summary.
         """
         try:
-            expiry_counts = self.get_expiry_counts()
-            unique_ndc_counts = self.get_unique_ndc_counts()
-            last_updates = self.get_last_updates()
-            price_type_counts = self.get_price_type_counts()  # Added this line
-
-            dashboard_data = {
-                "expiring_contracts": expiry_counts,
-                "unique_ndcs": unique_ndc_counts,
-                "price_type_counts": price_type_counts,  # Added this line
-                "last_updates": last_updates,
-            }
-
+            summary = get_dashboard_summary()
             return Response(
                 {
                     "success": True,
                     "message": "Data retrieved successfully",
-                    "data": dashboard_data,
+                    "data": summary.data,
                 },
                 status=status.HTTP_200_OK,
             )
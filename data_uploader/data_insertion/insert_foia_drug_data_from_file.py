@@ -9,7 +9,10 @@ from django.db.models import F
 import os
 
 import openai
-import requests
+from scraper.fetch_data.http_client import get_fetch_client
+from scraper.fetch_data.data_wrangling import DataWrangling
+from scraper.fetch_data.llm_cache import LLMExtractionCache
+from scraper.fetch_data.manufacturer_parser import ManufacturerParser
 from scraper.models import FOIAUniqueNDCData, FOIADrugsData, Manufacturer
 logger = logging.getLogger(__name__)
 
@@ -17,6 +20,9 @@ class FetchFoiaFile:
     def __init__(self):
         self.input_file = os.path.join('scraper', 'fetch_data', 'raw_data', 'FOIA-24-02336-F Response (1).txt')
         self.base_url = "https://dailymed.nlm.nih.gov/dailymed/search.cfm?labeltype=all&query={}&pagesize=20&page=1"
+        self.llm_cache = LLMExtractionCache("foia_drug_data_v1")
+        self.manufacturer_parser = ManufacturerParser()
+        self.data_wrangling = DataWrangling()
         #self.ndc_details = set()
         self.ndc_details = set(FOIAUniqueNDCData.objects.values_list('ndc_code', flat=True))  # Cache existing NDC codes
 
@@ -91,38 +97,59 @@ class FetchFoiaFile:
     def get_ndc_drug_data(self, soup, ndc_code, description):
         
         logger.info(f"Searching for NDC code: {ndc_code}")
-        desire_element = self.get_desire_element(soup)
+        desire_element = self.get_desire_element(soup) if soup is not None else None
         if desire_element is not None:
             text = self.extract_information_from_li(desire_element)
             logger.info(text)
-            prompt = f'''
-                I have extracted the following text:\n{text}\n\n
-                Now, from this text find the complete details of "Manufactured By", "Manufactured for", and "Distributed by". If one is not found, then place an empty string against it.
-                Additionally, based on the provided description: \n{description}\n\n, extract the "Medicine"(must goes into the Ingredient) or "Ingredient", "Dosage Form", and "Strength".
-                Provide all the information in a single JSON format:
-
-                {{"Ingredient": "", "Dosage Form": "", "Strength": "","Manufactured By": "", "Manufactured For": "", "Distributed By": ""}}
-                '''
-            response = self.get_with_gpt(prompt)
-            logger.info(response)
-            data = self.extract_from_response_and_save(response, ndc_code)
-            
-            return data
-            #self.write_to_csv(data,'foia_drug_data.csv')
         else:
             logger.info(f"No desire element found for NDC code: {ndc_code} \n Just Finding the Ingredient, Dosage Form and Strength.")
-            prompt = f'''
-                I have extracted the following text:\n{'empty'}\n\n
+            text = 'empty'
+
+        def extract_with_gpt():
+            return self.llm_cache.get_or_extract(
+                [text, description], lambda: self.extract_drug_data_with_gpt(text, description)
+            )
+
+        # The description and well-formed labels are parsed locally; the LLM only sees the rest
+        description_data = self.parse_description(description)
+        if description_data is None:
+            extracted_data = extract_with_gpt()
+        elif desire_element is None:
+            extracted_data = description_data
+        else:
+            extracted_data = {**description_data, **(self.manufacturer_parser.extract(text, extract_with_gpt) or {})}
+        data = {"NDC Code": ndc_code, **(extracted_data or {})}
+        for key in ("Ingredient", "Strength", "Dosage Form", "Manufactured By", "Manufactured For", "Distributed By"):
+            data.setdefault(key, "")
+        return data
+
+    def parse_description(self, description):
+        """
+        Ingredient, Dosage Form and Strength from a description such as "ATORVASTATIN CALCIUM 10MG TAB",
+        using the FSS generic name rules. Returns None when one of them cannot be found.
+        """
+        dosage_form, strength, _, ingredient = self.data_wrangling.extract_values_from_generic_column(description)
+        dosage_form = self.data_wrangling.dosage_form_mapping.get(dosage_form)
+        if not (ingredient and strength and dosage_form):
+            return None
+        return {"Ingredient": ingredient, "Dosage Form": dosage_form, "Strength": strength}
+
+    def extract_drug_data_with_gpt(self, text, description):
+        prompt = f'''
+                I have extracted the following text:\n{text}\n\n
                 Now, from this text find the complete details of "Manufactured By", "Manufactured for", and "Distributed by". If one is not found, then place an empty string against it.
                 Additionally, based on the provided description: \n{description}\n\n, extract the "Medicine"(must goes into the Ingredient) or "Ingredient", "Dosage Form", and "Strength".
                 Provide all the information in a single JSON format:
 
                 {{"Ingredient": "", "Dosage Form": "", "Strength": "","Manufactured By": "", "Manufactured For": "", "Distributed By": ""}}
                 '''
-            response = self.get_with_gpt(prompt)
-            logger.info(response)
-            data = self.extract_from_response_and_save(response, ndc_code)
-            return data
+        response = self.get_with_gpt(prompt)
+        logger.info(response)
+        if response is None:
+            return None
+        data = self.extract_from_response_and_save(response, None)
+        data.pop("NDC Code")
+        return data
 
     
     def write_to_csv(self, data, filename):
@@ -132,32 +159,11 @@ class FetchFoiaFile:
             writer.writerow(data)
     
     def fetch_daily_med(self, url):
-        max_retries = 20  
-        attempts = 0  
-        while attempts < max_retries:
-            try:
-                response = requests.get(url)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    return soup
-                else:
-                    logger.info(f"Failed to fetch data from the URL: {url}. Status Code: {response.status_code}")
-                    attempts += 1
-                    if attempts < max_retries:
-                        logger.info(f"Attempt {attempts} failed, retrying in 5 seconds...")
-                        time.sleep(10)  # Wait for 5 seconds before retrying
-                    else:
-                        logger.info("Maximum retries reached. Aborting.")
-                        return None
-            except requests.exceptions.RequestException as e:
-                logger.info(f"An error occurred during the request: {e}")
-                attempts += 1
-                if attempts < max_retries:
-                    logger.info(f"Attempt {attempts} failed due to a request exception, retrying in 5 seconds...")
-                    time.sleep(10)  # Wait for 5 seconds before retrying
-                else:
-                    logger.info("Maximum retries reached after request exception. Aborting.")
-                    return None
+        response = get_fetch_client().get(url)
+        if response is not None and response.status_code == 200:
+            return BeautifulSoup(response.text, "html.parser")
+        logger.info(f"Failed to fetch data from the URL: {url}. Status Code: {getattr(response, 'status_code', None)}")
+        return None
     
     def get_with_gpt(self, prompt):
         api_key = os.getenv('API_KEY')
@@ -284,4 +290,8 @@ class FetchFoiaFile:
         Entry method to start the NDC data processing.
         """
         self.insert_foia_drug_data_from_file()
+        self.manufacturer_parser.log_stats(logger)
+        self.data_wrangling.parse_cache.save()
+        self.data_wrangling.parse_cache.log_stats(logger)
+        self.llm_cache.log_stats(logger)
 
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+from scraper.ndc import normalize_ndc
+
+BATCH_SIZE = 1000
+
+
+def backfill_ndc_keys(apps, schema_editor):
+    FOIAMonthlyStats = apps.get_model('data_uploader', 'FOIAMonthlyStats')
+    batch = []
+    for stats in FOIAMonthlyStats.objects.only('id', 'ndc').iterator(chunk_size=BATCH_SIZE):
+        stats.ndc_key = normalize_ndc(stats.ndc)
+        batch.append(stats)
+        if len(batch) == BATCH_SIZE:
+            FOIAMonthlyStats.objects.bulk_update(batch, ['ndc_key'])
+            batch = []
+    FOIAMonthlyStats.objects.bulk_update(batch, ['ndc_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_uploader', '0003_alter_foiamonthlystats_max_purchase_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foiamonthlystats',
+            name='ndc_key',
+            field=models.CharField(blank=True, db_index=True, max_length=11, null=True),
+        ),
+        migrations.RunPython(backfill_ndc_keys, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 
 from django.db import models
 from decimal import Decimal
+from scraper.models import NDCKeyedModel
+
+class FOIAMonthlyStats(NDCKeyedModel):
+    ndc_source_field = "ndc"
 
-class FOIAMonthlyStats(models.Model):
     ndc = models.CharField(max_length=50)
     product_name = models.CharField(max_length=255,null=True, blank=True)
     strength = models.CharField(max_length=50,null=True, blank=True)
@@ -57,4 +57,19 @@ class DataInsertionRecordAdmin(admin.ModelAdmin):
 class DODDrugDataAdmin(admin.ModelAdmin):
     search_fields = ['ndc_code', 'description']
 
+@admin.register(FSSChangeSet)
+class FSSChangeSetAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'consolidated']
+    list_filter = ['consolidated']
+
+@admin.register(ScrapeCheckpoint)
+class ScrapeCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['source', 'position', 'last_item', 'completed', 'updated_at']
+
+
+@admin.register(PriceRangeRollup)
+class PriceRangeRollupAdmin(admin.ModelAdmin):
+    list_display = ['ingredient', 'strength', 'dosage_form', 'route', 'price_type', 'min_price', 'max_price', 'median_price', 'pricing_count']
+    search_fields = ['ingredient']
+
 # For any other models, you can register them similarly.
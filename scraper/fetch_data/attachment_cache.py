@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+from .cache_store import CACHE_DIR, SQLiteCacheStore, cache_key
+
+try:
+    import fcntl  # Locks the download path across processes; not available on Windows
+except ImportError:
+    fcntl = None
+
+
+class AttachmentCache:
+    """
+    Content-addressed cache of SAM.gov attachments and the tables parsed from them.
+
+    Files are stored under the SHA-256 of their bytes and parsed tables are keyed by the same
+    hash, so an attachment shared by several opportunities is parsed once. Each attachment's
+    resourceId and posted date map to the hash of the file it served, which lets unchanged
+    attachments skip the download as well. Threads working on the same resource or file take
+    its lock, so each is downloaded and parsed once.
+    """
+
+    def __init__(self, cache_dir=None, store=None):
+        self.files_dir = os.path.join(cache_dir or CACHE_DIR, "sam_attachments")
+        self.downloads_dir = os.path.join(self.files_dir, "downloads")
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        self.store = store or SQLiteCacheStore("sam_attachments", cache_dir)
+        self.stats = {"downloads_skipped": 0, "parses_skipped": 0}
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def lock(self, key):
+        """
+        The lock of a resource key, download URL or SHA-256.
+        """
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def resource_key(self, attachment):
+        """
+        Cache key for an attachment entry from the resources API, or None when it has no
+        resourceId.
+        """
+        resource_id = attachment.get("resourceId")
+        if not resource_id:
+            return None
+        version = next(
+            (attachment[field] for field in ("modifiedDate", "postedDate", "fileSize") if attachment.get(field)), ""
+        )
+        return f"resource:{resource_id}:{version}"
+
+    def lookup_resource(self, resource_key):
+        """
+        Return {"sha256", "filename"} for a previously downloaded resource, or None.
+        """
+        return self.store.get_json(resource_key) if resource_key else None
+
+    def remember_resource(self, resource_key, sha256, filename):
+        if resource_key:
+            self.store.set_json(resource_key, {"sha256": sha256, "filename": filename})
+
+    def file_path(self, sha256, filename):
+        # The parsers pick the format from the extension, so keep it on the stored file
+        return os.path.join(self.files_dir, sha256 + os.path.splitext(filename)[1].lower())
+
+    def download_path(self, download_url):
+        """
+        Where an attachment is streamed to before its hash is known. The path is stable per URL
+        so an interrupted download can be resumed.
+        """
+        return os.path.join(self.downloads_dir, cache_key(download_url))
+
+    @contextmanager
+    def download_lock(self, download_url):
+        """
+        Hold the download path of a URL, against other threads and (through a lock file beside
+        it) other scraper processes sharing the cache, until the file is moved into the cache.
+        Yields the path.
+        """
+        path = self.download_path(download_url)
+        with self.lock(f"download:{download_url}"), open(f"{path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+            yield path
+
+    def add_file(self, download_path, filename):
+        """
+        Move a downloaded file to its content-addressed path and return its SHA-256.
+        """
+        with open(download_path, "rb") as file:
+            sha256 = hashlib.file_digest(file, "sha256").hexdigest()
+        os.replace(download_path, self.file_path(sha256, filename))
+        return sha256
+
+    def get_parsed(self, sha256):
+        value = self.store.get(f"parsed:{sha256}")
+        if value is None:
+            return None
+        parsed = json.loads(value[0])
+        return pd.DataFrame(parsed["data"], index=parsed["index"], columns=parsed["columns"], dtype=object)
+
+    def save_parsed(self, sha256, df):
+        parsed = json.dumps(df.to_dict(orient="split"), default=str)
+        self.store.set(f"parsed:{sha256}", parsed.encode("utf-8"))
+
+    def log_stats(self, logger):
+        logger.info(
+            f"Attachment cache: {self.stats['downloads_skipped']} downloads skipped, "
+            f"{self.stats['parses_skipped']} parses skipped."
+        )
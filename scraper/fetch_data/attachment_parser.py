@@ -0,0 +1,387 @@
+import logging
+import logging.config
+from multiprocessing.connection import Connection
+import os
+import queue
+import subprocess
+import sys
+import threading
+from django.conf import settings
+from docx import Document
+import fitz
+import pandas as pd
+from .data_wrangling import DataWrangling
+
+try:
+    import resource  # Worker memory cap; not available on Windows
+except ImportError:
+    resource = None
+
+logger = logging.getLogger('scraping')
+
+
+class AttachmentParser:
+    """
+    Extracts the "ESTIMATED ANNUAL REQUIREMENTS BY AGENCY" table from SAM.gov solicitation
+    attachments (DOCX, PDF, XLSX).
+    """
+
+    def __init__(self, scraping_logger=logger):
+        self.logger = scraping_logger
+        self.data_wrangler = DataWrangling()
+
+    def get_data_from_file_doc(self, file_name):
+        self.logger.info(f"Extracting data from DOCX file: {file_name}")
+        try:
+            doc = Document(file_name)
+            data = []
+
+            for table in doc.tables:
+                if "ESTIMATED ANNUAL REQUIREMENTS BY AGENCY" in table.cell(0, 0).text:
+                    is_header_row = True
+                    for row in table.rows:
+                        if is_header_row:
+                            is_header_row = False
+                            continue  # Skip the header row
+
+                        row_data = []
+                        for cell in row.cells:
+                            row_data.append(cell.text)
+                        data.append(row_data)
+
+            # Create DataFrame without header
+            df = pd.DataFrame(data)
+
+            if not df.empty:
+                self.logger.info(f"Data extracted successfully from DOCX: {file_name}")
+                # Set the first row as the header
+                new_header = df.iloc[0]
+                df = df[1:]
+                df.columns = new_header
+
+                # Dynamically identify column name containing "TOTAL EST. ANNUAL USAGE"
+                total_usage_col = None
+                for col in df.columns:
+                    if "TOTAL EST. ANNUAL USAGE" in col:
+                        total_usage_col = col
+                        break
+
+                if total_usage_col:
+                    df[["DosageForm", "Strength", "Route", "Ingredient"]] = self.data_wrangler.parse_generic_column(
+                        df["DESCRIPTION"]
+                    )
+
+                    # Keep only the columns of interest, ensuring dynamic handling of the total usage column
+                    df = df[
+                        [
+                            total_usage_col,
+                            "DosageForm",
+                            "Strength",
+                            "Route",
+                            "Ingredient",
+                        ]
+                    ]
+
+                    # Rename the dynamically identified 'TOTAL EST. ANNUAL USAGE' column
+                    result_df = df.rename(
+                        columns={total_usage_col: "Estimated Annual Quantities"}
+                    )
+                else:
+                    result_df = pd.DataFrame()
+            else:
+                self.logger.warning(f"No data extracted from DOCX: {file_name}")
+                result_df = pd.DataFrame()
+
+        except Exception as e:
+            self.logger.error(f"Error extracting data from DOCX {file_name}: {str(e)}")
+            raise
+
+        return result_df
+
+
+    def get_data_from_pdf(self, file_name):
+        self.logger.info(f"Extracting data from PDF file: {file_name}")
+        try:
+            doc = fitz.open(file_name)
+            data = []
+            start_extracting = False
+
+            for page in doc:
+                text_instances = page.search_for("ESTIMATED ANNUAL REQUIREMENTS BY AGENCY")
+                if text_instances:
+                    start_extracting = True
+                    rect = text_instances[0]
+                    bottom_left = fitz.Point(rect.bl.x, rect.bl.y + 1)
+
+                    for text_instance in page.get_text("blocks"):
+                        block_rect = fitz.Rect(text_instance[:4])
+
+                        if block_rect.tl.y > bottom_left.y:
+                            row_data = text_instance[4].split("\n")
+                            if row_data:
+                                data.append(row_data)
+
+                if start_extracting:
+                    break
+
+            df = pd.DataFrame(data)
+
+            if not df.empty:
+                self.logger.info(f"Data extracted successfully from PDF: {file_name}")
+                # Process and return the DataFrame as before...
+            else:
+                self.logger.warning(f"No data extracted from PDF: {file_name}")
+                return pd.DataFrame()
+
+        except Exception as e:
+            self.logger.error(f"Error extracting data from PDF {file_name}: {str(e)}")
+            raise
+
+    
+    def get_data_from_file_excel(self, file_name):
+        self.logger.info(f"Extracting data from Excel file: {file_name}")
+        try:
+            # Read the Excel file. Assuming the data is in the first sheet, else specify sheet_name
+            df = pd.read_excel(file_name, sheet_name=0)
+
+            if not df.empty:
+                self.logger.info(f"Data extracted successfully from Excel: {file_name}")
+                # Dynamically identify column name containing "TOTAL Estimated ANNUAL"
+                total_usage_col = None
+                for col in df.columns:
+                    if "total estimated annual" in col.lower():
+                        total_usage_col = col
+                        break
+
+                if total_usage_col:
+                    # Assuming 'DESCRIPTION' exists and can be used to extract the following details
+                    if 'DESCRIPTION' in df.columns:
+                        df[["DosageForm", "Strength", "Route", "Ingredient"]] = self.data_wrangler.parse_generic_column(
+                            df["DESCRIPTION"]
+                        )
+
+                        # Keep only the columns of interest, ensuring dynamic handling of the total usage column
+                        df = df[
+                            [
+                                total_usage_col,
+                                "DosageForm",
+                                "Strength",
+                                "Route",
+                                "Ingredient",
+                            ]
+                        ]
+
+                        # Rename the dynamically identified 'TOTAL Estimated ANNUAL' column
+                        result_df = df.rename(
+                            columns={total_usage_col: "Estimated Annual Quantities"}
+                        )
+                    else:
+                        self.logger.warning(f"'DESCRIPTION' column not found in Excel: {file_name}")
+                        result_df = pd.DataFrame()
+                else:
+                    self.logger.warning(f"'TOTAL Estimated ANNUAL' column not found in Excel: {file_name}")
+                    result_df = pd.DataFrame()
+            else:
+                self.logger.warning(f"No data extracted from Excel: {file_name}")
+                result_df = pd.DataFrame()
+
+        except Exception as e:
+            self.logger.error(f"Error extracting data from Excel {file_name}: {str(e)}")
+            raise
+
+        return result_df
+
+
+    def process_file(self, file_path):
+        """
+        Return the table extracted from file_path (empty if it has none), or None if the file
+        could not be read.
+        """
+        self.logger.info(f"Processing file: {file_path}")
+        
+        result_df = pd.DataFrame()  # Default to an empty DataFrame
+        
+        try:
+            if file_path.endswith(".pdf"):
+                result_df = self.get_data_from_pdf(file_path)
+            elif file_path.endswith(".docx"):
+                result_df = self.get_data_from_file_doc(file_path)
+            elif file_path.endswith((".xlsx", ".xls")):
+                result_df = self.get_data_from_file_excel(file_path)
+            else:
+                self.logger.error(f"Unsupported file type for {file_path}")
+        except Exception as e:
+            self.logger.error(f"Error processing file {file_path}: {str(e)}")
+            return None
+
+        if result_df is None:
+            self.logger.warning(f"Resulting DataFrame is None for file {file_path}")
+            return pd.DataFrame()
+
+        if result_df.empty:
+            self.logger.warning(f"Resulting DataFrame is empty for file {file_path}")
+            return pd.DataFrame()
+
+        self.logger.info(f"Successfully processed file: {file_path}")
+        return result_df
+
+
+def worker_log_config(log_config):
+    """
+    The logging config for parser workers: log_config with its handlers replaced by one writing
+    to stderr, so the log files are only written, and rotated, by the scraper process.
+    """
+    formatters = [handler["formatter"] for handler in log_config.get("handlers", {}).values() if "formatter" in handler]
+    stderr_handler = {"class": "logging.StreamHandler", "stream": "ext://sys.stderr"}
+    if formatters:
+        stderr_handler["formatter"] = formatters[0]
+    worker_config = {
+        **log_config,
+        "handlers": {"stderr": stderr_handler},
+        "loggers": {name: {**config, "handlers": ["stderr"]} for name, config in log_config.get("loggers", {}).items()},
+    }
+    if "root" in log_config:
+        worker_config["root"] = {**log_config["root"], "handlers": ["stderr"]}
+    return worker_config
+
+
+def init_worker(memory_limit, log_config):
+    if log_config:
+        logging.config.dictConfig(log_config)
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    return AttachmentParser()
+
+
+def run_worker(request_fd, reply_fd):
+    """
+    Body of a parser worker process: receive the memory limit and logging config, then parse
+    each file path received and send back its table until the parent closes the pipe.
+    """
+    requests = Connection(request_fd, writable=False)
+    replies = Connection(reply_fd, readable=False)
+    parser = init_worker(*requests.recv())
+    while True:
+        try:
+            file_path = requests.recv()
+        except EOFError:
+            return
+        replies.send(parser.process_file(file_path))
+
+
+class ParserWorker:
+    """
+    One parser worker process, started as `python -m scraper.fetch_data.attachment_parser`
+    with a pipe each way. Its stdout and stderr are the scraper's, and it logs to stderr.
+    """
+
+    def __init__(self, memory_limit, log_config):
+        request_read, request_write = os.pipe()
+        reply_read, reply_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", __spec__.name, str(request_read), str(reply_write)],
+                pass_fds=(request_read, reply_write),
+                env={**os.environ, "PYTHONPATH": os.pathsep.join(path for path in sys.path if path)},
+            )
+        except OSError:
+            for fd in (request_write, reply_read):
+                os.close(fd)
+            raise
+        finally:
+            os.close(request_read)
+            os.close(reply_write)
+        self.requests = Connection(request_write, readable=False)
+        self.replies = Connection(reply_read, writable=False)
+        self.requests.send((memory_limit, log_config))
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def parse(self, file_path, timeout):
+        """
+        Return the worker's reply for file_path. Raises TimeoutError if it takes longer than
+        timeout seconds, or EOFError/OSError if the worker died.
+        """
+        self.requests.send(file_path)
+        if not self.replies.poll(timeout):
+            raise TimeoutError(f"no reply after {timeout}s")
+        return self.replies.recv()
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        # The worker exits once its request pipe is closed
+        self.requests.close()
+        self.replies.close()
+        self.process.wait()
+
+
+class AttachmentParserPool:
+    """
+    Parses attachments in worker processes so the CPU-bound document parsing does not hold the
+    GIL of the scraper threads.
+
+    Each file gets `timeout` seconds and each worker's address space is capped at
+    `memory_limit` bytes. A worker that times out or dies is killed and replaced, and its file
+    yields None, as does a file that could not be read, so callers can tell it apart from a
+    file with no table. The workers are plain subprocesses rather than multiprocessing
+    children, so they can be started from daemonic processes such as prefork Celery workers.
+    """
+
+    def __init__(self, max_workers=2, timeout=120, memory_limit=1024 * 1024 * 1024):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.lock = threading.Lock()
+        self.workers = {}  # pid -> ParserWorker, busy or idle
+        self.idle_workers = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_workers)
+
+    def acquire_worker(self):
+        try:
+            return self.idle_workers.get_nowait()
+        except queue.Empty:
+            pass
+        log_config = worker_log_config(settings.LOGGING) if settings.configured else None
+        worker = ParserWorker(self.memory_limit, log_config)
+        with self.lock:
+            self.workers[worker.pid] = worker
+        return worker
+
+    def discard_worker(self, worker, kill=False):
+        with self.lock:
+            self.workers.pop(worker.pid, None)
+        worker.stop(kill=kill)
+
+    def parse(self, file_path):
+        """
+        Return the extracted table for file_path (empty if it has none), or None if it could not
+        be read or the worker timed out or died.
+        """
+        with self.slots:
+            worker = self.acquire_worker()
+            try:
+                result_df = worker.parse(file_path, self.timeout)
+            except TimeoutError:
+                logger.error(f"Parsing {file_path} timed out after {self.timeout}s; killing worker {worker.pid}.")
+                self.discard_worker(worker, kill=True)
+                return None
+            except (EOFError, OSError) as e:
+                logger.error(f"Parser worker {worker.pid} died while parsing {file_path}: {e}")
+                self.discard_worker(worker, kill=True)
+                return None
+            self.idle_workers.put(worker)
+            return result_df
+
+    def shutdown(self):
+        with self.lock:
+            workers, self.workers = list(self.workers.values()), {}
+        self.idle_workers = queue.LifoQueue()
+        for worker in workers:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    run_worker(int(sys.argv[1]), int(sys.argv[2]))
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Kept outside the source tree; SCRAPER_CACHE_DIR overrides it
+CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "pharma_scraper"
+)
+
+
+def cache_key(*parts):
+    """
+    Stable sha256 key for a sequence of strings/bytes.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class SQLiteCacheStore:
+    """
+    Small persistent key/value store on a local SQLite file, shared by the scraper caches.
+
+    Each entry holds a binary value, a JSON metadata dict and the time it was stored. The
+    connection is shared between threads behind a lock.
+    """
+
+    def __init__(self, name, cache_dir=None):
+        cache_dir = cache_dir or CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{name}.sqlite3")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, metadata TEXT, stored_at REAL)"
+            )
+
+    def get(self, key):
+        """
+        Return (value, metadata, stored_at) for a key, or None if it is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, metadata, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, metadata, stored_at = row
+        return value, json.loads(metadata or "{}"), stored_at
+
+    def set(self, key, value, metadata=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, metadata, stored_at) VALUES (?, ?, ?, ?)",
+                (key, value, json.dumps(metadata or {}), time.time()),
+            )
+
+    def set_many(self, items, metadata=None):
+        """
+        Store several (key, value) pairs in one transaction.
+        """
+        stored_at = time.time()
+        metadata = json.dumps(metadata or {})
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, metadata, stored_at) VALUES (?, ?, ?, ?)",
+                [(key, value, metadata, stored_at) for key, value in items],
+            )
+
+    def scan(self, prefix):
+        """
+        Return (key, value) for every key starting with prefix.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT key, value FROM entries WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff")
+            ).fetchall()
+
+    def touch(self, key):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE entries SET stored_at = ? WHERE key = ?", (time.time(), key))
+
+    def get_json(self, key):
+        entry = self.get(key)
+        return None if entry is None else json.loads(entry[0])
+
+    def set_json(self, key, value, metadata=None):
+        self.set(key, json.dumps(value).encode("utf-8"), metadata)
@@ -0,0 +1,71 @@
+import logging
+import os
+from scraper.models import ScrapeCheckpoint
+from .cache_store import cache_key
+
+logger = logging.getLogger('scraping')
+
+
+class ScrapeCheckpointer:
+    """
+    Records a scraper's progress through an ordered list of items in a ScrapeCheckpoint.
+
+    The scraper appends each item's rows to its output files in input order and calls
+    advance() once they are written. When resuming, every output file is truncated back to
+    its size at the last checkpoint, which drops rows from items that were cut short, so the
+    resumed run appends exactly what a clean run would have.
+    """
+
+    def __init__(self, source, file_paths, resume=False):
+        self.source = source
+        self.file_paths = list(file_paths)
+        self.resume = resume
+        self.checkpoint = None
+
+    def start(self, item_keys):
+        """
+        Return the number of items already written, truncating the output files to match, or 0
+        if the run starts over. The caller must (re)create the output files when this is 0.
+        """
+        fingerprint = cache_key(*item_keys)
+        checkpoint = ScrapeCheckpoint.objects.filter(source=self.source).first()
+        if self.resume and checkpoint is not None and self.can_resume(checkpoint, fingerprint):
+            for path, size in checkpoint.file_sizes.items():
+                with open(path, "r+b") as file:
+                    file.truncate(size)
+            self.checkpoint = checkpoint
+            logger.info(
+                f"Resuming {self.source} after {checkpoint.position} of {len(item_keys)} items "
+                f"(last: {checkpoint.last_item})."
+            )
+            return checkpoint.position
+
+        if self.resume:
+            logger.info(f"No usable checkpoint for {self.source}; starting over.")
+        self.checkpoint, _ = ScrapeCheckpoint.objects.update_or_create(
+            source=self.source,
+            defaults={"fingerprint": fingerprint, "position": 0, "last_item": "", "file_sizes": {}, "completed": False},
+        )
+        return 0
+
+    def can_resume(self, checkpoint, fingerprint):
+        # The input must be the same, and the files at least as long as when they were recorded
+        if checkpoint.fingerprint != fingerprint or checkpoint.position == 0:
+            return False
+        return set(checkpoint.file_sizes) == set(self.file_paths) and all(
+            os.path.exists(path) and os.path.getsize(path) >= size for path, size in checkpoint.file_sizes.items()
+        )
+
+    def advance(self, position, last_item):
+        """
+        Record that the first `position` items are written. Buffered output must be flushed
+        first.
+        """
+        self.checkpoint.position = position
+        self.checkpoint.last_item = str(last_item)[:255]
+        self.checkpoint.file_sizes = {path: os.path.getsize(path) for path in self.file_paths}
+        self.checkpoint.save(update_fields=["position", "last_item", "file_sizes", "updated_at"])
+
+    def finish(self):
+        self.checkpoint.completed = True
+        self.checkpoint.save(update_fields=["completed", "updated_at"])
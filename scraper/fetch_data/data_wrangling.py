@@ -1,8 +1,103 @@
 import csv
+import json
 import os
 import re
 import pandas as pd
+from openpyxl import load_workbook
 from selenium import webdriver
+from .cache_store import cache_key
+from .parse_cache import get_parse_cache
+
+try:
+    import pyarrow  # Parquet support for the cleaned price file
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Root of the files passed between the scrape stages. The Celery pipeline runs its stages on
+# any worker, so SCRAPER_DATA_DIR must then point at storage every worker mounts at that path.
+DATA_DIR = os.getenv("SCRAPER_DATA_DIR") or "scraper/fetch_data"
+CLEANED_DATA_DIR = os.path.join(DATA_DIR, "cleaned_data")
+RECORDS_DIR = os.path.join(DATA_DIR, "records")
+CLEANED_DATA_NAME = "cleaned_vaFssPharmPrices"
+EXCEL_CHUNK_SIZE = 20000  # Workbook rows cleaned at a time
+
+
+def cleaned_data_path():
+    """
+    Path of the cleaned FSS price file: Parquet when pyarrow is installed, CSV otherwise.
+    """
+    extension = "parquet" if pyarrow is not None else "csv"
+    return os.path.join(CLEANED_DATA_DIR, f"{CLEANED_DATA_NAME}.{extension}")
+
+
+class CleanedDataWriter:
+    """
+    Writes the cleaned FSS price file one chunk at a time, so only the chunk being written is
+    held in memory. Parquet chunks go through a single ParquetWriter whose schema is taken
+    from the first chunk; without pyarrow the chunks are appended to a CSV file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or cleaned_data_path()
+        self.parquet_writer = None
+        self.schema = None
+        self.rows_written = 0
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def chunk_schema(self, df):
+        # Text columns are written as strings and integer columns as floats, so later chunks
+        # with mixed values or missing numbers still fit the schema
+        fields = []
+        for field in pyarrow.Schema.from_pandas(df, preserve_index=False):
+            if pyarrow.types.is_integer(field.type):
+                field = field.with_type(pyarrow.float64())
+            elif (
+                pyarrow.types.is_null(field.type) or pyarrow.types.is_large_string(field.type)
+                or df[field.name].dtype == object
+            ):
+                field = field.with_type(pyarrow.string())
+            fields.append(field)
+        return pyarrow.schema(fields)
+
+    def write(self, df):
+        if pyarrow is None:
+            df.to_csv(self.path, mode="a" if self.rows_written else "w", header=not self.rows_written, index=False)
+            self.rows_written += len(df)
+            return
+
+        if self.parquet_writer is None:
+            self.schema = self.chunk_schema(df)
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        df = df.copy()
+        for field in self.schema:
+            if pyarrow.types.is_string(field.type):
+                values = df[field.name]
+                df[field.name] = values.where(values.isna(), values.astype(str)).astype(object)
+        self.parquet_writer.write_table(pyarrow.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self.rows_written += len(df)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+
+def read_cleaned_data(columns=None):
+    """
+    Read the cleaned FSS price file written by DataWrangling.prepare_data. The Parquet file is
+    memory-mapped and only the requested columns are read.
+    """
+    path = cleaned_data_path()
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    return pd.read_csv(path, usecols=columns)
 
 
 class DataWrangling:
@@ -16,8 +111,8 @@ class DataWrangling:
         self.driver = None
         self.link = ""
 
-        self.output_dir_clean = "scraper/fetch_data/cleaned_data"
-        self.output_dir_missing = "scraper/fetch_data/missing_data"
+        self.output_dir_clean = CLEANED_DATA_DIR
+        self.output_dir_missing = os.path.join(DATA_DIR, "missing_data")
 
         self.route_keywords = [
             "ORAL",
@@ -411,7 +506,23 @@ class DataWrangling:
             "ORAL 45ML": "ORAL (45ML)",
         }
 
+        self.parse_cache = get_parse_cache(self.parser_namespace())
+
+    def parser_namespace(self):
+        """
+        Parse cache namespace; it changes whenever the keyword tables the parser uses change.
+        """
+        keywords = [self.dosage_form_keywords, self.route_keywords, self.strength_keywords]
+        return cache_key("generic_parser_v1", json.dumps(keywords))
+
     def extract_values_from_generic_column(self, generic_str):
+        """
+        (dosage_form, strength, route, ingredient) for a generic string, served from the shared
+        parse cache when the string has been parsed before.
+        """
+        return self.parse_cache.get_or_parse(generic_str, self.parse_generic_value)
+
+    def parse_generic_value(self, generic_str):
         
         
         # if generic_str == 'AMLODIPINE BESYLATE 2.5MG TAB':
@@ -490,60 +601,202 @@ class DataWrangling:
 
         return dosage_form, strength, route, ingredient
 
-    def drop_rows_with_missing_values(self, df, columns_to_check, output_filename):
-
-        missing_values_df = df[df[columns_to_check].isnull().any(axis=1)]
-        df = df.dropna(subset=columns_to_check)
-        missing_values_df.to_csv(output_filename, index=False)
+    def first_keyword_regex(self, keywords):
+        """
+        Regex capturing the first keyword, in list order, contained in a token. The branches are
+        all anchored at the start of the token, so the alternation is tried in list order just
+        like the keyword loops in extract_values_from_generic_column.
+        """
+        branches = "|".join(f"(?=.*?({re.escape(keyword)}))" for keyword in keywords)
+        return re.compile(f"^(?:{branches})", re.DOTALL)
+
+    def first_keyword(self, tokens, regex):
+        return tokens.str.extract(regex).bfill(axis=1).iloc[:, 0]
+
+    def parse_tokens(self, tokens):
+        """
+        Per-token values used by parse_generic_column, computed once for each distinct token.
+        """
+        unit_regex = "|".join(re.escape(unit) for unit in self.strength_keywords)
+        segments = tokens.str.split(",")
+        first_segment, second_segment, third_segment = (
+            segments.str[index].astype(object).fillna("") for index in range(3)
+        )
+        has_comma = tokens.str.contains(",", regex=False)
 
-        return df
+        dosage_keyword = self.first_keyword(tokens, self.first_keyword_regex(self.dosage_form_keywords))
+        dosage_in_first = pd.Series(
+            [isinstance(keyword, str) and keyword in segment for keyword, segment in zip(dosage_keyword, first_segment)],
+            index=tokens.index,
+        )
+        dosage_value = tokens.where(~has_comma, first_segment.where(dosage_in_first, second_segment))
 
-    def clean_and_save_data(self, df):
+        route_keyword = self.first_keyword(tokens, self.first_keyword_regex(self.route_keywords))
+        route_in_second = pd.Series(
+            [isinstance(keyword, str) and keyword in segment for keyword, segment in zip(route_keyword, second_segment)],
+            index=tokens.index,
+        )
+        third_has_unit = third_segment.str.contains(unit_regex)
+        comma_route = first_segment.where(
+            ~route_in_second,
+            (second_segment + " " + third_segment).where(third_has_unit, second_segment),
+        )
+        route_value = comma_route.where(has_comma, tokens.where(route_keyword == tokens, ""))
+
+        return pd.DataFrame(
+            {
+                "dosage_keyword": dosage_keyword.notna(),
+                "dosage_value": dosage_value,
+                "route_keyword": route_keyword.notna(),
+                "route_value": route_value,
+                "has_unit": tokens.str.contains(unit_regex),
+                "has_digit": tokens.map(lambda token: any(char.isdigit() for char in token)),
+            }
+        ).set_index(tokens)
+
+    def parse_generic_column(self, generic_series, use_cache=True):
+        """
+        Vectorized extract_values_from_generic_column: returns a DataFrame with DosageForm,
+        Strength, Route and Ingredient columns (None where nothing is found) on the index of
+        generic_series. Only distinct strings missing from the parse cache are parsed.
+        """
+        # Price files repeat the same generic string for many NDCs, so only distinct ones are parsed
+        codes, uniques = pd.factorize(generic_series.astype(str))
+        parsed = [self.parse_cache.get(value) if use_cache else None for value in uniques]
+        missing = [index for index, values in enumerate(parsed) if values is None]
+        if missing:
+            missing_parsed = self.parse_distinct_generics(pd.Series(uniques[missing], dtype=object))
+            missing_values = list(missing_parsed.itertuples(index=False, name=None))
+            for index, values in zip(missing, missing_values):
+                parsed[index] = values
+            if use_cache:
+                self.parse_cache.update(zip(uniques[missing], missing_values))
+                self.parse_cache.save()
+
+        result = pd.DataFrame(parsed, columns=["DosageForm", "Strength", "Route", "Ingredient"], dtype=object)
+        result = result.take(codes)
+        result.index = generic_series.index
+        return result
+
+    def parse_distinct_generics(self, generic):
+        """
+        Parse a Series of distinct generic strings. Distinct tokens are matched once with compiled
+        regexes and the per-row rules (last matching token, first strength not in the ingredient)
+        are applied with pandas operations, so the result matches parse_generic_value exactly.
+        """
+        rows = len(generic)
+
+        ingredient = generic.str.extract(r"^(\D*)", expand=False).str.strip().str.rstrip("-#")
+        ingredient = ingredient.where(
+            ~ingredient.str.contains(",", regex=False), ingredient.str.split(",").str[0].str.strip()
+        )
 
-        print("Perfroming data cleaning and saving data...")
+        tokens = generic.str.split(" ").explode()
 
-        # Drop duplicates and save to a separate file
-        df_deduplicated = df.drop_duplicates(subset="NDCWithDashes")
-        os.makedirs(self.output_dir_missing, exist_ok=True)
-        output_path = os.path.join(self.output_dir_missing, "NDC_duplicated_data.csv")
-        df_deduplicated.to_csv(output_path, index=False)
+        frame = self.parse_tokens(pd.Series(tokens.unique())).reindex(tokens.values)
+        frame.index = tokens.index
+        frame["token"] = tokens
+        frame["position"] = tokens.groupby(level=0).cumcount()
+        frame["previous"] = tokens.shift(1)
 
-        # Extract values from the "Generic" column and perform other operations
-        df["DosageForm"], df["Strength"], df["Route"], df["Ingredient"] = zip(
-            *df["Generic"].apply(self.extract_values_from_generic_column)
-        )
+        def last_match(column, value_column):
+            matched = frame.loc[frame[column].values, value_column]
+            return matched[~matched.index.duplicated(keep="last")]
 
-        df["VendorName"] = df["VendorName"].str.replace(",", "")
+        dosage_form = last_match("dosage_keyword", "dosage_value")
+        route = last_match("route_keyword", "route_value")
 
-        # Drop rows with missing values
-        os.makedirs(self.output_dir_missing, exist_ok=True)
-        output_path_missing_values = os.path.join(
-            self.output_dir_missing, "missing_values(strength and DosageForm).csv"
-        )
-        df_cleaned = self.drop_rows_with_missing_values(
-            df, ["Strength", "DosageForm"], output_path_missing_values
+        # Strength is the first unit token not already part of the ingredient (prefixed with the
+        # previous token when it has no digit), otherwise the last unit token
+        units = frame[frame["has_unit"].values]
+        ingredients = ingredient.to_numpy()
+        in_ingredient = [
+            token in ingredients[row] for row, token in zip(units.index.to_numpy(), units["token"].to_numpy())
+        ]
+        candidates = units.loc[[not found for found in in_ingredient]]
+        candidates = candidates[~candidates.index.duplicated(keep="first")]
+        candidate_strength = candidates["token"].where(
+            candidates["has_digit"] | (candidates["position"] == 0),
+            candidates["previous"] + " " + candidates["token"],
         )
-        df_cleaned['DosageForm'] = df['DosageForm'].map(self.dosage_form_mapping)
-        df_cleaned['Route'] = df_cleaned['Route'].map(self.route_mapping)
-    
-        # Save the cleaned data to a file
-        os.makedirs(self.output_dir_clean, exist_ok=True)
-        output_path_cleaned_data = os.path.join(
-            self.output_dir_clean, "cleaned_vaFssPharmPrices.csv"
+        strength = candidate_strength.combine_first(units.loc[~units.index.duplicated(keep="last"), "token"])
+
+        result = pd.DataFrame(
+            {
+                "DosageForm": dosage_form.reindex(range(rows)),
+                "Strength": strength.reindex(range(rows)),
+                "Route": route.reindex(range(rows)),
+                "Ingredient": ingredient,
+            }
+        ).astype(object)
+        return result.where(result.notna(), None)
+
+    def clean_chunk(self, df):
+        """
+        Parse the "Generic" column of a chunk of workbook rows and split it into cleaned rows and
+        rows missing a strength or dosage form.
+        """
+        df[["DosageForm", "Strength", "Route", "Ingredient"]] = self.parse_generic_column(df["Generic"])
+        df["VendorName"] = df["VendorName"].map(
+            lambda vendor: vendor.replace(",", "") if isinstance(vendor, str) else vendor
         )
-        df_cleaned.to_csv(output_path_cleaned_data, index=False)
 
-    def read_excel_file(self, file_path):
-        print("Reading Excel File ...")
-        df = pd.read_excel(file_path)
-        return df
+        missing = df[["Strength", "DosageForm"]].isnull().any(axis=1)
+        df_cleaned = df[~missing].copy()
+        df_cleaned["DosageForm"] = df_cleaned["DosageForm"].map(self.dosage_form_mapping)
+        df_cleaned["Route"] = df_cleaned["Route"].map(self.route_mapping)
+        return df_cleaned, df[missing]
+
+    def iter_excel_chunks(self, file_path, chunk_size=EXCEL_CHUNK_SIZE):
+        """
+        Stream the first sheet of a workbook in read-only mode, yielding DataFrames of at most
+        chunk_size rows so the whole workbook is never loaded at once.
+        """
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [
+                str(name) if name is not None else f"Unnamed: {index}" for index, name in enumerate(header)
+            ]
+
+            chunk = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield pd.DataFrame.from_records(chunk, columns=columns)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+        finally:
+            workbook.close()
 
     def prepare_data(self, file_path):
+        print("Reading Excel File and cleaning data ...")
 
-        df = self.read_excel_file(file_path)
-
-        # Reformating the data
-        self.clean_and_save_data(df)
+        # Rows without strength or dosage form are kept for review
+        os.makedirs(self.output_dir_missing, exist_ok=True)
+        output_path_missing_values = os.path.join(
+            self.output_dir_missing, "missing_values(strength and DosageForm).csv"
+        )
+        # Each chunk is cleaned and written before the next one is read
+        chunks = 0
+        with CleanedDataWriter() as writer:
+            for chunk in self.iter_excel_chunks(file_path):
+                df_cleaned, df_missing = self.clean_chunk(chunk)
+                writer.write(df_cleaned)
+                df_missing.to_csv(
+                    output_path_missing_values, mode="a" if chunks else "w", header=not chunks, index=False
+                )
+                chunks += 1
+        if not chunks:
+            raise ValueError(f"No rows found in {file_path}")
+
+        self.parse_cache.save()
 
 
 # if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import os
-import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+from .data_wrangling import RECORDS_DIR
+from .http_client import get_fetch_client
 
 class AsphDrugShortageScraper:
     def __init__(self,scraping_logger):
@@ -10,17 +11,16 @@ class AsphDrugShortageScraper:
         self.headers = {
             'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
         }
-        self.output_dir = "scraper/fetch_data/records/drug_shortage"
+        self.output_dir = os.path.join(RECORDS_DIR, "drug_shortage")
+        self.http_client = get_fetch_client()
         os.makedirs(self.output_dir, exist_ok=True)
     
     def scrape_data(self):
-        try:
-            response = requests.get(self.url, headers=self.headers)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            return response.content
-        except requests.exceptions.RequestException as e:
-            print("An error occurred while making the request:", str(e))
+        response = self.http_client.get(self.url, headers=self.headers)
+        if response is None or response.is_error:
+            print("An error occurred while making the request:", getattr(response, "status_code", None))
             return None
+        return response.content
     
     def parse_html(self, content):
         if content:
@@ -3,33 +3,41 @@ import json
 import os
 import re
 import time
-import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import openai
 from openai import Client, Completion
 from dotenv import load_dotenv
+from .checkpoint import ScrapeCheckpointer
+from .data_wrangling import RECORDS_DIR, read_cleaned_data
+from .http_client import get_fetch_client
+from .llm_cache import LLMExtractionCache
+from .manufacturer_parser import ManufacturerParser
+from .shards import shard_bounds, shard_name, shard_path
 
 class FetchDailyMed:
-    def __init__(self,scraping_logger):
+    def __init__(self,scraping_logger, resume=False, shard=None):
         self.logger = scraping_logger
+        self.resume = resume
+        self.shard = shard  # (index, total) to scrape one slice of the NDCs into its own files
         
-        self.cleaned_data_dir = "scraper/fetch_data/cleaned_data/cleaned_vaFssPharmPrices.csv"
-        self.df = pd.read_csv(self.cleaned_data_dir)
+        self.df = read_cleaned_data(columns=["NDCWithDashes", "Generic"])
         self.particular_column_values = self.df["NDCWithDashes"]
         self.generic_names = self.df["Generic"]
         
         self.base_url = "https://dailymed.nlm.nih.gov/dailymed/search.cfm?labeltype=all&query={}&pagesize=20&page=1"
-        self.output_dir = "scraper/fetch_data/records/daily_med"
+        self.output_dir = os.path.join(RECORDS_DIR, "daily_med")
+        self.packager_file_path = shard_path(os.path.join(self.output_dir, "packager_data_daily_med.csv"), shard)
+        self.drug_file_path = shard_path(os.path.join(self.output_dir, "drug_data_daily_med.csv"), shard)
+        self.http_client = get_fetch_client()
+        self.batch_size = 50  # NDC pages fetched concurrently per batch
+        self.llm_cache = LLMExtractionCache("daily_med_manufacturers_v1")
+        self.manufacturer_parser = ManufacturerParser()
         os.makedirs(self.output_dir, exist_ok=True)  # Ensure the output directory is created here
-        self.init_csv_files()
         load_dotenv()
 
     def init_csv_files(self):
         # Initialize CSV files and write headers if not already present
-        self.packager_file_path = os.path.join(self.output_dir, "packager_data_daily_med.csv")
-        self.drug_file_path = os.path.join(self.output_dir, "drug_data_daily_med.csv")
-
         # Make sure the directory exists before creating files
         os.makedirs(self.output_dir, exist_ok=True)
     
@@ -54,39 +62,17 @@ class FetchDailyMed:
                 writer.writeheader()
             
 
-    def write_to_csv(self, data, filename):
-        path = os.path.join(self.output_dir, filename)
+    def write_to_csv(self, data, path):
         with open(path, 'a', newline='') as file:
             writer = csv.DictWriter(file, fieldnames=data.keys())
             writer.writerow(data)
 
     def fetch_daily_med(self, url):
-        max_retries = 20  
-        attempts = 0  
-        while attempts < max_retries:
-            try:
-                response = requests.get(url)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    return soup
-                else:
-                    print(f"Failed to fetch data from the URL: {url}. Status Code: {response.status_code}")
-                    attempts += 1
-                    if attempts < max_retries:
-                        print(f"Attempt {attempts} failed, retrying in 5 seconds...")
-                        time.sleep(10)  # Wait for 5 seconds before retrying
-                    else:
-                        print("Maximum retries reached. Aborting.")
-                        return None
-            except requests.exceptions.RequestException as e:
-                print("An error occurred during the request:", e)
-                attempts += 1
-                if attempts < max_retries:
-                    print(f"Attempt {attempts} failed due to a request exception, retrying in 5 seconds...")
-                    time.sleep(10)  # Wait for 5 seconds before retrying
-                else:
-                    print("Maximum retries reached after request exception. Aborting.")
-                    return None
+        response = self.http_client.get(url)
+        if response is not None and response.status_code == 200:
+            return BeautifulSoup(response.text, "html.parser")
+        print(f"Failed to fetch data from the URL: {url}. Status Code: {getattr(response, 'status_code', None)}")
+        return None
 
     def get_desire_element(self, soup):
 
@@ -210,7 +196,7 @@ class FetchDailyMed:
             "NDC Code": ndc_code,
             "Packager": manufacturer_name,
         }
-        self.write_to_csv(data,'packager_data_daily_med.csv')
+        self.write_to_csv(data, self.packager_file_path)
         #self.packager_data_list.append(data)
 
     def get_and_save_drug_data(self, soup, ndc_code):
@@ -236,12 +222,24 @@ class FetchDailyMed:
         if desire_element is not None:
             text = self.extract_information_from_li(desire_element)
             print(text)
-            prompt = f'I have extracted the following text:\n{text}\n\nNow, From this text find the complete details of Manufactured By, Manufactured for, and Distributed by if one is not found then place an empty string against this. Just provide one JSON like \n\n\n( "Manufactured By": " ", "Manufactured For": " ","Distributed By": " ")'
-            response = self.get_with_gpt(prompt)
-            print(response)
-            extracted_data  = self.extract_from_response_and_save(response, ndc_code)
-            data.update(extracted_data)
-            self.write_to_csv(data,'drug_data_daily_med.csv')
+            # Well-formed labels are parsed locally; the LLM only sees the ones the rules cannot handle
+            extracted_data = self.manufacturer_parser.extract(
+                text,
+                lambda: self.llm_cache.get_or_extract([text], lambda: self.extract_manufacturers_with_gpt(text)),
+            )
+            if extracted_data is not None:
+                data.update(extracted_data)
+                self.write_to_csv(data, self.drug_file_path)
+
+    def extract_manufacturers_with_gpt(self, text):
+        prompt = f'I have extracted the following text:\n{text}\n\nNow, From this text find the complete details of Manufactured By, Manufactured for, and Distributed by if one is not found then place an empty string against this. Just provide one JSON like \n\n\n( "Manufactured By": " ", "Manufactured For": " ","Distributed By": " ")'
+        response = self.get_with_gpt(prompt)
+        print(response)
+        if response is None:
+            return None
+        extracted_data = self.extract_from_response_and_save(response, None)
+        extracted_data.pop("NDC Code")
+        return extracted_data
 
     def save_packager_data(self):
 
@@ -260,20 +258,46 @@ class FetchDailyMed:
     def get_data_from_daily_mad(self):
 
         self.logger.info("Start fecthing data from daily mad...")
-        for value, generic_name in zip(
-            self.particular_column_values, self.generic_names
-        ):
-            url = self.base_url.format(value)
-            soup = self.fetch_daily_med(url)
+        start, end = shard_bounds(len(self.df), self.shard)
+        ndc_rows = list(zip(self.particular_column_values.iloc[start:end], self.generic_names.iloc[start:end]))
+        checkpoint = ScrapeCheckpointer(
+            shard_name("daily_med", self.shard), [self.packager_file_path, self.drug_file_path], resume=self.resume
+        )
+        done = checkpoint.start([value for value, _ in ndc_rows])
+        if not done:
+            self.init_csv_files()
+        batches = [ndc_rows[start:start + self.batch_size] for start in range(done, len(ndc_rows), self.batch_size)]
+
+        # Search pages for a batch are fetched concurrently while the previous batch is parsed
+        pending = None
+        for index, batch in enumerate(batches):
+            if pending is None:
+                pending = self.http_client.submit_many("GET", [self.base_url.format(value) for value, _ in batch])
+            responses = pending.result()
+            pending = None
+            if index + 1 < len(batches):
+                pending = self.http_client.submit_many(
+                    "GET", [self.base_url.format(value) for value, _ in batches[index + 1]]
+                )
 
-            
-            #Saving packager info
-            self.get_and_save_packager_data(soup, value, generic_name)
+            for (value, generic_name), response in zip(batch, responses):
+                if response is None or response.status_code != 200:
+                    self.logger.warning(f"Failed to fetch DailyMed page for NDC {value}.")
+                    continue
+                soup = BeautifulSoup(response.text, "html.parser")
 
-            # save drug info
-            self.get_and_save_drug_data(soup, value)
-            
-            
+                #Saving packager info
+                self.get_and_save_packager_data(soup, value, generic_name)
+
+                # save drug info
+                self.get_and_save_drug_data(soup, value)
+
+            done += len(batch)
+            checkpoint.advance(done, batch[-1][0])
+        checkpoint.finish()
+
+        self.manufacturer_parser.log_stats(self.logger)
+        self.llm_cache.log_stats(self.logger)
 
         # self.save_packager_data()
         # self.save_drug_data()
@@ -1,20 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import os
 import re
-import time
-import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+from .checkpoint import ScrapeCheckpointer
+from .data_wrangling import RECORDS_DIR, read_cleaned_data
+from .http_client import get_fetch_client, host_limit
+from .shards import shard_bounds, shard_name, shard_path
+
+
+def plan_search_terms(ingredients):
+    """
+    Collapse ingredients onto the Orange Book search terms they use: their first word, then
+    their first two words if the first finds nothing. Returns the distinct first terms and the
+    distinct fallback terms, each in first-seen order.
+    """
+    split_ingredients = [ingredient.split() for ingredient in ingredients]
+    first_terms = list(dict.fromkeys(words[0] for words in split_ingredients if words))
+    fallback_terms = list(dict.fromkeys('+'.join(words[:2]) for words in split_ingredients if len(words) > 1))
+    return first_terms, fallback_terms
 
 
 class FetchOrangeBook:
-    def __init__(self,scraping_logger):
+    def __init__(self,scraping_logger, resume=False, shard=None):
         self.logger = scraping_logger
+        self.resume = resume
+        self.shard = shard  # (index, total) to scrape one slice of the ingredients into its own file
         self.headers = {"content-type": "application/x-www-form-urlencoded"}
-        self.cleaned_data_dir = "scraper/fetch_data/cleaned_data/cleaned_vaFssPharmPrices.csv"
         self.url = "https://www.accessdata.fda.gov/scripts/cder/ob/search_product.cfm"
-        self.output_dir = "scraper/fetch_data/records/orange_book"
-        self.output_file = os.path.join(self.output_dir, "orange_book_records.csv")
+        self.output_dir = os.path.join(RECORDS_DIR, "orange_book")
+        self.output_file = shard_path(os.path.join(self.output_dir, "orange_book_records.csv"), shard)
         self.selected_columns = [
             "Ingredient",
             "Active Ingredient",
@@ -28,8 +44,10 @@ class FetchOrangeBook:
         ]
         self.cached_dataframes = {}
         self.existing_records = set()
+        self.http_client = get_fetch_client()
+        self.search_results = {}
+        self.max_workers = host_limit(self.url, shard)  # The accessdata.fda.gov host limit, or this shard's share
         os.makedirs(self.output_dir, exist_ok=True)
-        self.initialize_csv_file()
 
     def initialize_csv_file(self):
         
@@ -43,52 +61,69 @@ class FetchOrangeBook:
                 writer = csv.DictWriter(file, fieldnames=self.selected_columns)
                 writer.writeheader()
 
+    def search_orange_book(self, drugname):
+        payload = f"drugname={drugname}&discontinued=RX%2COTC%2CDISCN"
+        response = self.http_client.post(self.url, content=payload, headers=self.headers)
+        if response is None or response.is_error:
+            print(f"Error fetching data from orange book for {drugname}: {getattr(response, 'status_code', None)}")
+            return None
+        return BeautifulSoup(response.content, "html.parser").find("table")
+
+    def search_term(self, term):
+        """
+        Orange Book results for a search term, or None if the search found no table. Each term is
+        requested once per run and shared by every ingredient that searches on it.
+        """
+        if term not in self.search_results:
+            table = self.search_orange_book(term)
+            self.search_results[term] = self.parse_table_to_dataframe(table) if table else None
+        return self.search_results[term]
+
+    def fetch_search_terms(self, terms):
+        """
+        Search each term ahead of the ingredients that need it. A term whose search fails is
+        logged and left out of search_results, so the ingredient searching it retries it and
+        fails the way it would without the prefetch.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="orange-book") as executor:
+            futures = {term: executor.submit(self.search_term, term) for term in terms}
+        for term, future in futures.items():
+            if future.exception() is not None:
+                self.logger.error(f"Error prefetching Orange Book search for {term}: {future.exception()}")
+
+    def prefetch_ingredients(self, ingredients):
+        """
+        Fetch every search term fetch_data_from_orange_book will need for these ingredients,
+        each distinct term once, and return the number of searches made.
+
+        Ingredients are collapsed onto their first word, so ingredients sharing it cost one
+        search. The two-word term is only searched for ingredients whose first word found no
+        table, as in fetch_data_from_orange_book.
+        """
+        first_terms, fallback_terms = plan_search_terms(ingredients)
+        self.fetch_search_terms(first_terms)
+        fallback_terms = [term for term in fallback_terms if self.search_results.get(term.split("+")[0]) is None]
+        self.fetch_search_terms(fallback_terms)
+        return len(first_terms) + len(fallback_terms)
+
     def fetch_data_from_orange_book(self, ingredient):
-        max_retries = 20  
-        attempts = 0  
-        
-        while attempts < max_retries:
-            try:
-                ingredients = ingredient.split()  # Splitting the ingredient by whitespace
-                
-                # Use the first element of the ingredient for initial search
-                first_term_payload = f"drugname={ingredients[0]}&discontinued=RX%2COTC%2CDISCN"
-                first_term_response = requests.post(url=self.url, data=first_term_payload, headers=self.headers)
-                first_term_response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
-                first_term_soup = BeautifulSoup(first_term_response.content, "html.parser")
-                first_term_table = first_term_soup.find("table")
-                
-                if first_term_table:
-                    # If data found for the first term, create DataFrame and return
-                    return self.parse_table_to_dataframe(first_term_table)
-                elif len(ingredients) > 1:
-                    # If no data found for the first term and there are more terms, try with a combined search of the first and second terms
-                    combined_term_payload = f"drugname={'+'.join(ingredients[:2])}&discontinued=RX%2COTC%2CDISCN"
-                    combined_term_response = requests.post(url=self.url, data=combined_term_payload, headers=self.headers)
-                    combined_term_response.raise_for_status()
-                    combined_term_soup = BeautifulSoup(combined_term_response.content, "html.parser")
-                    combined_term_table = combined_term_soup.find("table")
-                    
-                    if combined_term_table:
-                        # If data found for the combined term, create DataFrame and return
-                        return self.parse_table_to_dataframe(combined_term_table)
-                    else:
-                        print("No data found for any search term.")
-                        return pd.DataFrame()
-                else:
-                    print("No data found for any search term.")
-                    return pd.DataFrame()
-            
-            except requests.RequestException as e:
-                print("Error fetching data from orange book:", e)
-                attempts += 1  # Increment the attempt counter
-                if attempts < max_retries:
-                    print(f"Attempt {attempts} failed, retrying in 5 seconds...")
-                    time.sleep(10)  # Wait for 5 seconds before retrying
-                else:
-                    print("Maximum retries reached. Aborting.")
-                    return pd.DataFrame()  # Return an empty DataFrame after exceeding retry limit
-    
+        ingredients = ingredient.split()  # Splitting the ingredient by whitespace
+
+        # Use the first element of the ingredient for initial search
+        first_term_results = self.search_term(ingredients[0])
+        if first_term_results is not None:
+            # If data found for the first term, return it
+            return first_term_results
+
+        if len(ingredients) > 1:
+            # If no data found for the first term and there are more terms, try with a combined search of the first and second terms
+            combined_term_results = self.search_term('+'.join(ingredients[:2]))
+            if combined_term_results is not None:
+                return combined_term_results
+
+        print("No data found for any search term.")
+        return pd.DataFrame()
+
     def parse_table_to_dataframe(self, table):
         table_data = []
         rows = table.find_all("tr")
@@ -101,80 +136,132 @@ class FetchOrangeBook:
             table_data.append(row_data)
         return pd.DataFrame(table_data[1:], columns=table_data[0])
 
+    def index_results(self, df_results):
+        """
+        Add the normalized keys records are matched on: the applicant upper-cased without commas,
+        and the upper-cased dosage form and strength, plus each row's position in the result.
+        """
+        applicant = df_results["Applicant Holder"].str.upper()
+        applicant_key = applicant.str.replace(",", "", regex=False)
+        return df_results.assign(
+            _position=range(len(df_results)),
+            _applicant=applicant_key,
+            # A case-insensitive str.contains of the key on the raw applicant, which fails when
+            # the applicant had commas; a row missing its applicant matches nothing
+            _applicant_contains_key=[
+                isinstance(value, str) and key in value for key, value in zip(applicant_key, applicant)
+            ],
+            _dosage=df_results["Dosage Form"].str.upper(),
+            _strength=df_results["Strength"].str.upper(),
+        )
+
+    def index_records(self, group):
+        """
+        The same keys for the FSS records of one ingredient, with missing values as ''.
+        """
+        def key(column):
+            return [str(value).upper() if pd.notna(value) else "" for value in group[column]]
+
+        return pd.DataFrame({
+            "_order": range(len(group)),
+            "_vendor": [vendor.replace(",", "") for vendor in key("VendorName")],
+            "_record_dosage": key("DosageForm"),
+            "_strength": key("Strength"),
+        })
+
+    def match_results(self, records, results):
+        """
+        Return the Orange Book rows to record for an ingredient, ordered by record and then by
+        result row.
+
+        A record whose vendor is the only applicant in the result keeps the rows with its
+        strength and dosage form. Any other record keeps every row from the other applicants;
+        records sharing a vendor keep the same rows, so only the first of them is joined.
+        """
+        applicants = results["_applicant"].unique()
+        sole_applicant = applicants[0] if len(applicants) == 1 else None
+
+        other_vendors = records[records["_vendor"] != sole_applicant].drop_duplicates("_vendor")
+        unmatched = other_vendors[["_order", "_vendor"]].merge(results[["_position", "_applicant"]], how="cross")
+        unmatched = unmatched[unmatched["_vendor"] != unmatched["_applicant"]]
+
+        matched = records[records["_vendor"] == sole_applicant].merge(
+            results[["_position", "_applicant", "_applicant_contains_key", "_dosage", "_strength"]],
+            left_on=["_vendor", "_strength"],
+            right_on=["_applicant", "_strength"],
+        )
+        dosage_matches = pd.Series(
+            [
+                isinstance(result_dosage, str) and dosage in result_dosage
+                for dosage, result_dosage in zip(matched["_record_dosage"], matched["_dosage"])
+            ],
+            index=matched.index,
+            dtype=bool,
+        )
+        matched = matched[matched["_applicant_contains_key"] & dosage_matches]
+
+        pairs = pd.concat([unmatched[["_order", "_position"]], matched[["_order", "_position"]]])
+        return results.iloc[pairs.sort_values(["_order", "_position"])["_position"]]
+
+    def process_ingredient(self, ingredient, group):
+        self.logger.info(f"Processing ingredient: {ingredient}")
+        print(f"Processing ingredient: {ingredient}")
+        num_rows = len(group)
+        print(f"Ingredient: {ingredient} has {num_rows} rows.")
+        # Fetch data from the Orange Book for the current ingredient
+        df_results = self.fetch_data_from_orange_book(ingredient)
+        if df_results.empty:
+            self.logger.info(f"No data fetched for ingredient: {ingredient}")
+            print(f"No data fetched for ingredient: {ingredient}")
+            return
+        # Clean and process the scraped data
+        df_results = df_results[df_results['Active Ingredient'].apply(
+            lambda x: isinstance(x, str) and x.split()[:1] == ingredient.split()[:1]
+        )]
+        df_results = df_results.assign(Ingredient=ingredient)
+        matched_rows = self.match_results(self.index_records(group), self.index_results(df_results))
+        if matched_rows.empty:
+            self.logger.info(f"No matching data found for ingredient: {ingredient}")
+            print(f"No matching data found for ingredient: {ingredient}")
+            return
+        self.append_to_csv(matched_rows[self.selected_columns])
+
     def process_csv_file(self):
         self.logger.info("Start fetching data from orange book...")
-        unmatched_records = []  # List to store records where no match is found
-        # Initialize existing_records if not already done
-        if not hasattr(self, 'existing_records'):
-            self.existing_records = set()
         try:
-            df = pd.read_csv(self.cleaned_data_dir)
+            df = read_cleaned_data()
             if all(col in df.columns for col in ['Ingredient', 'VendorName', 'Route', 'Strength', 'DosageForm']):
                 grouped = df.groupby('Ingredient')
-                for ingredient, group in grouped:
-                    self.logger.info(f"Processing ingredient: {ingredient}")
-                    print(f"Processing ingredient: {ingredient}")
-                    num_rows = len(group)
-                    print(f"Ingredient: {ingredient} has {num_rows} rows.")
-                    # Fetch data from the Orange Book for the current ingredient
-                    df_results = self.fetch_data_from_orange_book(ingredient)
-                    if df_results.empty:
-                        self.logger.info(f"No data fetched for ingredient: {ingredient}")
-                        print(f"No data fetched for ingredient: {ingredient}")
-                        continue
-                    # Clean and process the scraped data
-                    df_results = df_results[df_results['Active Ingredient'].apply(lambda x: x.split()[0] == ingredient.split()[0])]
-                    df_results = df_results.assign(Ingredient=ingredient)
-                    # Convert group DataFrame to a list of dictionaries for easier handling
-                    group_records = group.to_dict(orient='records')
-                    for record in group_records:
-                        vendor_name = str(record['VendorName']) if pd.notna(record['VendorName']) else ''
-                        route = str(record['Route']) if pd.notna(record['Route']) else ''
-                        strength = str(record['Strength']) if pd.notna(record['Strength']) else ''
-                        dosage_form = str(record['DosageForm']) if pd.notna(record['DosageForm']) else ''
-                        # Initialize a list to collect unmatched rows for the current record
-                        unmatched_rows = []
-                        # Iterate through each row in df_results
-                        for _, row in df_results.iterrows():
-                            applicant_holder = row['Applicant Holder'].upper().replace(',', '')
-                            # Compare the standardized 'Applicant Holder' with the standardized 'VendorName'
-                            if applicant_holder != vendor_name.upper().replace(',', ''):
-                                # Add the row to the unmatched_rows list if there's no match
-                                unmatched_rows.append(row)
-                         # Convert the list of unmatched rows for the current record to a DataFrame
-                        unmatched_rows_df = pd.DataFrame(unmatched_rows, columns=df_results.columns)
-                        # Print the first record in the 'Applicant Holder' column from the unmatched rows
-                        if not unmatched_rows_df.empty:
-                            # print("Unmatched Applicant Holder:", unmatched_rows_df['Applicant Holder'].iloc[1])
-                            # Save unmatched rows to a CSV file for testing purposes
-                            self.append_to_csv(unmatched_rows_df)
-                        else:
-                            print("No unmatched rows found for vendor:", vendor_name)
-                        if not unmatched_rows_df.empty:
-                            # Add unmatched record if there is a mismatch
-                            unmatched_records.append(record)
-                        else:
-                            # Filter matching rows if the applicant and vendor name match
-                            matching_rows = df_results[
-                                (df_results['Applicant Holder'].str.contains(vendor_name.upper().replace(',', ''), case=False, na=False, regex=False)) &
-                                (df_results['Dosage Form'].str.contains(dosage_form, case=False, na=False, regex=False)) &
-                                (df_results['Strength'].str.upper() == strength.upper())
-                            ]
-                            if not matching_rows.empty:
-                                combined_results = pd.concat([matching_rows]).drop_duplicates(subset=self.selected_columns)
-                                unique_new_rows = combined_results[~combined_results[self.selected_columns].apply(tuple, axis=1).isin(self.existing_records)]
-                                if not unique_new_rows.empty:
-                                    self.append_to_csv(unique_new_rows[self.selected_columns])
-                                    new_records_tuples = set(unique_new_rows[self.selected_columns].apply(tuple, axis=1))
-                                    self.existing_records.update(new_records_tuples)
-                    self.logger.info(f"No matching data found for ingredient: {ingredient}")
-                    print(f"No matching data found for ingredient: {ingredient}")
+                ingredients = list(grouped.groups)
+                ingredients = ingredients[slice(*shard_bounds(len(ingredients), self.shard))]
+                checkpoint = ScrapeCheckpointer(
+                    shard_name("orange_book", self.shard), [self.output_file], resume=self.resume
+                )
+                done = checkpoint.start(ingredients)
+                if done:
+                    self.load_existing_records()
+                else:
+                    self.initialize_csv_file()
+                searches = self.prefetch_ingredients(ingredients[done:])
+                self.logger.info(f"Made {searches} Orange Book searches for {len(ingredients) - done} ingredients.")
+                for position, ingredient in enumerate(ingredients[done:], done + 1):
+                    self.process_ingredient(ingredient, grouped.get_group(ingredient))
+                    checkpoint.advance(position, ingredient)
+                checkpoint.finish()
             else:
-                self.logger.error("Required columns missing in the CSV file.")
-                print("Required columns missing in the CSV file.")
+                raise ValueError("Required columns missing in the CSV file.")
         except Exception as e:
             self.logger.error(f"Error processing CSV file: {e}")
             print(f"Error processing CSV file: {e}")
+            if self.shard is not None:
+                # The merge needs every shard's file, so let the shard be retried
+                raise
+
+    def load_existing_records(self):
+        # Rows written before a resumed run must not be written again
+        df_existing = pd.read_csv(self.output_file, dtype=str, keep_default_na=False)
+        self.existing_records = set(df_existing[self.selected_columns].itertuples(index=False, name=None))
+
     def append_to_csv(self, df_results):
         # Ensure self.existing_records is a set for efficient lookups
         if not hasattr(self, 'existing_records'):
@@ -1,228 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
 import csv
-import time
 from urllib.parse import unquote
 import os
 import re
-import shutil
 import tempfile
-import uuid
-from docx import Document
-import requests
 from bs4 import BeautifulSoup
 import pandas as pd
-import fitz
-from .data_wrangling import DataWrangling
+from .attachment_cache import AttachmentCache
+from .attachment_parser import AttachmentParserPool
+from .checkpoint import ScrapeCheckpointer
+from .data_wrangling import RECORDS_DIR, read_cleaned_data
+from .http_client import get_fetch_client
+from .shards import shard_bounds, shard_name, shard_path
 
 
 class FetchSamGov:
-    def __init__(self,scraping_logger):
+    def __init__(self,scraping_logger, resume=False, shard=None):
         self.logger = scraping_logger
+        self.resume = resume
+        self.shard = shard  # (index, total) to scrape one slice of the contracts into its own file
         self.headers = {"content-type": "application/x-www-form-urlencoded"}
         self.cached_dataframes = {}
         self.url = "https://sam.gov/api/prod/sgs/v1/search/?random=1711435940961&index=_all&page=0&mode=search&sort=-modifiedDate&size=25&mfe=true&q={}&qMode=ALL"
-        self.cleaned_data_dir = "scraper/fetch_data/cleaned_data/cleaned_vaFssPharmPrices.csv"
         self.payload = {}
         self.headers = {}
 
         self.fetched_data = None
-        self.data_wrangler = DataWrangling()
         
-        self.fetched_data_cache= {}
-        self.output_dir = "scraper/fetch_data/records/sam_gov"
-
-    def get_data_from_file_doc(self, file_name):
-        self.logger.info(f"Extracting data from DOCX file: {file_name}")
-        try:
-            doc = Document(file_name)
-            data = []
-
-            for table in doc.tables:
-                if "ESTIMATED ANNUAL REQUIREMENTS BY AGENCY" in table.cell(0, 0).text:
-                    is_header_row = True
-                    for row in table.rows:
-                        if is_header_row:
-                            is_header_row = False
-                            continue  # Skip the header row
-
-                        row_data = []
-                        for cell in row.cells:
-                            row_data.append(cell.text)
-                        data.append(row_data)
-
-            # Create DataFrame without header
-            df = pd.DataFrame(data)
-
-            if not df.empty:
-                self.logger.info(f"Data extracted successfully from DOCX: {file_name}")
-                # Set the first row as the header
-                new_header = df.iloc[0]
-                df = df[1:]
-                df.columns = new_header
-
-                # Dynamically identify column name containing "TOTAL EST. ANNUAL USAGE"
-                total_usage_col = None
-                for col in df.columns:
-                    if "TOTAL EST. ANNUAL USAGE" in col:
-                        total_usage_col = col
-                        break
-
-                if total_usage_col:
-                    df["DosageForm"], df["Strength"], df["Route"], df["Ingredient"] = zip(
-                        *df["DESCRIPTION"].apply(
-                            self.data_wrangler.extract_values_from_generic_column
-                        )
-                    )
-
-                    # Keep only the columns of interest, ensuring dynamic handling of the total usage column
-                    df = df[
-                        [
-                            total_usage_col,
-                            "DosageForm",
-                            "Strength",
-                            "Route",
-                            "Ingredient",
-                        ]
-                    ]
-
-                    # Rename the dynamically identified 'TOTAL EST. ANNUAL USAGE' column
-                    result_df = df.rename(
-                        columns={total_usage_col: "Estimated Annual Quantities"}
-                    )
-                else:
-                    result_df = pd.DataFrame()
-            else:
-                self.logger.warning(f"No data extracted from DOCX: {file_name}")
-                result_df = pd.DataFrame()
-
-        except Exception as e:
-            self.logger.error(f"Error extracting data from DOCX {file_name}: {str(e)}")
-            result_df = pd.DataFrame()
-
-        return result_df
-
-
-    def get_data_from_pdf(self, file_name):
-        self.logger.info(f"Extracting data from PDF file: {file_name}")
-        try:
-            doc = fitz.open(file_name)
-            data = []
-            start_extracting = False
-
-            for page in doc:
-                text_instances = page.search_for("ESTIMATED ANNUAL REQUIREMENTS BY AGENCY")
-                if text_instances:
-                    start_extracting = True
-                    rect = text_instances[0]
-                    bottom_left = fitz.Point(rect.bl.x, rect.bl.y + 1)
-
-                    for text_instance in page.get_text("blocks"):
-                        block_rect = fitz.Rect(text_instance[:4])
-
-                        if block_rect.tl.y > bottom_left.y:
-                            row_data = text_instance[4].split("\n")
-                            if row_data:
-                                data.append(row_data)
-
-                if start_extracting:
-                    break
-
-            df = pd.DataFrame(data)
-
-            if not df.empty:
-                self.logger.info(f"Data extracted successfully from PDF: {file_name}")
-                # Process and return the DataFrame as before...
-            else:
-                self.logger.warning(f"No data extracted from PDF: {file_name}")
-                return pd.DataFrame()
-
-        except Exception as e:
-            self.logger.error(f"Error extracting data from PDF {file_name}: {str(e)}")
-            return pd.DataFrame()
-
-    
-    def get_data_from_file_excel(self, file_name):
-        self.logger.info(f"Extracting data from Excel file: {file_name}")
-        try:
-            # Read the Excel file. Assuming the data is in the first sheet, else specify sheet_name
-            df = pd.read_excel(file_name, sheet_name=0)
-
-            if not df.empty:
-                self.logger.info(f"Data extracted successfully from Excel: {file_name}")
-                # Dynamically identify column name containing "TOTAL Estimated ANNUAL"
-                total_usage_col = None
-                for col in df.columns:
-                    if "total estimated annual" in col.lower():
-                        total_usage_col = col
-                        break
-
-                if total_usage_col:
-                    # Assuming 'DESCRIPTION' exists and can be used to extract the following details
-                    if 'DESCRIPTION' in df.columns:
-                        df["DosageForm"], df["Strength"], df["Route"], df["Ingredient"] = zip(
-                            *df["DESCRIPTION"].apply(
-                                self.data_wrangler.extract_values_from_generic_column
-                            )
-                        )
-
-                        # Keep only the columns of interest, ensuring dynamic handling of the total usage column
-                        df = df[
-                            [
-                                total_usage_col,
-                                "DosageForm",
-                                "Strength",
-                                "Route",
-                                "Ingredient",
-                            ]
-                        ]
-
-                        # Rename the dynamically identified 'TOTAL Estimated ANNUAL' column
-                        result_df = df.rename(
-                            columns={total_usage_col: "Estimated Annual Quantities"}
-                        )
-                    else:
-                        self.logger.warning(f"'DESCRIPTION' column not found in Excel: {file_name}")
-                        result_df = pd.DataFrame()
-                else:
-                    self.logger.warning(f"'TOTAL Estimated ANNUAL' column not found in Excel: {file_name}")
-                    result_df = pd.DataFrame()
-            else:
-                self.logger.warning(f"No data extracted from Excel: {file_name}")
-                result_df = pd.DataFrame()
-
-        except Exception as e:
-            self.logger.error(f"Error extracting data from Excel {file_name}: {str(e)}")
-            result_df = pd.DataFrame()
-
-        return result_df
-
-
-    def process_file(self, file_path):
-        self.logger.info(f"Processing file: {file_path}")
-        
-        result_df = pd.DataFrame()  # Default to an empty DataFrame
-        
-        try:
-            if file_path.endswith(".pdf"):
-                result_df = self.get_data_from_pdf(file_path)
-            elif file_path.endswith(".docx"):
-                result_df = self.get_data_from_file_doc(file_path)
-            elif file_path.endswith((".xlsx", ".xls")):
-                result_df = self.get_data_from_file_excel(file_path)
-            else:
-                self.logger.error(f"Unsupported file type for {file_path}")
-        except Exception as e:
-            self.logger.error(f"Error processing file {file_path}: {str(e)}")
-
-        if result_df is None:
-            self.logger.warning(f"Resulting DataFrame is None for file {file_path}")
-            return pd.DataFrame()
-
-        if result_df.empty:
-            self.logger.warning(f"Resulting DataFrame is empty for file {file_path}")
-            return pd.DataFrame()
-
-        self.logger.info(f"Successfully processed file: {file_path}")
-        return result_df
+        self.http_client = get_fetch_client()
+        self.max_workers = 8  # Contracts processed concurrently
+        self.attachment_parser = AttachmentParserPool()
+        self.attachment_cache = AttachmentCache()
+        self.output_dir = os.path.join(RECORDS_DIR, "sam_gov")
 
     def extract_filename(self, content_disposition):
         if not content_disposition:
@@ -235,186 +45,152 @@ class FetchSamGov:
                 return unquote(filename)  # URL-decode the filename
         return None
 
+    def get_json(self, url, **kwargs):
+        response = self.http_client.get(url, **kwargs)
+        if response is None or response.status_code != 200:
+            print(f"Failed to fetch data from {url}. Status code: {getattr(response, 'status_code', None)}")
+            return None
+        return response.json()
+
     def sam_gov_1st_api(self, q):
-        max_retries = 20
-        attempts = 0
-        while attempts < max_retries:
-            try:
-                url = self.url.format(q)
-                response = requests.get(url, headers=self.headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    if "_embedded" in data and "results" in data["_embedded"]:
-                        results = data["_embedded"]["results"]
-                        if len(results) > 0 and "_id" in results[0]:
-                            id = results[0]["_id"]
-                            print("ID:", id)
-                            return id
-                    else:
-                        print("No ID results found.")
-                        return None
-                else:
-                    print("Failed to fetch data from 1st API. Status code:", response.status_code)
-                    attempts += 1
-                    if attempts < max_retries:
-                        print("Retrying in 5 seconds...")
-                        time.sleep(10)
-                    else:
-                        print("Maximum retries reached. Aborting.")
-                        return None
-            except requests.RequestException as e:
-                print("An error occurred:", e)
-                attempts += 1
-                if attempts < max_retries:
-                    print("Retrying in 5 seconds...")
-                    time.sleep(10)
-                else:
-                    print("Maximum retries reached after error. Aborting.")
-                    return None
+        data = self.get_json(self.url.format(q), headers=self.headers)
+        if data is None:
+            return None
+        if "_embedded" in data and "results" in data["_embedded"]:
+            results = data["_embedded"]["results"]
+            if len(results) > 0 and "_id" in results[0]:
+                id = results[0]["_id"]
+                print("ID:", id)
+                return id
+        else:
+            print("No ID results found.")
+        return None
 
     def sam_gov_2nd_api(self, id):
-        max_retries = 20
-        attempts = 0
-        while attempts < max_retries:
-            try:
-                url = f"https://sam.gov/api/prod/opps/v2/opportunities/{id}/history"
-                response = requests.get(url)
-                if response.status_code == 200:
-                    data = response.json()
-                    if "history" in data and len(data["history"]) > 0:
-                        for entry in data["history"]:
-                            if entry.get("procurementType") == "o":
-                                opportunity_id = entry.get("opportunityId")
-                                if opportunity_id:
-                                    print("Opportunity ID:", opportunity_id)
-                                    return opportunity_id
-                        else:
-                            print("No opportunity found with procurementType 'o'.")
-                            return None
-                    else:
-                        print("No history found.")
-                        return None
-                else:
-                    print("Failed to fetch data from 2nd API. Status code:", response.status_code)
-                    attempts += 1
-                    if attempts < max_retries:
-                        print("Retrying in 5 seconds...")
-                        time.sleep(10)
-                    else:
-                        print("Maximum retries reached. Aborting.")
-                        return None
-            except requests.RequestException as e:
-                print("An error occurred:", e)
-                attempts += 1
-                if attempts < max_retries:
-                    print("Retrying in 5 seconds...")
-                    time.sleep(10)
-                else:
-                    print("Maximum retries reached after error. Aborting.")
-                    return None
+        data = self.get_json(f"https://sam.gov/api/prod/opps/v2/opportunities/{id}/history")
+        if data is None:
+            return None
+        if "history" in data and len(data["history"]) > 0:
+            for entry in data["history"]:
+                if entry.get("procurementType") == "o":
+                    opportunity_id = entry.get("opportunityId")
+                    if opportunity_id:
+                        print("Opportunity ID:", opportunity_id)
+                        return opportunity_id
+            print("No opportunity found with procurementType 'o'.")
+        else:
+            print("No history found.")
+        return None
+
+    def download_attachment(self, download_url):
+        """
+        Stream one attachment into the attachment cache and return (sha256, filename), or None
+        if it failed.
+        """
+        with self.attachment_cache.download_lock(download_url) as download_path:
+            download_response = self.http_client.download(download_url, download_path)
+            if download_response is None:
+                print(f"Failed to download the file from {download_url}.")
+                return None
+            filename = self.extract_filename(download_response.headers.get("Content-Disposition"))
+            if not filename:
+                print("Filename could not be extracted from the headers.")
+                os.remove(download_path)
+                return None
+            return self.attachment_cache.add_file(download_path, filename), filename
+
+    def get_attachment_data(self, download_url, resource_key):
+        """
+        Return the table parsed from one attachment, reusing the cached download and parse when
+        the attachment has not changed since it was last seen.
+        """
+        cache = self.attachment_cache
+        with cache.lock(resource_key or download_url):
+            resource = cache.lookup_resource(resource_key)
+            if resource is not None:
+                result_df = self.get_stored_attachment_data(resource["sha256"], resource["filename"])
+                if result_df is not None:
+                    return result_df
+
+            # Not seen before, or its file is gone
+            downloaded = self.download_attachment(download_url)
+            if downloaded is None:
+                return pd.DataFrame()
+            sha256, filename = downloaded
+            cache.remember_resource(resource_key, sha256, filename)
+            result_df = self.get_stored_attachment_data(sha256, filename, downloaded=True)
+            return pd.DataFrame() if result_df is None else result_df
+
+    def get_stored_attachment_data(self, sha256, filename, downloaded=False):
+        """
+        Return the cached table of a stored attachment, parsing the file if it has none yet, or
+        None if neither the table nor the file is in the cache.
+
+        Only a successful parse is cached and only then is the file removed; a file that failed
+        to parse is kept and tried again next run.
+        """
+        cache = self.attachment_cache
+        # The same file is often attached to several solicitations
+        with cache.lock(sha256):
+            parsed = cache.get_parsed(sha256)
+            if parsed is not None:
+                if not downloaded:
+                    cache.stats["downloads_skipped"] += 1
+                cache.stats["parses_skipped"] += 1
+                return parsed
+
+            file_path = cache.file_path(sha256, filename)
+            if not os.path.exists(file_path):
+                return None
+            if not downloaded:
+                cache.stats["downloads_skipped"] += 1
+
+            self.logger.info(f"Processing file {filename} (sam gov)")
+            result_df = self.attachment_parser.parse(file_path)
+            if result_df is None:
+                # Failed, timed out or crashed
+                return pd.DataFrame()
+            cache.save_parsed(sha256, result_df)
+            with suppress(FileNotFoundError):
+                os.remove(file_path)
+            return result_df
 
     def sam_gov_3rd_api(self, opportunity_id):
         self.logger.info("Inside sam_gov_3rd_api (sam gov)")
-        max_retries = 20  # Set maximum number of retries
-        if opportunity_id:  # Ensure there is an opportunity_id
-            # Construct the API URL
-            url = f"https://sam.gov/api/prod/opps/v3/opportunities/{opportunity_id}/resources"
-            attempts = 0  # Initialize attempt counter
-            while attempts < max_retries:
-                try:
-                    response = requests.get(url)
-                    if response.status_code == 200:
-                        data = response.json()
-                        self.logger.info("response status code 200 (sam gov)")
-                        if "_embedded" in data and "opportunityAttachmentList" in data["_embedded"]:
-                            opportunity_attachment_list = data["_embedded"]["opportunityAttachmentList"]
-                            self.logger.info("Making opportunity attachment list (sam gov)")
-                            if opportunity_attachment_list:
-                                temp_dir_name = f"temp_{uuid.uuid4()}"
-                                os.makedirs(temp_dir_name, exist_ok=True)
-
-                                for attachment_info in opportunity_attachment_list:
-                                    self.logger.info("Itrating over opportunity attachment list  (sam gov)")
-                                    attachments = attachment_info.get("attachments", [])
-                                    for attachment in attachments:
-                                        self.logger.info("Itrating over attachments (sam gov)")
-                                        download_url = attachment.get("uri") or \
-                                            f"https://sam.gov/api/prod/opps/v3/opportunities/resources/files/{attachment['resourceId']}/download?&status=archived"
-                                        
-                                        # Retry logic for file download
-                                        download_attempts = 0
-                                        while download_attempts < max_retries:
-                                            self.logger.info("Inside download attempt (sam gov)")
-                                            download_response = requests.get(download_url)
-                                            if download_response.status_code == 200:
-                                                content_disposition = download_response.headers.get("Content-Disposition")
-                                                filename = self.extract_filename(content_disposition)
-                                                if filename:
-                                                    file_path = os.path.join(temp_dir_name, filename)
-                                                    with open(file_path, "wb") as file:
-                                                        file.write(download_response.content)
-                                                    print(f"File saved as {file_path} in the original format.")
-                                                    break  # Break the loop if file is successfully downloaded
-                                                else:
-                                                    print("Filename could not be extracted from the headers.")
-                                            else:
-                                                print(f"Failed to download the file. Status code: {download_response.status_code}")
-                                                download_attempts += 1
-                                                if download_attempts < max_retries:
-                                                    print("Retrying file download in 5 seconds...")
-                                                    time.sleep(5)
-                                                else:
-                                                    print("Maximum file download retries reached. Moving to the next file.")
-                               
-                                self.logger.info("Out of download attempt (sam gov)")
-                                # Process the downloaded files 
-                                for filename in os.listdir(temp_dir_name):
-                                    self.logger.info("Inside file processing (sam gov)")
-                                    file_path = os.path.join(temp_dir_name, filename)
-                                    result_df = self.process_file(file_path)
-                                    if not result_df.empty:
-                                        break
-                                    print(f"Processing file: {file_path}")
-                                    
-                                self.logger.info("After processing, delete the temporary directory and its contents")
-                                # After processing, delete the temporary directory and its contents
-                                shutil.rmtree(temp_dir_name)
-                                print(f"Temporary directory {temp_dir_name} has been deleted.")
-                                return result_df
-                            else:
-                                print("No opportunity attachment list found.")
-                                return pd.DataFrame()
-                        else:
-                            print("No embedded data or opportunity attachment list found.")
-                            return pd.DataFrame()
-                    else:
-                        print(f"Failed to fetch data. Status code: {response.status_code}")
-                        attempts += 1
-                        if attempts < max_retries:
-                            print("Retrying in 5 seconds...")
-                            time.sleep(10)
-                        else:
-                            print("Maximum retries reached. Aborting.")
-                            return pd.DataFrame()
-                except requests.RequestException as e:
-                    print(f"An error occurred: {e}")
-                    attempts += 1
-                    if attempts < max_retries:
-                        print("Retrying in 5 seconds...")
-                        time.sleep(10)
-                    else:
-                        print("Maximum retries reached after error. Aborting.")
-                        return pd.DataFrame()
-        else:
+        if not opportunity_id:  # Ensure there is an opportunity_id
             print("Opportunity ID is not defined.")
+            return None
+
+        data = self.get_json(f"https://sam.gov/api/prod/opps/v3/opportunities/{opportunity_id}/resources")
+        if data is None:
+            return pd.DataFrame()
+        self.logger.info("response status code 200 (sam gov)")
+        if not ("_embedded" in data and "opportunityAttachmentList" in data["_embedded"]):
+            print("No embedded data or opportunity attachment list found.")
+            return pd.DataFrame()
+
+        opportunity_attachment_list = data["_embedded"]["opportunityAttachmentList"]
+        self.logger.info("Making opportunity attachment list (sam gov)")
+        if not opportunity_attachment_list:
+            print("No opportunity attachment list found.")
+            return pd.DataFrame()
+
+        # Attachments are fetched one at a time and the first one with a table wins, so the
+        # rest are never downloaded
+        for attachment_info in opportunity_attachment_list:
+            for attachment in attachment_info.get("attachments", []):
+                download_url = (
+                    attachment.get("uri") or
+                    f"https://sam.gov/api/prod/opps/v3/opportunities/resources/files/{attachment['resourceId']}/download?&status=archived"
+                )
+                result_df = self.get_attachment_data(download_url, self.attachment_cache.resource_key(attachment))
+                if not result_df.empty:
+                    return result_df
+        return pd.DataFrame()
     
     def fetch_award_name_and_amount(self,id):
-        url = f"https://sam.gov/api/prod/opps/v2/opportunities/{id}?random=1712052820349"
-        payload = {}
-        headers = {}
-        response = requests.request("GET", url, headers=headers, data=payload)
-        if response.status_code == 200:
-            data = response.json()
+        data = self.get_json(f"https://sam.gov/api/prod/opps/v2/opportunities/{id}?random=1712052820349")
+        if data is not None:
             if "data2" in data:
                 award_data = data["data2"]["award"]
                 if "amount" in award_data and "awardee" in award_data:
@@ -425,31 +201,66 @@ class FetchSamGov:
                     print("Amount or name field not found in the data.")
             else:
                 print("No data found.")
-        else:
-            print("Failed to fetch data. Status code:", response.status_code)
         return '', ''
 
     def fetch_filtered_data_without_v_as_dataframe(self):
-        filtered_data = []
-        with open(self.cleaned_data_dir, "r", newline="") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row["PriceType"] == "FSS":
-                    continue  # Skip this row if PriceType is 'FSS'
-                if not row["ContractNumber"].startswith(
-                    "V"
-                ):  # Check if ContractNumber does not start with 'V'
-                    # Append the entire row to the list
-                    filtered_data.append(row)
-
-        # Convert the list of dictionaries to a pandas DataFrame
-        df = pd.DataFrame(filtered_data)
+        # Values are compared as text below, as they were when this was read from the CSV
+        df = read_cleaned_data().fillna("").astype(str)
+
+        # Skip FSS prices and keep contract numbers that do not start with 'V'
+        df = df[(df["PriceType"] != "FSS") & ~df["ContractNumber"].str.startswith("V")]
         columns_to_check = ['Strength', 'DosageForm', 'Route', 'Ingredient','ContractNumber']
         df_clean = df.drop_duplicates(subset=columns_to_check, keep='first')
         # df.drop_duplicates(subset=['ContractNumber'],inplace=True)
         return df_clean 
 
     
+    def fetch_contract_data(self, contract_number):
+        """
+        Run the search -> history -> resources -> download -> parse chain for one contract.
+        Returns (result_df, awardee, awarded_value); result_df is empty when nothing was found.
+        """
+        self.logger.info(f"Getting data from the first API for {contract_number} (sam gov)")
+        id = self.sam_gov_1st_api(contract_number)
+        if not id:
+            return pd.DataFrame(), '', ''
+        self.logger.info(f"Getting data from the 2nd API for {contract_number} (sam gov)")
+        opportunity_id = self.sam_gov_2nd_api(id)
+        if not opportunity_id:
+            return pd.DataFrame(), '', ''
+        self.logger.info(f"Getting data from the 3rd API for {contract_number} (sam gov)")
+        result_df = self.sam_gov_3rd_api(opportunity_id)
+        if result_df is None or result_df.empty:
+            return pd.DataFrame(), '', ''
+        awardee, awarded_value = self.fetch_award_name_and_amount(id)
+        return result_df, awardee, awarded_value
+
+    def match_contract_rows(self, contract_number, rows):
+        """
+        Job for one contract: fetch its attachment data and return the matched record for each
+        FSS row whose strength and ingredient appear in it.
+        """
+        result_df, awardee, awarded_value = self.fetch_contract_data(contract_number)
+        if result_df.empty:
+            return []
+
+        self.logger.info(f"Desired data found for {contract_number} (sam gov)")
+        matched_rows = []
+        for row in rows:
+            for _, result_row in result_df.iterrows():
+                if result_row["Strength"] is not None and result_row["Ingredient"] is not None:
+                    if row["Strength"] in result_row["Strength"] and row['Ingredient'] in result_row['Ingredient']:
+                        matched_rows.append({
+                            "ContractNumber": contract_number,
+                            "Ingredient": result_row["Ingredient"],
+                            "Strength": result_row["Strength"],
+                            "Awardee": awardee,
+                            "Awarded Value": awarded_value,
+                            "Estimated Annual Quantities": result_row["Estimated Annual Quantities"]
+                        })
+                        break
+        return matched_rows
+
     def process_contract_numbers(self):
         self.logger.info("Start fetching data from sam gov...")
         
@@ -459,75 +270,97 @@ class FetchSamGov:
         
         # Path to the output CSV file
         os.makedirs(self.output_dir, exist_ok=True)
-        output_path = os.path.join(self.output_dir, "sam_gov_records.csv")
+        output_path = shard_path(os.path.join(self.output_dir, "sam_gov_records.csv"), self.shard)
         
         self.logger.info("Creating directory to store scraped data (sam gov)")
         
-        # Remove the existing file if it exists
-        if os.path.exists(output_path):
+        contracts = list(df.groupby("ContractNumber", sort=False))
+        contracts = contracts[slice(*shard_bounds(len(contracts), self.shard))]
+        checkpoint = ScrapeCheckpointer(shard_name("sam_gov", self.shard), [output_path], resume=self.resume)
+        done = checkpoint.start([contract_number for contract_number, _ in contracts])
+        written_rows = None
+        if done:
+            with open(output_path, newline='', encoding='utf-8') as csvfile:
+                written_rows = list(csv.DictReader(csvfile))
+        elif os.path.exists(output_path):
+            # Remove the existing file if it exists
             self.logger.info(f"File {output_path} already exists. Removing it.")
             os.remove(output_path)
-        
-        # Open the CSV file in write mode to create a new file
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ["ContractNumber", "Ingredient", "Strength", "Awardee", "Awarded Value", "Estimated Annual Quantities"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # Write the header
-            writer.writeheader()
-            
-            self.logger.info("Open file to insert the data at runtime (sam gov)")
-            
-            for _, row in df.iterrows():
-                self.logger.info("Start iterating over filtered data (sam gov)")
-                contract_number = row["ContractNumber"]
-                print("Contract Number: ", contract_number)
-                if contract_number in self.fetched_data_cache:
-                    result_df = self.fetched_data_cache[contract_number]
-                else:
-                    self.fetched_data_cache[contract_number] = pd.DataFrame()
-                    self.logger.info("Getting data from the first API (sam gov)")
-                    id = self.sam_gov_1st_api(contract_number)
-                    if id:
-                        self.logger.info("Getting data from the 2nd API (sam gov)")
-                        opportunity_id = self.sam_gov_2nd_api(id)
-                        if opportunity_id:
-                            self.logger.info("Getting data from the 3rd API (sam gov)")
-                            result_df = self.sam_gov_3rd_api(opportunity_id)
-                            self.logger.info(f"Outside the 3rd API : {result_df} (sam gov)")
-                            self.fetched_data_cache[contract_number] = result_df
-                    else:
-                        continue
-
-                result_df = self.fetched_data_cache[contract_number]
-
-                if result_df is not None and not result_df.empty:
-                    self.logger.info("Desired data found (sam gov)")
-                    print("Data found: ")
-                    print(result_df)
-                    self.logger.info("Fetch award name and amount (sam gov)")
-                    awardee, awarded_value = self.fetch_award_name_and_amount(id)
-                    self.logger.info("Start iterating over result data (sam gov)")
-                    for _, result_row in result_df.iterrows():
-                        if result_row["Strength"] is not None and result_row["Ingredient"] is not None:
-                            if row["Strength"] in result_row["Strength"] and row['Ingredient'] in result_row['Ingredient']:
-                                matched_row_info = {
-                                    "ContractNumber": contract_number,
-                                    "Ingredient": result_row["Ingredient"],
-                                    "Strength": result_row["Strength"],
-                                    "Awardee": awardee,
-                                    "Awarded Value": awarded_value,
-                                    "Estimated Annual Quantities": result_row["Estimated Annual Quantities"]
-                                }
-                                # Write the matched row immediately to the CSV file
-                                self.logger.info("Insert the matched data in the csv file (sam gov)")
-                                writer.writerow(matched_row_info)
-                                break
-
- 
-                    
-            
-        
+        remaining = contracts[done:]
+        self.logger.info(f"Processing {len(remaining)} contracts with {self.max_workers} workers (sam gov)")
+
+        # Each contract is an independent job; matched rows are written as soon as every earlier
+        # contract has finished, so the file keeps the input order
+        try:
+            with open(output_path, 'a' if done else 'w', newline='', encoding='utf-8') as csvfile, \
+                    ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sam-gov") as executor:
+                writer = SamGovRecordWriter(csvfile, written_rows)
+                futures = {
+                    executor.submit(self.match_contract_rows, contract_number, group.to_dict("records")): index
+                    for index, (contract_number, group) in enumerate(remaining)
+                }
+                for future in as_completed(futures):
+                    try:
+                        matched_rows = future.result()
+                    except Exception as e:
+                        contract_number = remaining[futures[future]][0]
+                        self.logger.error(f"Failed to process contract {contract_number} (sam gov): {e}")
+                        if self.shard is not None:
+                            # The shard is retried from the last contract written rather than
+                            # merged without this one
+                            executor.shutdown(cancel_futures=True)
+                            raise
+                        matched_rows = []
+                    written = writer.next_index
+                    writer.add(futures[future], matched_rows)
+                    if writer.next_index > written:
+                        checkpoint.advance(done + writer.next_index, remaining[writer.next_index - 1][0])
+        finally:
+            self.attachment_parser.shutdown()
+        checkpoint.finish()
+        self.attachment_cache.log_stats(self.logger)
+
+        self.logger.info(f"{writer.rows_written} matched rows written to {output_path} (sam gov)")
+
+
+class SamGovRecordWriter:
+    """
+    Streams matched rows to sam_gov_records.csv as contract jobs complete.
+
+    Results are written in contract order: a job that finishes early is held until every
+    earlier contract has been written. Rows already written are skipped, including
+    `written_rows` already in the file when a run is resumed; the header is only written for a
+    new file.
+    """
+
+    fieldnames = ["ContractNumber", "Ingredient", "Strength", "Awardee", "Awarded Value", "Estimated Annual Quantities"]
+
+    def __init__(self, file, written_rows=None):
+        self.file = file
+        self.writer = csv.DictWriter(file, fieldnames=self.fieldnames)
+        if written_rows is None:
+            self.writer.writeheader()
+        self.pending = {}
+        self.next_index = 0
+        self.written = {self.row_key(row) for row in written_rows or []}
+        self.rows_written = 0
+
+    def row_key(self, row):
+        # Matches how the csv module writes values, so rows read back from the file compare equal
+        return tuple("" if row[field] is None else str(row[field]) for field in self.fieldnames)
+
+    def add(self, index, rows):
+        self.pending[index] = rows
+        while self.next_index in self.pending:
+            for row in self.pending.pop(self.next_index):
+                key = self.row_key(row)
+                if key in self.written:
+                    continue
+                self.written.add(key)
+                self.writer.writerow(row)
+                self.rows_written += 1
+            self.next_index += 1
+        self.file.flush()
 
 
 # Example usage:
@@ -0,0 +1,426 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from urllib.parse import urlencode, urlsplit
+import httpx
+from .cache_store import SQLiteCacheStore, cache_key
+
+logger = logging.getLogger('scraping')
+
+# Maximum concurrent requests per host; anything not listed uses DEFAULT_HOST_LIMIT
+HOST_LIMITS = {
+    "dailymed.nlm.nih.gov": 8,
+    "www.accessdata.fda.gov": 4,
+    "sam.gov": 4,
+    "www.ashp.org": 2,
+}
+DEFAULT_HOST_LIMIT = 4
+
+# Response cache lifetime per URL prefix, first match wins; None means the URL is never cached
+DAY = 24 * 60 * 60
+CACHE_TTLS = [
+    ("https://sam.gov/api/prod/opps/v3/opportunities/resources/files/", None),
+    ("https://sam.gov/api/prod/sgs/v1/search/", 1 * DAY),
+    ("https://sam.gov/api/prod/opps/", 7 * DAY),
+    ("https://dailymed.nlm.nih.gov/", 7 * DAY),
+    ("https://www.accessdata.fda.gov/scripts/cder/ob/", 7 * DAY),
+]
+
+# Serve every request from the response cache only, e.g. to replay a run while debugging
+OFFLINE = os.getenv("SCRAPER_HTTP_OFFLINE", "").lower() in ("1", "true")
+
+# Bytes written per chunk by AsyncFetchClient.download
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+
+DEFAULT_HEADERS = {
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
+}
+
+
+def host_limit(url, shard=None):
+    """
+    Concurrent requests allowed to the host of url. When one (index, total) shard of a source
+    is being scraped, the other shards run in other processes at the same time, so each gets
+    its share of the host's limit.
+    """
+    limit = HOST_LIMITS.get(urlsplit(url).hostname or "", DEFAULT_HOST_LIMIT)
+    return limit if shard is None else max(1, limit // shard[1])
+
+
+class BackoffPolicy:
+    """
+    Exponential backoff with jitter, shared by every scraper.
+
+    Transport errors and the listed status codes are retried; any other response is
+    returned to the caller as is.
+    """
+
+    def __init__(self, max_retries=6, base_delay=1.0, max_delay=60.0, retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def should_retry(self, response):
+        return response.status_code in self.retry_statuses
+
+    def delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class HTTPResponseCache:
+    """
+    On-disk cache of successful responses keyed by method, URL and body.
+
+    Entries younger than the URL's TTL are served directly; older ones are revalidated with
+    ETag/Last-Modified when the server supplied them.
+    """
+
+    def __init__(self, ttls=None, store=None):
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.store = store or SQLiteCacheStore("http_responses")
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0}
+
+    def ttl_for(self, url):
+        for prefix, ttl in self.ttls:
+            if url.startswith(prefix):
+                return ttl
+        return None
+
+    def key(self, method, url, kwargs):
+        body = kwargs.get("content") or ""
+        if kwargs.get("data"):
+            body = urlencode(kwargs["data"])
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"], sort_keys=True)
+        return cache_key(method.upper(), url, body)
+
+    def lookup(self, key):
+        entry = self.store.get(key)
+        if entry is None:
+            return None, None
+        content, metadata, stored_at = entry
+        response = httpx.Response(
+            metadata["status_code"],
+            headers=metadata["headers"],
+            content=content,
+            request=httpx.Request(metadata["method"], metadata["url"]),
+        )
+        return response, time.time() - stored_at
+
+    def conditional_headers(self, response):
+        headers = {}
+        if response.headers.get("ETag"):
+            headers["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+        return headers
+
+    def save(self, key, method, url, response):
+        metadata = {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "method": method.upper(),
+            "url": url,
+        }
+        # The stored content is already decoded, so drop headers describing the wire encoding
+        for header in ("content-encoding", "transfer-encoding", "content-length"):
+            metadata["headers"].pop(header, None)
+        self.store.set(key, response.content, metadata)
+
+    def log_stats(self):
+        logger.info(
+            f"HTTP cache: {self.stats['hits']} hits, {self.stats['revalidated']} revalidated, "
+            f"{self.stats['misses']} misses."
+        )
+
+
+class PartialDownload:
+    """
+    A download in progress: the bytes received so far in `path.part` and the ETag or
+    Last-Modified they were served with, kept beside them so a later attempt can resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.validator_path = f"{path}.part.validator"
+        self.validator = None
+        if os.path.exists(self.part_path) and os.path.exists(self.validator_path):
+            with open(self.validator_path) as file:
+                self.validator = file.read()
+
+    def size(self):
+        return os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+
+    def range_headers(self):
+        offset = self.size() if self.validator else 0
+        if not offset:
+            return {}
+        return {"Range": f"bytes={offset}-", "If-Range": self.validator}
+
+    def discard(self):
+        self.validator = None
+        for file_path in (self.part_path, self.validator_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def expected_size(self, response, offset):
+        """
+        Full size of the file, or None if the response does not say.
+        """
+        if response.status_code == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != offset:
+                raise httpx.DecodingError(f"Unexpected Content-Range {response.headers.get('Content-Range')!r}")
+            return None if match.group(2) == "*" else int(match.group(2))
+        if response.headers.get("Content-Encoding", "identity") != "identity":
+            return None  # Content-Length counts the encoded bytes
+        content_length = response.headers.get("Content-Length")
+        return int(content_length) if content_length and content_length.isdigit() else None
+
+    async def write(self, response, chunk_size):
+        """
+        Append the response body to the partial file (or replace it if the server sent the whole
+        file) and move it into place. Returns False if the body ended before the expected size.
+        """
+        offset = self.size() if response.status_code == 206 else 0
+        try:
+            expected_size = self.expected_size(response, offset)
+        except httpx.DecodingError:
+            self.discard()
+            raise
+        self.validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if self.validator:
+            with open(self.validator_path, "w") as file:
+                file.write(self.validator)
+        elif os.path.exists(self.validator_path):
+            os.remove(self.validator_path)
+
+        with open(self.part_path, "ab" if offset else "wb") as file:
+            async for chunk in response.aiter_bytes(chunk_size):
+                file.write(chunk)
+
+        if expected_size is not None and self.size() != expected_size:
+            return False
+        os.replace(self.part_path, self.path)
+        self.discard()
+        return True
+
+
+class AsyncFetchClient:
+    """
+    Pooled asyncio HTTP client shared by the scrapers.
+
+    One httpx.AsyncClient keeps connections alive across requests, a semaphore per host
+    bounds concurrency, and the client runs on its own event loop thread so the
+    synchronous scrapers can call request() and fetch_many() from any thread. Responses
+    from slowly changing sources are kept in an HTTPResponseCache.
+    """
+
+    def __init__(self, backoff=None, timeout=60.0, max_connections=50, cache=None, offline=OFFLINE):
+        self.backoff = backoff or BackoffPolicy()
+        self.cache = cache
+        self.offline = offline
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.shard = None
+        self.host_semaphores = {}
+        self.download_locks = weakref.WeakValueDictionary()  # A path's lock goes once no download holds it
+        self.client = None
+        self.loop = asyncio.new_event_loop()
+        self.loop_ready = threading.Event()
+        self.thread = threading.Thread(target=self.run_loop, name="scraper-http-client", daemon=True)
+        self.thread.start()
+        self.loop_ready.wait()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+        self.loop_ready.set()
+        self.loop.run_forever()
+
+    def set_shard(self, shard):
+        """
+        Scale the per-host limits to one (index, total) shard of a source, or back to the full
+        limits for None. Shards run one per worker process, so the limits are replaced rather
+        than shared between concurrent shards of this client.
+        """
+        asyncio.run_coroutine_threadsafe(self.async_set_shard(shard), self.loop).result()
+
+    async def async_set_shard(self, shard):
+        # Runs on the loop, the only thread that creates the semaphores
+        if shard != self.shard:
+            self.shard = shard
+            self.host_semaphores = {}
+
+    def host_semaphore(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(host_limit(url, self.shard))
+        return self.host_semaphores[host]
+
+    async def send(self, method, url, **kwargs):
+        """
+        Send a request with retries, returning the last response, or None if every attempt
+        failed at the transport level.
+        """
+        response = None
+        for attempt in range(self.backoff.max_retries + 1):
+            try:
+                async with self.host_semaphore(url):
+                    response = await self.client.request(method, url, **kwargs)
+                if not self.backoff.should_retry(response):
+                    return response
+                logger.warning(f"{method} {url} returned {response.status_code} (attempt {attempt + 1}).")
+            except httpx.HTTPError as e:
+                response = None
+                logger.warning(f"{method} {url} failed: {e} (attempt {attempt + 1}).")
+
+            if attempt < self.backoff.max_retries:
+                await asyncio.sleep(self.backoff.delay(attempt, response))
+
+        logger.error(f"Giving up on {method} {url} after {self.backoff.max_retries + 1} attempts.")
+        return response
+
+    async def async_request(self, method, url, **kwargs):
+        """
+        Send a request through the response cache when the URL is cacheable.
+        """
+        ttl = self.cache.ttl_for(url) if self.cache else None
+        if ttl is None:
+            return None if self.offline else await self.send(method, url, **kwargs)
+
+        key = self.cache.key(method, url, kwargs)
+        cached, age = self.cache.lookup(key)
+        if cached is not None and (self.offline or age < ttl):
+            self.cache.stats["hits"] += 1
+            return cached
+        if self.offline:
+            logger.warning(f"{method} {url} is not in the response cache (offline mode).")
+            return None
+
+        if cached is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), **self.cache.conditional_headers(cached)}
+        response = await self.send(method, url, **kwargs)
+
+        if cached is not None and response is not None and response.status_code == 304:
+            self.cache.stats["revalidated"] += 1
+            self.cache.store.touch(key)
+            return cached
+        self.cache.stats["misses"] += 1
+        if response is not None and response.status_code == 200:
+            self.cache.save(key, method, url, response)
+        return response
+
+    async def async_download(self, url, path, chunk_size=DOWNLOAD_CHUNK_SIZE, headers=None):
+        """
+        Stream url into path chunk by chunk, returning the response (its body already written)
+        or None if the download failed.
+
+        Bytes go to `path.part` first and are moved to path only once the size matches
+        Content-Length. A failed attempt is resumed with a Range request, guarded by If-Range
+        so a file that changed on the server is downloaded again from the start; the partial
+        file is also resumed by the next call for the same path. Concurrent calls for one path
+        wait for each other.
+        """
+        if self.offline:
+            logger.warning(f"GET {url} cannot be downloaded in offline mode.")
+            return None
+
+        # Downloads of the same path run one at a time, or they would write one .part file
+        lock = self.download_locks.get(path)
+        if lock is None:
+            lock = self.download_locks[path] = asyncio.Lock()
+        async with lock:
+            part = PartialDownload(path)
+            response = None
+            for attempt in range(self.backoff.max_retries + 1):
+                # Ranges count encoded bytes, so ask for the file as stored
+                request_headers = {**(headers or {}), "Accept-Encoding": "identity", **part.range_headers()}
+                try:
+                    async with self.host_semaphore(url):
+                        async with self.client.stream("GET", url, headers=request_headers) as response:
+                            if response.status_code == 416:
+                                logger.warning(f"GET {url} rejected the resume offset; starting over.")
+                                part.discard()
+                            elif self.backoff.should_retry(response):
+                                logger.warning(f"GET {url} returned {response.status_code} (attempt {attempt + 1}).")
+                            elif response.status_code not in (200, 206):
+                                logger.error(f"GET {url} returned {response.status_code}.")
+                                return None
+                            elif await part.write(response, chunk_size):
+                                return response
+                            else:
+                                logger.warning(f"GET {url} ended early at {part.size()} bytes (attempt {attempt + 1}).")
+                except httpx.HTTPError as e:
+                    logger.warning(f"GET {url} failed: {e} (attempt {attempt + 1}).")
+
+                if attempt < self.backoff.max_retries:
+                    await asyncio.sleep(self.backoff.delay(attempt, response))
+
+            logger.error(f"Giving up on downloading {url} after {self.backoff.max_retries + 1} attempts.")
+            return None
+
+    def request(self, method, url, **kwargs):
+        """
+        Blocking wrapper around async_request for the synchronous scrapers.
+        """
+        return asyncio.run_coroutine_threadsafe(self.async_request(method, url, **kwargs), self.loop).result()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url, path, **kwargs):
+        """
+        Blocking wrapper around async_download.
+        """
+        return asyncio.run_coroutine_threadsafe(self.async_download(url, path, **kwargs), self.loop).result()
+
+    def submit_many(self, method, urls, **kwargs):
+        """
+        Start fetching several URLs concurrently (bounded by the per-host limits) and return a
+        future for the responses, in the same order as the URLs.
+        """
+        async def gather():
+            return await asyncio.gather(*(self.async_request(method, url, **kwargs) for url in urls))
+
+        return asyncio.run_coroutine_threadsafe(gather(), self.loop)
+
+    def fetch_many(self, method, urls, **kwargs):
+        return self.submit_many(method, urls, **kwargs).result()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_fetch_client():
+    """
+    Return the process-wide fetch client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AsyncFetchClient(cache=HTTPResponseCache())
+        return _client
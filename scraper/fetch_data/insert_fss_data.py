@@ -0,0 +1,304 @@
+import hashlib
+import logging
+import pandas as pd
+from django.db import transaction
+from scraper.models import FSSVendor, FSSContract, FSSDrug, FSSPricing, FSSChangeSet
+from scraper.ndc import normalize_ndc
+from .price_rollups import drug_group, refresh_price_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class InsertFSSData:
+    """
+    Bulk ingest of the cleaned vaFssPharmPrices data.
+
+    Vendors, contracts, drugs and pricings already in the database are loaded once
+    and matched in memory. Drugs and pricings carry a fingerprint of their business
+    columns, so only inserted, changed and deleted rows are written, in batches, and
+    the NDCs they touch are recorded in an FSSChangeSet for downstream steps. The price
+    range rollups of the drug groups whose pricings changed are refreshed in the same
+    transaction.
+    """
+
+    DRUG_FIELDS = [
+        "vendor_id", "trade_name", "generic_name", "dosage_form", "strength", "route",
+        "va_class", "covered", "prime_vendor", "ingredient", "package_description",
+    ]
+    PRICING_FIELDS = ["price", "non_taa_compliance"]
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.stats = {
+            model.__name__: {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+            for model in (FSSVendor, FSSContract, FSSDrug, FSSPricing)
+        }
+        self.changed_contract_ids = set()
+        self.seen_ndcs, self.inserted_ndcs, self.updated_ndcs, self.deleted_ndcs = set(), set(), set(), set()
+        self.touched_groups = set()  # Price range rollup groups whose pricings may have changed
+        self.change_set = None
+
+    def clean_value(self, model, field_name, value):
+        # Normalise a DataFrame cell the same way the model field would before saving it
+        field = model._meta.get_field(field_name)
+        if field.null and pd.isna(value):
+            return None
+        return field.to_python(value)
+
+    def fingerprint(self, *values):
+        return hashlib.sha256("\x1f".join(str(value) for value in values).encode("utf-8")).hexdigest()
+
+    def count(self, model, action, amount=1):
+        self.stats[model.__name__][action] += amount
+
+    def resolve_vendors(self, df):
+        vendors = {}
+        for vendor in FSSVendor.objects.all().order_by("id"):
+            vendors.setdefault(vendor.vendor_name, vendor)
+
+        names = set(df["VendorName"].map(lambda name: self.clean_value(FSSVendor, "vendor_name", name)))
+        new_vendors = [FSSVendor(vendor_name=name) for name in names if name not in vendors]
+        self.count(FSSVendor, "unchanged", len(names) - len(new_vendors))
+
+        if new_vendors:
+            FSSVendor.objects.bulk_create(new_vendors, batch_size=self.batch_size)
+            self.count(FSSVendor, "inserted", len(new_vendors))
+            for vendor in FSSVendor.objects.filter(vendor_name__in=[v.vendor_name for v in new_vendors]):
+                vendors.setdefault(vendor.vendor_name, vendor)
+        return vendors
+
+    def resolve_contracts(self, df, vendors):
+        contracts = {contract.contract_number: contract for contract in FSSContract.objects.all()}
+        new_contracts, changed_contracts = {}, {}
+
+        for row in df.drop_duplicates(subset="ContractNumber", keep="last").to_dict(orient="records"):
+            contract_number = self.clean_value(FSSContract, "contract_number", row["ContractNumber"])
+            values = {
+                "contract_start_date": pd.to_datetime(row["ContractStartDate"]).date(),
+                "contract_stop_date": pd.to_datetime(row["ContractStopDate"]).date(),
+                "vendor_id": vendors[self.clean_value(FSSVendor, "vendor_name", row["VendorName"])].id,
+            }
+            contract = contracts.get(contract_number)
+            if contract is None:
+                new_contracts[contract_number] = FSSContract(contract_number=contract_number, **values)
+            elif any(getattr(contract, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(contract, field, value)
+                changed_contracts[contract_number] = contract
+            else:
+                self.count(FSSContract, "unchanged")
+
+        if new_contracts:
+            FSSContract.objects.bulk_create(new_contracts.values(), batch_size=self.batch_size)
+            self.count(FSSContract, "inserted", len(new_contracts))
+            contracts.update(
+                (contract.contract_number, contract)
+                for contract in FSSContract.objects.filter(contract_number__in=list(new_contracts))
+            )
+        if changed_contracts:
+            FSSContract.objects.bulk_update(
+                changed_contracts.values(),
+                ["contract_start_date", "contract_stop_date", "vendor_id"],
+                batch_size=self.batch_size,
+            )
+            self.count(FSSContract, "updated", len(changed_contracts))
+            self.changed_contract_ids = {contract.id for contract in changed_contracts.values()}
+        return contracts
+
+    def drug_values(self, row, vendors):
+        return {
+            "vendor_id": vendors[self.clean_value(FSSVendor, "vendor_name", row["VendorName"])].id,
+            "trade_name": self.clean_value(FSSDrug, "trade_name", row["TradeName"]),
+            "generic_name": self.clean_value(FSSDrug, "generic_name", row["Generic"]),
+            "dosage_form": self.clean_value(FSSDrug, "dosage_form", row["DosageForm"]),
+            "strength": self.clean_value(FSSDrug, "strength", row["Strength"]),
+            "route": self.clean_value(FSSDrug, "route", row["Route"]),
+            "va_class": self.clean_value(FSSDrug, "va_class", row["VAClass"]),
+            "covered": row["Covered"] == "T",
+            "prime_vendor": row["PrimeVendor"] == "T",
+            "ingredient": self.clean_value(FSSDrug, "ingredient", row["Ingredient"]),
+            "package_description": self.clean_value(FSSDrug, "package_description", row["PackageDescription"]),
+        }
+
+    def drug_key(self, row, contracts):
+        return (
+            self.clean_value(FSSDrug, "ndc_with_dashes", row["NDCWithDashes"]),
+            contracts[self.clean_value(FSSContract, "contract_number", row["ContractNumber"])].id,
+        )
+
+    def pricing_key(self, drug_id, row):
+        return (
+            drug_id,
+            self.clean_value(FSSPricing, "price_type", row["PriceType"]),
+            pd.to_datetime(row["PriceStartDate"]).date(),
+            pd.to_datetime(row["PriceStopDate"]).date(),
+        )
+
+    def delete_in_batches(self, model, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            model.objects.filter(id__in=ids[start:start + self.batch_size]).delete()
+
+    def upsert_drugs(self, records, vendors, contracts):
+        # Drugs are identified by NDC + contract; the oldest row wins if the table holds duplicates
+        drugs = {}
+        for drug in FSSDrug.objects.all().order_by("id"):
+            drugs.setdefault((drug.ndc_with_dashes, drug.contract_id), drug)
+
+        new_drugs, changed_drugs, seen = {}, {}, set()
+        for row in records:
+            key = self.drug_key(row, contracts)
+            values = self.drug_values(row, vendors)
+            fingerprint = self.fingerprint(*key, *(values[field] for field in self.DRUG_FIELDS))
+            drug = drugs.get(key)
+            if drug is None:
+                new_drugs[key] = FSSDrug(
+                    ndc_with_dashes=key[0], ndc_key=normalize_ndc(key[0]), contract_id=key[1],
+                    row_fingerprint=fingerprint, **values,
+                )
+                drugs[key] = new_drugs[key]
+            elif drug.row_fingerprint != fingerprint:
+                # The drug's pricings move to its new group
+                self.touched_groups.add(drug_group(drug))
+                for field, value in values.items():
+                    setattr(drug, field, value)
+                drug.row_fingerprint = fingerprint
+                self.touched_groups.add(drug_group(drug))
+                if key not in new_drugs:
+                    changed_drugs[key] = drug
+            if key[1] in self.changed_contract_ids:
+                self.updated_ndcs.add(key[0])
+            seen.add(key)
+
+        stale_drugs = {key: drug for key, drug in drugs.items() if key not in seen}
+        self.seen_ndcs = {ndc for ndc, _ in seen}
+
+        self.count(FSSDrug, "unchanged", len(seen - new_drugs.keys() - changed_drugs.keys()))
+        if new_drugs:
+            FSSDrug.objects.bulk_create(new_drugs.values(), batch_size=self.batch_size)
+            self.count(FSSDrug, "inserted", len(new_drugs))
+            self.inserted_ndcs.update(ndc for ndc, _ in new_drugs)
+        if changed_drugs:
+            FSSDrug.objects.bulk_update(
+                changed_drugs.values(), self.DRUG_FIELDS + ["row_fingerprint"], batch_size=self.batch_size
+            )
+            self.count(FSSDrug, "updated", len(changed_drugs))
+            self.updated_ndcs.update(ndc for ndc, _ in changed_drugs)
+        if stale_drugs:
+            # Their pricings go with them through the cascade
+            self.delete_in_batches(FSSDrug, [drug.id for drug in stale_drugs.values()])
+            self.count(FSSDrug, "deleted", len(stale_drugs))
+            self.deleted_ndcs.update(ndc for ndc, _ in stale_drugs)
+            self.touched_groups.update(drug_group(drug) for drug in stale_drugs.values())
+            for key in stale_drugs:
+                del drugs[key]
+
+        # bulk_create does not return primary keys on every backend, so look up the new ones
+        missing_ids = [key for key, drug in new_drugs.items() if drug.pk is None]
+        if missing_ids:
+            created = FSSDrug.objects.filter(
+                ndc_with_dashes__in={ndc for ndc, _ in missing_ids},
+                contract_id__in={contract_id for _, contract_id in missing_ids},
+            ).order_by("id")
+            for drug in created:
+                key = (drug.ndc_with_dashes, drug.contract_id)
+                if key in new_drugs and new_drugs[key].pk is None:
+                    new_drugs[key] = drugs[key] = drug
+        return drugs
+
+    def upsert_pricings(self, records, drugs, contracts):
+        # Pricings are identified by drug + price type + price dates
+        ndc_by_drug_id = {drug.id: drug.ndc_with_dashes for drug in drugs.values()}
+        pricings = {}
+        for pricing in FSSPricing.objects.all().order_by("id"):
+            # Pricings of duplicate drug rows are left alone
+            if pricing.drug_id in ndc_by_drug_id:
+                pricings.setdefault(
+                    (pricing.drug_id, pricing.price_type, pricing.price_start_date, pricing.price_stop_date),
+                    pricing,
+                )
+
+        new_pricings, changed_pricings, seen = {}, {}, set()
+        for row in records:
+            drug = drugs[self.drug_key(row, contracts)]
+            key = self.pricing_key(drug.id, row)
+            values = {
+                "price": self.clean_value(FSSPricing, "price", row["Price"]),
+                "non_taa_compliance": self.clean_value(FSSPricing, "non_taa_compliance", row["Non-TAA"]),
+            }
+            fingerprint = self.fingerprint(
+                drug.ndc_with_dashes, drug.contract_id, *key[1:], *(values[field] for field in self.PRICING_FIELDS)
+            )
+            pricing = pricings.get(key)
+            if pricing is None:
+                new_pricings[key] = FSSPricing(
+                    drug_id=key[0], price_type=key[1], price_start_date=key[2], price_stop_date=key[3],
+                    row_fingerprint=fingerprint, **values
+                )
+                pricings[key] = new_pricings[key]
+            elif pricing.row_fingerprint != fingerprint:
+                for field, value in values.items():
+                    setattr(pricing, field, value)
+                pricing.row_fingerprint = fingerprint
+                if key not in new_pricings:
+                    changed_pricings[key] = pricing
+            seen.add(key)
+
+        stale_pricings = {key: pricing for key, pricing in pricings.items() if key not in seen}
+
+        self.count(FSSPricing, "unchanged", len(seen - new_pricings.keys() - changed_pricings.keys()))
+        if new_pricings:
+            FSSPricing.objects.bulk_create(new_pricings.values(), batch_size=self.batch_size)
+            self.count(FSSPricing, "inserted", len(new_pricings))
+        if changed_pricings:
+            FSSPricing.objects.bulk_update(
+                changed_pricings.values(), self.PRICING_FIELDS + ["row_fingerprint"], batch_size=self.batch_size
+            )
+            self.count(FSSPricing, "updated", len(changed_pricings))
+        if stale_pricings:
+            self.delete_in_batches(FSSPricing, [pricing.id for pricing in stale_pricings.values()])
+            self.count(FSSPricing, "deleted", len(stale_pricings))
+
+        group_by_drug_id = {drug.id: drug_group(drug) for drug in drugs.values()}
+        for drug_id, *_ in list(new_pricings) + list(changed_pricings) + list(stale_pricings):
+            self.updated_ndcs.add(ndc_by_drug_id[drug_id])
+            self.touched_groups.add(group_by_drug_id[drug_id])
+
+    def record_change_set(self):
+        # An NDC removed from one contract but still listed under another counts as updated
+        deleted_ndcs = self.deleted_ndcs - self.seen_ndcs
+        updated_ndcs = (self.updated_ndcs | (self.deleted_ndcs & self.seen_ndcs)) - self.inserted_ndcs
+        self.change_set = FSSChangeSet.objects.create(
+            inserted_ndcs=sorted(self.inserted_ndcs),
+            updated_ndcs=sorted(updated_ndcs),
+            deleted_ndcs=sorted(deleted_ndcs),
+            stats=self.stats,
+        )
+        return self.change_set
+
+    def insert_main_data(self, df):
+        """
+        Apply the cleaned price file and return inserted/updated/unchanged/deleted counts per model.
+
+        Drugs and pricings missing from the file are deleted, so an empty file is refused.
+        """
+        if df.empty:
+            raise ValueError("The FSS price file is empty; refusing to delete every FSS drug.")
+
+        records = df.to_dict(orient="records")
+        logger.info(f"Bulk inserting {len(records)} FSS price rows...")
+
+        with transaction.atomic():
+            vendors = self.resolve_vendors(df)
+            contracts = self.resolve_contracts(df, vendors)
+            drugs = self.upsert_drugs(records, vendors, contracts)
+            self.upsert_pricings(records, drugs, contracts)
+            self.record_change_set()
+            refresh_price_rollups(self.touched_groups, batch_size=self.batch_size)
+
+        for model_name, counts in self.stats.items():
+            logger.info(
+                f"{model_name}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged, {counts['deleted']} deleted."
+            )
+        return self.stats
@@ -0,0 +1,41 @@
+from .cache_store import SQLiteCacheStore, cache_key
+
+
+class LLMExtractionCache:
+    """
+    Persistent cache of parsed LLM extractions, keyed by a hash of the normalized input text.
+
+    Each caller passes a namespace (bump it when the prompt changes) and the texts that make
+    up the prompt; the model is only called for inputs that have not been seen before.
+    """
+
+    def __init__(self, namespace, store=None):
+        self.namespace = namespace
+        self.store = store or SQLiteCacheStore("llm_extractions")
+        self.stats = {"hits": 0, "misses": 0}
+
+    def normalize(self, text):
+        return " ".join(str(text or "").split()).casefold()
+
+    def key(self, texts):
+        return cache_key(self.namespace, *(self.normalize(text) for text in texts))
+
+    def get_or_extract(self, texts, extract):
+        """
+        Return the cached extraction for texts, or call extract() and cache its result.
+        Failed extractions (None) are not cached so they are retried on the next run.
+        """
+        key = self.key(texts)
+        cached = self.store.get_json(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        self.stats["misses"] += 1
+        result = extract()
+        if result is not None:
+            self.store.set_json(key, result)
+        return result
+
+    def log_stats(self, logger):
+        logger.info(f"LLM cache ({self.namespace}): {self.stats['hits']} hits, {self.stats['misses']} misses.")
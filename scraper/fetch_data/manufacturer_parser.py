@@ -0,0 +1,116 @@
+import re
+
+MANUFACTURER_FIELDS = ("Manufactured By", "Manufactured For", "Distributed By")
+
+# Label phrases found on DailyMed package inserts, mapped to the field they introduce
+LABEL_RE = re.compile(
+    r"\b(?:"
+    r"(?P<manufactured_by>manufactured\s+by|mfd\.?\s+by|made\s+by)"
+    r"|(?P<manufactured_for>manufactured\s+for|mfd\.?\s+for|made\s+for)"
+    r"|(?P<distributed_by>distributed\s+(?:and\s+marketed\s+)?by|marketed\s+(?:and\s+distributed\s+)?by|dist\.?\s+by)"
+    r")\s*[:\-]?\s*",
+    re.IGNORECASE,
+)
+LABEL_FIELDS = {
+    "manufactured_by": "Manufactured By",
+    "manufactured_for": "Manufactured For",
+    "distributed_by": "Distributed By",
+}
+
+# Text that ends a manufacturer block (revision notes, origin lines, label boilerplate)
+END_RE = re.compile(
+    r"\b(?:revised|rev\.|iss\.|issued|made\s+in|product\s+of|rx\s+only|for\s+more\s+information"
+    r"|to\s+report|call\s+(?:toll[\s-]free\s+)?1-|package\s+label|principal\s+display\s+panel|www\.)"
+    r"|©|\(c\)",
+    re.IGNORECASE,
+)
+
+COMPANY_RE = re.compile(
+    r"\b(?:inc|llc|l\.l\.c|ltd|limited|corp|corporation|co|company|pharma\w*|laboratories|labs?"
+    r"|gmbh|s\.a|ag|plc|pvt|lp|l\.p|usa)\b",
+    re.IGNORECASE,
+)
+ADDRESS_RE = re.compile(
+    r"\b[A-Z]{2}\s+\d{5}(?:-\d{4})?\b"
+    r"|\b(?:india|china|canada|israel|germany|switzerland|italy|japan|ireland|france|spain|u\.?s\.?a\.?)\b",
+    re.IGNORECASE,
+)
+
+MIN_VALUE_LENGTH = 3
+MAX_VALUE_LENGTH = 250
+
+
+class ManufacturerParser:
+    """
+    Rule-based extraction of Manufactured By / Manufactured For / Distributed By from the
+    label text of a DailyMed listing.
+
+    Each result comes with a confidence between 0 and 1; extract() only falls back to the
+    LLM when the rules are not confident enough.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.stats = {"parsed": 0, "fallback": 0}
+
+    def clean_value(self, value):
+        end = END_RE.search(value)
+        if end:
+            value = value[:end.start()]
+        return " ".join(value.split()).strip(" ,;:.-")
+
+    def score_value(self, value):
+        if not MIN_VALUE_LENGTH <= len(value) <= MAX_VALUE_LENGTH:
+            return 0.0
+        score = 0.5
+        if COMPANY_RE.search(value):
+            score += 0.3
+        if ADDRESS_RE.search(value):
+            score += 0.2
+        return score
+
+    def parse(self, text):
+        """
+        Return (fields, confidence) for a label text. Missing fields are empty strings; the
+        confidence is 0 when no label phrase is found.
+        """
+        fields = dict.fromkeys(MANUFACTURER_FIELDS, "")
+        matches = list(LABEL_RE.finditer(text or ""))
+        if not matches:
+            return fields, 0.0
+
+        scores = []
+        ambiguous = False
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+            value = self.clean_value(text[match.end():end])
+            field = LABEL_FIELDS[match.lastgroup]
+            if fields[field] and value and value != fields[field]:
+                # The same label with different values (several sites) needs a human-like merge
+                ambiguous = True
+                continue
+            fields[field] = fields[field] or value
+            scores.append(self.score_value(value))
+
+        confidence = min(scores) if scores else 0.0
+        if ambiguous:
+            confidence = min(confidence, 0.5)
+        return fields, confidence
+
+    def extract(self, text, fallback):
+        """
+        Return the parsed fields for text when the rules are confident, otherwise the result
+        of fallback().
+        """
+        fields, confidence = self.parse(text)
+        if confidence >= self.threshold:
+            self.stats["parsed"] += 1
+            return fields
+        self.stats["fallback"] += 1
+        return fallback()
+
+    def log_stats(self, logger):
+        logger.info(
+            f"Manufacturer parser: {self.stats['parsed']} parsed locally, "
+            f"{self.stats['fallback']} sent to the LLM."
+        )
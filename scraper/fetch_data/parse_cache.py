@@ -0,0 +1,87 @@
+import atexit
+import json
+import sys
+import threading
+from .cache_store import SQLiteCacheStore
+
+
+class GenericParseCache:
+    """
+    Parsed generic strings keyed by the raw string, shared by every DataWrangling in the process.
+
+    All entries for the namespace are loaded into an interned dictionary on first use and new
+    parses are written back in batches, so each distinct string is parsed once per deployment
+    rather than once per call site per run. The namespace identifies the parser rules; entries
+    parsed under other rules are never returned.
+    """
+
+    SAVE_EVERY = 500  # New entries kept in memory before they are written back
+
+    def __init__(self, namespace, store=None):
+        self.prefix = f"{namespace}:"
+        self.store = store or SQLiteCacheStore("generic_parses")
+        self.lock = threading.Lock()
+        self.values = {
+            sys.intern(key[len(self.prefix):]): tuple(json.loads(value))
+            for key, value in self.store.scan(self.prefix)
+        }
+        self.unsaved = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, raw):
+        parsed = self.values.get(raw)
+        self.stats["hits" if parsed is not None else "misses"] += 1
+        return parsed
+
+    def update(self, parsed_values):
+        with self.lock:
+            for raw, parsed in parsed_values:
+                raw = sys.intern(raw)
+                self.values[raw] = self.unsaved[raw] = tuple(parsed)
+            if len(self.unsaved) >= self.SAVE_EVERY:
+                self.save_locked()
+
+    def get_or_parse(self, raw, parse):
+        """
+        Return the cached parse of raw, or parse it and cache the result. Non-string values are
+        passed straight to parse.
+        """
+        if not isinstance(raw, str):
+            return parse(raw)
+        parsed = self.get(raw)
+        if parsed is None:
+            parsed = tuple(parse(raw))
+            self.update([(raw, parsed)])
+        return parsed
+
+    def save(self):
+        with self.lock:
+            self.save_locked()
+
+    def save_locked(self):
+        if self.unsaved:
+            self.store.set_many(
+                (self.prefix + raw, json.dumps(parsed).encode("utf-8")) for raw, parsed in self.unsaved.items()
+            )
+            self.unsaved = {}
+
+    def log_stats(self, logger):
+        logger.info(
+            f"Generic parse cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+            f"{len(self.values)} entries."
+        )
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_parse_cache(namespace):
+    """
+    Return the process-wide parse cache for a namespace, loading it on first use.
+    """
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = GenericParseCache(namespace)
+            atexit.register(_caches[namespace].save)
+        return _caches[namespace]
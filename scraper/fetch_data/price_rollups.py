@@ -0,0 +1,64 @@
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+from statistics import median
+from scraper.models import FSSPricing, PriceRangeRollup
+
+logger = logging.getLogger(__name__)
+
+GROUP_FIELDS = ["ingredient", "strength", "dosage_form", "route"]
+CENTS = Decimal("0.01")
+
+
+def drug_group(drug):
+    return tuple(getattr(drug, field) for field in GROUP_FIELDS)
+
+
+def summarize_price_ranges(pricing_rows):
+    """
+    Group (ingredient, strength, dosage_form, route, price_type, price) rows and return the
+    rollup values of each (group, price_type): min, max, median and count of its prices.
+    """
+    prices = {}
+    for *key, price in pricing_rows:
+        prices.setdefault(tuple(key), []).append(price)
+    return {
+        key: {
+            "min_price": min(group_prices),
+            "max_price": max(group_prices),
+            "median_price": Decimal(median(group_prices)).quantize(CENTS, rounding=ROUND_HALF_UP),
+            "pricing_count": len(group_prices),
+        }
+        for key, group_prices in prices.items()
+    }
+
+
+def refresh_price_rollups(groups=None, batch_size=1000):
+    """
+    Recompute the rollup rows of the given (ingredient, strength, dosage_form, route) groups
+    from FSSPricing, or of every group when groups is None. Groups left without pricings lose
+    their rows. Returns the number of rollup rows written.
+    """
+    pricings = FSSPricing.objects.values_list(*(f"drug__{field}" for field in GROUP_FIELDS), "price_type", "price")
+    rollups = PriceRangeRollup.objects.all()
+    if groups is not None:
+        groups = set(groups)
+        if not groups:
+            return 0
+        # Narrow both sides by ingredient in SQL and to the exact groups in Python
+        ingredients = {group[0] for group in groups}
+        pricings = [row for row in pricings.filter(drug__ingredient__in=ingredients) if tuple(row[:4]) in groups]
+        rollups = [rollup.id for rollup in rollups.filter(ingredient__in=ingredients) if drug_group(rollup) in groups]
+        PriceRangeRollup.objects.filter(id__in=rollups).delete()
+    else:
+        rollups.delete()
+
+    summaries = summarize_price_ranges(pricings)
+    PriceRangeRollup.objects.bulk_create(
+        [
+            PriceRangeRollup(**dict(zip(GROUP_FIELDS + ["price_type"], key)), **values)
+            for key, values in summaries.items()
+        ],
+        batch_size=batch_size,
+    )
+    logger.info(f"Refreshed {len(summaries)} price range rollups.")
+    return len(summaries)
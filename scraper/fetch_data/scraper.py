@@ -1,21 +1,46 @@
 import os
 import re
 import threading
+from functools import partial
 import pandas as pd
-import requests
+from django.db import connections
 from selenium import webdriver
 from .fetch_from_orange_book import FetchOrangeBook
-from .data_wrangling import DataWrangling
+from .data_wrangling import RECORDS_DIR, DataWrangling, cleaned_data_path
 from .fetch_from_daily_med import FetchDailyMed
 from .fetch_from_sam_gov import FetchSamGov
 
 from .fetch_asph import AsphDrugShortageScraper
 from .fetch_access_data import AccessDataShortageScraper
+from .http_client import get_fetch_client
+from .shards import merge_shards
 from queue import Queue
 
+# Shards each source is split into when the pipeline runs as Celery tasks
+SOURCE_SHARDS = {
+    "orange_book": 4,
+    "daily_med": 8,
+    "sam_gov": 4,
+    "asph": 1,
+    "access_data": 1,
+}
+
+# Files written per shard, and whether rows repeated across shards are dropped when merging
+SHARDED_OUTPUTS = {
+    "orange_book": [(os.path.join(RECORDS_DIR, "orange_book", "orange_book_records.csv"), True)],
+    "daily_med": [
+        (os.path.join(RECORDS_DIR, "daily_med", "packager_data_daily_med.csv"), False),
+        (os.path.join(RECORDS_DIR, "daily_med", "drug_data_daily_med.csv"), False),
+    ],
+    "sam_gov": [(os.path.join(RECORDS_DIR, "sam_gov", "sam_gov_records.csv"), True)],
+}
+
+
 class PharmaScraper:
-    def __init__(self, logger):
+    def __init__(self, logger, resume=False):
         self.logger = logger
+        # Continue the Orange Book, DailyMed and SAM.gov scrapers from their last checkpoints
+        self.resume = resume
         self.driver = None
         self.raw_file_name = "vaFssPharmPrices.xlsx"
         self.error_queue = Queue()
@@ -27,10 +52,9 @@ class PharmaScraper:
                 self.logger.info(f"Existing file '{self.raw_file_name}' deleted.")
 
             self.logger.info("Downloading new File...")
-            response = requests.get(url)
-            if response.status_code == 200:
-                with open(self.raw_file_name, 'wb') as f:
-                    f.write(response.content)
+            # Streamed to disk and resumed after a dropped connection
+            response = get_fetch_client().download(url, self.raw_file_name)
+            if response is not None:
                 self.logger.info("File downloaded successfully.")
             else:
                 raise Exception("Failed to download the file.")
@@ -38,31 +62,57 @@ class PharmaScraper:
             self.logger.error(f"Error in download_file: {str(e)}")
             self.error_queue.put(str(e))
 
-    def run(self):
+    def prepare(self):
+        """
+        Download and clean the FSS price file that every source scrapes from.
+        """
         file_link = "https://www.va.gov/opal/docs/nac/fss/vaFssPharmPrices.xlsx"
-        self.download_file(file_link)
-
         self.data_Wrangler = DataWrangling()
-        try:
-            self.data_Wrangler.prepare_data(self.raw_file_name)
-        except Exception as e:
-            self.logger.error(f"Error in prepare_data: {str(e)}")
-            self.error_queue.put(str(e))
+        if self.resume and os.path.exists(cleaned_data_path()):
+            # A new price file would not match the checkpoints, so resume on the one already cleaned
+            self.logger.info("Resuming on the existing cleaned price data.")
+        else:
+            self.download_file(file_link)
+            try:
+                self.data_Wrangler.prepare_data(self.raw_file_name)
+            except Exception as e:
+                self.logger.error(f"Error in prepare_data: {str(e)}")
+                self.error_queue.put(str(e))
+        self.data_Wrangler.parse_cache.save()
+
+    def scrape_source(self, source, shard=None):
+        """
+        Scrape one source, or one (index, total) shard of it into the shard's own files. A
+        shard raises when it fails, so it is retried rather than merged with missing rows.
+        """
+        get_fetch_client().set_shard(shard)
+        if source == "orange_book":
+            FetchOrangeBook(self.logger, resume=self.resume, shard=shard).process_csv_file()
+        elif source == "daily_med":
+            FetchDailyMed(self.logger, resume=self.resume, shard=shard).get_data_from_daily_mad()
+        elif source == "sam_gov":
+            FetchSamGov(self.logger, resume=self.resume, shard=shard).process_contract_numbers()
+        elif source == "asph":
+            AsphDrugShortageScraper(self.logger).scrape_and_save()
+        elif source == "access_data":
+            AccessDataShortageScraper(self.logger).scrape_and_save()
+        else:
+            raise ValueError(f"Unknown source: {source}")
 
-        
-        self.orange_book_scraper = FetchOrangeBook(self.logger)
-        self.daily_med_scraper = FetchDailyMed(self.logger)
-        self.sam_gov_scraper = FetchSamGov(self.logger)
+    def merge_source_shards(self, source, total):
+        """
+        Combine the shard files of a source into the files a single run writes.
+        """
+        for path, dedupe in SHARDED_OUTPUTS[source]:
+            rows = merge_shards(path, total, dedupe=dedupe)
+            self.logger.info(f"Merged {total} shards into {path} ({rows} rows).")
 
-        self.asph_scraper = AsphDrugShortageScraper(self.logger)
-        self.access_data_scraper = AccessDataShortageScraper(self.logger)
+    def run(self):
+        self.prepare()
 
         threads = [
-            threading.Thread(target=self.thread_wrapper, args=(self.orange_book_scraper.process_csv_file,)),
-            threading.Thread(target=self.thread_wrapper, args=(self.daily_med_scraper.get_data_from_daily_mad,)),
-            threading.Thread(target=self.thread_wrapper, args=(self.sam_gov_scraper.process_contract_numbers,)),
-            threading.Thread(target=self.thread_wrapper, args=(self.asph_scraper.scrape_and_save,)),
-            threading.Thread(target=self.thread_wrapper, args=(self.access_data_scraper.scrape_and_save,))
+            threading.Thread(target=self.thread_wrapper, args=(partial(self.scrape_source, source),))
+            for source in SOURCE_SHARDS
         ]
 
         for thread in threads:
@@ -71,6 +121,11 @@ class PharmaScraper:
         for thread in threads:
             thread.join()
 
+        if get_fetch_client().cache:
+            get_fetch_client().cache.log_stats()
+        self.data_Wrangler.parse_cache.save()
+        self.data_Wrangler.parse_cache.log_stats(self.logger)
+
         if not self.error_queue.empty():
             while not self.error_queue.empty():
                 self.logger.error(f"Thread error: {self.error_queue.get()}")
@@ -84,6 +139,9 @@ class PharmaScraper:
         except Exception as e:
             self.logger.error(f"Error in thread {threading.current_thread().name}: {str(e)}")
             self.error_queue.put(str(e))
+        finally:
+            # Checkpoints are saved from this thread
+            connections.close_all()
         
 
 
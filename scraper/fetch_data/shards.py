@@ -0,0 +1,63 @@
+import csv
+import os
+
+
+def shard_bounds(count, shard):
+    """
+    Start and end of a shard's contiguous slice of `count` items. A shard is (index, total);
+    None stands for every item.
+    """
+    if shard is None:
+        return 0, count
+    index, total = shard
+    return count * index // total, count * (index + 1) // total
+
+
+def shard_name(name, shard):
+    return name if shard is None else f"{name}:{shard[0]}of{shard[1]}"
+
+
+def shard_path(path, shard):
+    """
+    Output file of one shard, next to the file a whole run writes.
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard[0]}of{shard[1]}{ext}"
+
+
+def merge_shards(path, total, dedupe=False):
+    """
+    Concatenate the `total` shard files of path into path, in shard order, and remove them.
+    With dedupe, rows already written by an earlier shard are dropped, as a single run's
+    writer does. Returns the number of rows written.
+
+    Raises FileNotFoundError, before writing anything, if a shard's file is missing.
+    """
+    shard_paths = [shard_path(path, (index, total)) for index in range(total)]
+    for index, shard_file_path in enumerate(shard_paths):
+        if not os.path.exists(shard_file_path):
+            raise FileNotFoundError(f"Shard {index + 1}/{total} of {path} is missing: {shard_file_path}")
+
+    rows_written = 0
+    seen = set()
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        for index, shard_file_path in enumerate(shard_paths):
+            with open(shard_file_path, newline="", encoding="utf-8") as shard_file:
+                reader = csv.reader(shard_file)
+                header = next(reader, None)
+                if index == 0 and header is not None:
+                    writer.writerow(header)
+                for row in reader:
+                    if dedupe:
+                        key = tuple(row)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    writer.writerow(row)
+                    rows_written += 1
+    for shard_file_path in shard_paths:
+        os.remove(shard_file_path)
+    return rows_written
@@ -0,0 +1,411 @@
+import io
+import json
+import logging
+import os
+import re
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+import pandas as pd
+from django.db import connection, transaction
+from scraper.models import (
+    AccessDrugShortageData, AsphDrugShortageData, FSSContract, FSSDrug, Manufacturer, PotentialLead,
+)
+from .data_wrangling import RECORDS_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def to_text(value):
+    """Optional text: blank or missing values become NULL."""
+    if value is None or pd.isna(value) or not str(value).strip():
+        return None
+    return str(value).strip()
+
+
+def to_key_text(value):
+    """Text used in a unique key: missing values become an empty string so they still conflict."""
+    return to_text(value) or ""
+
+
+def to_required_text(value):
+    value = to_text(value)
+    if value is None:
+        raise ValueError("value is required")
+    return value
+
+
+def to_required_date(value):
+    parsed = pd.to_datetime(value, errors="coerce")
+    if pd.isna(parsed):
+        raise ValueError(f"invalid date {value!r}")
+    return parsed.date().isoformat()
+
+
+def to_numeric(value):
+    value = to_text(value)
+    if value is None:
+        return None
+    try:
+        return str(Decimal(value.replace("$", "").replace(",", "")))
+    except InvalidOperation:
+        raise ValueError(f"invalid number {value!r}")
+
+
+def to_quantity_text(value):
+    value = to_text(value)
+    return value.replace(",", "") if value else None
+
+
+def to_image_urls(value):
+    value = to_text(value)
+    if value is None:
+        return None
+    try:
+        urls = json.loads(value)
+    except json.JSONDecodeError:
+        urls = [url.strip() for url in value.split(",") if url.strip()]
+    return json.dumps(urls)
+
+
+# Each source lists its staging columns as (column, SQL type, CSV column, converter) and the
+# statements that merge the staging table into the target model. "{staging}" is the staging table.
+STAGING_SOURCES = {
+    "orange_book": {
+        "columns": [
+            ("active_ingredient", "varchar(300)", "Ingredient", to_required_text),
+            ("applicant_holder", "varchar(255)", "Applicant Holder", to_required_text),
+            ("application_number", "varchar(100)", "Appl. No.", to_key_text),
+            ("te_code", "varchar(80)", "TE Code", to_key_text),
+            ("market_status", "varchar(100)", "Mkt.Status", to_required_text),
+            ("dosage_form", "varchar(300)", "Dosage Form", to_key_text),
+            ("route", "varchar(300)", "Route", to_key_text),
+            ("strength", "varchar(300)", "Strength", to_key_text),
+        ],
+        "merge": [
+            """
+            INSERT INTO scraper_potentiallead (
+                active_ingredient, applicant_holder, application_number, te_code,
+                market_status, dosage_form, route, strength
+            )
+            SELECT DISTINCT active_ingredient, applicant_holder, application_number, te_code,
+                market_status, dosage_form, route, strength
+            FROM {staging}
+            ON CONFLICT (
+                active_ingredient, applicant_holder, application_number, te_code,
+                market_status, dosage_form, route, strength
+            ) DO NOTHING
+            """,
+        ],
+    },
+    "access_data_drug_shortage": {
+        "columns": [
+            ("generic_name", "varchar(500)", "GENERIC NAME", to_required_text),
+            ("shortage_status", "varchar(255)", "SHORTAGE STATUS", to_key_text),
+        ],
+        "merge": [
+            """
+            INSERT INTO scraper_accessdrugshortagedata (generic_name, shortage_status)
+            SELECT DISTINCT ON (generic_name) generic_name, shortage_status
+            FROM {staging}
+            ORDER BY generic_name, staging_row DESC
+            ON CONFLICT (generic_name) DO UPDATE SET shortage_status = EXCLUDED.shortage_status
+            """,
+        ],
+    },
+    "asph_drug_shortage": {
+        "columns": [
+            ("generic_name", "varchar(255)", "GENERIC NAME", to_required_text),
+            ("shortage_status", "varchar(255)", "SHORTAGE STATUS", to_text),
+            ("revision_date", "date", "REVISION DATE", to_required_date),
+            ("created_date", "date", "CREATED DATE", to_required_date),
+        ],
+        "merge": [
+            """
+            INSERT INTO scraper_asphdrugshortagedata (generic_name, shortage_status, revision_date, created_date)
+            SELECT DISTINCT ON (generic_name) generic_name, shortage_status, revision_date, created_date
+            FROM {staging}
+            ORDER BY generic_name, staging_row DESC
+            ON CONFLICT (generic_name) DO UPDATE SET
+                shortage_status = EXCLUDED.shortage_status,
+                revision_date = EXCLUDED.revision_date,
+                created_date = EXCLUDED.created_date
+            """,
+        ],
+    },
+    "sam_gov": {
+        "columns": [
+            ("contract_number", "varchar(50)", "ContractNumber", to_required_text),
+            ("awardee", "varchar(255)", "Awardee", to_text),
+            ("awarded_value", "numeric(12, 2)", "Awarded Value", to_numeric),
+            ("estimated_annual_quantities", "varchar(255)", "Estimated Annual Quantities", to_quantity_text),
+        ],
+        "merge": [
+            """
+            UPDATE scraper_fsscontract AS contract SET
+                awardee = staged.awardee,
+                awarded_value = staged.awarded_value,
+                estimated_annual_quantities = staged.estimated_annual_quantities
+            FROM (
+                SELECT DISTINCT ON (contract_number) *
+                FROM {staging}
+                ORDER BY contract_number, staging_row DESC
+            ) AS staged
+            WHERE contract.contract_number = staged.contract_number
+            """,
+        ],
+    },
+    "daily_med": {
+        "columns": [
+            ("ndc_code", "varchar(50)", "NDC Code", to_required_text),
+            ("manufactured_by", "varchar(500)", "Manufactured By", to_text),
+            ("manufactured_for", "varchar(500)", "Manufactured For", to_text),
+            ("distributed_by", "varchar(500)", "Distributed By", to_text),
+            ("image_urls", "jsonb", "Image URLs", to_image_urls),
+        ],
+        "merge": [
+            """
+            INSERT INTO scraper_manufacturer (name)
+            SELECT DISTINCT names.name
+            FROM (
+                SELECT manufactured_by AS name FROM {staging}
+                UNION SELECT manufactured_for FROM {staging}
+                UNION SELECT distributed_by FROM {staging}
+            ) AS names
+            WHERE names.name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM scraper_manufacturer m WHERE m.name = names.name)
+            """,
+            """
+            UPDATE scraper_fssdrug AS drug SET
+                manufactured_by_id = (SELECT MIN(id) FROM scraper_manufacturer WHERE name = staged.manufactured_by),
+                manufactured_for_id = (SELECT MIN(id) FROM scraper_manufacturer WHERE name = staged.manufactured_for),
+                distributed_by_id = (SELECT MIN(id) FROM scraper_manufacturer WHERE name = staged.distributed_by),
+                image_urls = COALESCE(staged.image_urls, drug.image_urls)
+            FROM (
+                SELECT DISTINCT ON (ndc_code) *
+                FROM {staging}
+                ORDER BY ndc_code, staging_row DESC
+            ) AS staged
+            WHERE drug.ndc_with_dashes = staged.ndc_code
+            """,
+        ],
+    },
+}
+
+
+def python_value(sql_type, value):
+    """Staged text value as the Python type the ORM expects for the column."""
+    if value is None:
+        return None
+    if sql_type.startswith("numeric"):
+        return Decimal(value)
+    if sql_type == "date":
+        return date.fromisoformat(value)
+    if sql_type == "jsonb":
+        return json.loads(value)
+    return value
+
+
+def latest_rows(rows, key):
+    # The last row staged for a key wins, as DISTINCT ON ... ORDER BY staging_row DESC does
+    return list({row[key]: row for row in rows}.values())
+
+
+def merge_orange_book(rows):
+    leads = {tuple(row.values()): PotentialLead(**row) for row in rows}
+    before = PotentialLead.objects.count()
+    PotentialLead.objects.bulk_create(leads.values(), ignore_conflicts=True)
+    return PotentialLead.objects.count() - before
+
+
+def merge_access_data_drug_shortage(rows):
+    rows = latest_rows(rows, "generic_name")
+    AccessDrugShortageData.objects.bulk_create(
+        [AccessDrugShortageData(**row) for row in rows],
+        update_conflicts=True, unique_fields=["generic_name"], update_fields=["shortage_status"],
+    )
+    return len(rows)
+
+
+def merge_asph_drug_shortage(rows):
+    rows = latest_rows(rows, "generic_name")
+    AsphDrugShortageData.objects.bulk_create(
+        [AsphDrugShortageData(**row) for row in rows],
+        update_conflicts=True, unique_fields=["generic_name"],
+        update_fields=["shortage_status", "revision_date", "created_date"],
+    )
+    return len(rows)
+
+
+def merge_sam_gov(rows):
+    fields = ["awardee", "awarded_value", "estimated_annual_quantities"]
+    rows = {row["contract_number"]: row for row in latest_rows(rows, "contract_number")}
+    contracts = list(FSSContract.objects.filter(contract_number__in=list(rows)))
+    for contract in contracts:
+        for field in fields:
+            setattr(contract, field, rows[contract.contract_number][field])
+    FSSContract.objects.bulk_update(contracts, fields)
+    return len(contracts)
+
+
+def merge_daily_med(rows):
+    name_fields = ["manufactured_by", "manufactured_for", "distributed_by"]
+    rows = {row["ndc_code"]: row for row in latest_rows(rows, "ndc_code")}
+    names = {row[field] for row in rows.values() for field in name_fields if row[field] is not None}
+    existing = set(Manufacturer.objects.filter(name__in=names).values_list("name", flat=True))
+    Manufacturer.objects.bulk_create([Manufacturer(name=name) for name in names - existing])
+    manufacturer_ids = {}
+    for manufacturer_id, name in Manufacturer.objects.filter(name__in=names).order_by("-id").values_list("id", "name"):
+        manufacturer_ids[name] = manufacturer_id  # The lowest id of a name wins, as MIN(id) does
+
+    drugs = list(FSSDrug.objects.filter(ndc_with_dashes__in=list(rows)))
+    for drug in drugs:
+        row = rows[drug.ndc_with_dashes]
+        for field in name_fields:
+            setattr(drug, f"{field}_id", manufacturer_ids.get(row[field]))
+        if row["image_urls"] is not None:
+            drug.image_urls = row["image_urls"]
+    FSSDrug.objects.bulk_update(drugs, [f"{field}_id" for field in name_fields] + ["image_urls"])
+    return len(drugs)
+
+
+# Equivalent merges through the ORM for databases other than PostgreSQL
+ORM_MERGES = {
+    "orange_book": merge_orange_book,
+    "access_data_drug_shortage": merge_access_data_drug_shortage,
+    "asph_drug_shortage": merge_asph_drug_shortage,
+    "sam_gov": merge_sam_gov,
+    "daily_med": merge_daily_med,
+}
+
+
+class CSVStagingLoader:
+    """
+    Loads scraped CSV data through an unlogged PostgreSQL staging table.
+
+    Rows are type-checked first; rows that fail are written to a rejected-rows file instead
+    of aborting the load. The remaining rows are streamed in with COPY FROM STDIN and merged
+    into the target table with set-based statements. On other databases the checked rows
+    are merged through the ORM instead.
+    """
+
+    def __init__(self, rejected_dir=None):
+        self.rejected_dir = rejected_dir or os.path.join(RECORDS_DIR, "rejected")
+
+    def stage_rows(self, source, df):
+        """
+        Convert and check each row, returning the staged value lists (starting with the row
+        number) and the rejected rows.
+        """
+        columns = STAGING_SOURCES[source]["columns"]
+        staged_rows = []
+        rejected_rows = []
+
+        for row_number, record in enumerate(df.to_dict(orient="records")):
+            try:
+                values = [row_number]
+                for column, sql_type, csv_column, converter in columns:
+                    try:
+                        values.append(self.check_value(sql_type, converter(record.get(csv_column))))
+                    except ValueError as e:
+                        raise ValueError(f"{csv_column}: {e}")
+            except ValueError as e:
+                rejected_rows.append({**record, "Rejection Reason": str(e)})
+                continue
+            staged_rows.append(values)
+
+        return staged_rows, rejected_rows
+
+    def csv_buffer(self, staged_rows):
+        buffer = io.StringIO()
+        for values in staged_rows:
+            buffer.write(",".join(self.format_csv_value(value) for value in values) + "\n")
+        buffer.seek(0)
+        return buffer
+
+    def check_value(self, sql_type, value):
+        """
+        Raise ValueError for a value its column can't hold, so the row is rejected instead of
+        failing the COPY of the whole source.
+        """
+        if value is None:
+            return value
+        max_length = re.fullmatch(r"varchar\((\d+)\)", sql_type)
+        if max_length and len(value) > int(max_length.group(1)):
+            raise ValueError(f"longer than {max_length.group(1)} characters")
+        numeric = re.fullmatch(r"numeric\((\d+),\s*(\d+)\)", sql_type)
+        if numeric:
+            precision, scale = (int(group) for group in numeric.groups())
+            number = Decimal(value)
+            if not number.is_finite():
+                raise ValueError(f"{value} is not a finite number")
+            # Compared before and after rounding to the scale, as 99.999 rounds up to 100.00
+            limit = Decimal(10) ** (precision - scale)
+            if abs(number) >= limit or abs(number.quantize(Decimal(1).scaleb(-scale), ROUND_HALF_UP)) >= limit:
+                raise ValueError(f"{value} has more than {precision - scale} integer digits")
+        return value
+
+    def format_csv_value(self, value):
+        # Unquoted empty fields are NULL in COPY's CSV format; quoted ones are empty strings
+        if value is None:
+            return ""
+        return '"' + str(value).replace('"', '""') + '"'
+
+    def copy_into_staging(self, cursor, staging_table, column_names, buffer):
+        sql = f"COPY {staging_table} ({', '.join(column_names)}) FROM STDIN WITH (FORMAT csv)"
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, "copy_expert"):
+            # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+    def save_rejected_rows(self, source, rejected_rows):
+        os.makedirs(self.rejected_dir, exist_ok=True)
+        file_path = os.path.join(self.rejected_dir, f"{source}_rejected_rows.csv")
+        if rejected_rows:
+            pd.DataFrame(rejected_rows).to_csv(file_path, index=False)
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+
+    def load(self, source, df):
+        """
+        Stage and merge a scraped DataFrame, returning counts of staged, rejected and merged rows.
+        """
+        spec = STAGING_SOURCES[source]
+        staged_rows, rejected_rows = self.stage_rows(source, df)
+        self.save_rejected_rows(source, rejected_rows)
+        if rejected_rows:
+            logger.warning(f"{len(rejected_rows)} {source} rows rejected, see {self.rejected_dir}.")
+
+        if connection.vendor == "postgresql":
+            merged_rows = self.merge_through_staging(source, spec, staged_rows)
+        else:
+            rows = [
+                {column: python_value(sql_type, value) for (column, sql_type, _, _), value in zip(spec["columns"], values[1:])}
+                for values in staged_rows
+            ]
+            with transaction.atomic():
+                merged_rows = ORM_MERGES[source](rows)
+
+        logger.info(f"{source}: {len(staged_rows)} rows staged, {len(rejected_rows)} rejected, {merged_rows} merged.")
+        return {"staged": len(staged_rows), "rejected": len(rejected_rows), "merged": merged_rows}
+
+    def merge_through_staging(self, source, spec, staged_rows):
+        staging_table = f"staging_{source}"
+        column_names = ["staging_row"] + [column for column, _, _, _ in spec["columns"]]
+        column_definitions = ", ".join(
+            ["staging_row integer"] + [f"{column} {sql_type}" for column, sql_type, _, _ in spec["columns"]]
+        )
+
+        merged_rows = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {staging_table} ({column_definitions})")
+            cursor.execute(f"TRUNCATE {staging_table}")
+            self.copy_into_staging(cursor, staging_table, column_names, self.csv_buffer(staged_rows))
+            for statement in spec["merge"]:
+                cursor.execute(statement.format(staging=staging_table))
+                merged_rows += max(cursor.rowcount, 0)
+            cursor.execute(f"TRUNCATE {staging_table}")
+        return merged_rows
@@ -0,0 +1,51 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.fetch_data.data_wrangling import DataWrangling
+
+
+class Command(BaseCommand):
+    help = "Compare the row-by-row and vectorized generic-name parsers on the FSS price file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default="vaFssPharmPrices.xlsx", help="FSS price file (xlsx or csv)")
+        parser.add_argument("--column", default="Generic")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per parser; the best time is reported")
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        try:
+            df = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {path}")
+        generic = df[options["column"]]
+        wrangler = DataWrangling()
+
+        def best_time(parse):
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                result = parse()
+                timings.append(time.perf_counter() - start)
+            return min(timings), result
+
+        row_time, expected = best_time(lambda: [wrangler.parse_generic_value(value) for value in generic])
+        vector_time, parsed = best_time(lambda: wrangler.parse_generic_column(generic, use_cache=False))
+        wrangler.parse_generic_column(generic)
+        cached_time, cached = best_time(lambda: wrangler.parse_generic_column(generic))
+
+        mismatches = sum(
+            tuple(row) != values or tuple(cached_row) != values
+            for row, cached_row, values in zip(
+                parsed.itertuples(index=False), cached.itertuples(index=False), expected
+            )
+        )
+        self.stdout.write(f"Rows: {len(generic)} ({generic.nunique()} distinct)")
+        self.stdout.write(f"Row by row: {row_time:.3f}s")
+        self.stdout.write(f"Vectorized: {vector_time:.3f}s ({row_time / vector_time:.1f}x faster)")
+        self.stdout.write(f"Vectorized, parse cache warm: {cached_time:.3f}s ({row_time / cached_time:.1f}x faster)")
+        if mismatches:
+            raise CommandError(f"{mismatches} rows differ between the two parsers")
+        self.stdout.write(self.style.SUCCESS("Outputs are identical"))
@@ -0,0 +1,45 @@
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.fetch_data.data_wrangling import DataWrangling, cleaned_data_path, read_cleaned_data
+from scraper.fetch_data.fetch_from_orange_book import plan_search_terms
+
+
+class Command(BaseCommand):
+    help = "Compare Orange Book searches per ingredient with the planned searches per distinct term"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            help="FSS price file (xlsx or csv) to parse ingredients from; defaults to the cleaned data artifact",
+        )
+        parser.add_argument("--column", default="Generic")
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        try:
+            if path:
+                df = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
+                ingredients = DataWrangling().parse_generic_column(df[options["column"]])["Ingredient"]
+            else:
+                path = cleaned_data_path()
+                ingredients = read_cleaned_data(columns=["Ingredient"])["Ingredient"]
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {path}")
+
+        # process_csv_file searches once per Ingredient group
+        ingredients = [ingredient for ingredient in ingredients.dropna().unique() if ingredient.split()]
+        multi_word = sum(len(ingredient.split()) > 1 for ingredient in ingredients)
+        first_terms, fallback_terms = plan_search_terms(ingredients)
+
+        # Two-word searches only happen when the first word finds nothing, so without fetching
+        # they can only be bounded
+        self.stdout.write(f"Ingredients: {len(ingredients)} (from {path})")
+        self.stdout.write(f"Per ingredient: {len(ingredients)} to {len(ingredients) + multi_word} searches")
+        self.stdout.write(
+            f"Planned: {len(first_terms)} to {len(first_terms) + len(fallback_terms)} searches"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(ingredients) - len(first_terms)} first-word searches saved "
+            f"({len(ingredients) / max(len(first_terms), 1):.1f} ingredients per search)"
+        ))
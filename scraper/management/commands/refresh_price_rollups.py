@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scraper.fetch_data.price_rollups import refresh_price_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild every price range rollup from FSSPricing, e.g. after pricings were edited outside the FSS ingest"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = refresh_price_rollups()
+        self.stdout.write(f"Wrote {written} price range rollups.")
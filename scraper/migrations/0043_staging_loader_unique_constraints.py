@@ -0,0 +1,62 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+LEAD_FIELDS = [
+    'active_ingredient', 'applicant_holder', 'application_number', 'te_code',
+    'market_status', 'dosage_form', 'route', 'strength',
+]
+OPTIONAL_LEAD_FIELDS = ['application_number', 'te_code', 'dosage_form', 'route', 'strength']
+
+
+def delete_duplicates(model, fields):
+    seen = set()
+    duplicate_ids = []
+    for row in model.objects.order_by('id').values('id', *fields):
+        key = tuple(row[field] for field in fields)
+        if key in seen:
+            duplicate_ids.append(row['id'])
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicate_ids), 1000):
+        model.objects.filter(id__in=duplicate_ids[start:start + 1000]).delete()
+
+
+def dedupe_staged_tables(apps, schema_editor):
+    PotentialLead = apps.get_model('scraper', 'PotentialLead')
+    AccessDrugShortageData = apps.get_model('scraper', 'AccessDrugShortageData')
+    AsphDrugShortageData = apps.get_model('scraper', 'AsphDrugShortageData')
+
+    # The staging loader stores missing optional key columns as '' so they take part in the
+    # unique constraint; older rows used NULL or a literal 'nan' from pandas.
+    for field in OPTIONAL_LEAD_FIELDS:
+        PotentialLead.objects.filter(**{f'{field}__isnull': True}).update(**{field: ''})
+        PotentialLead.objects.filter(**{field: 'nan'}).update(**{field: ''})
+
+    delete_duplicates(PotentialLead, LEAD_FIELDS)
+    delete_duplicates(AccessDrugShortageData, ['generic_name'])
+    delete_duplicates(AsphDrugShortageData, ['generic_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0042_alter_potentiallead_dosage_form_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_staged_tables, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='potentiallead',
+            constraint=models.UniqueConstraint(fields=['active_ingredient', 'applicant_holder', 'application_number', 'te_code', 'market_status', 'dosage_form', 'route', 'strength'], name='unique_potential_lead'),
+        ),
+        migrations.AddConstraint(
+            model_name='accessdrugshortagedata',
+            constraint=models.UniqueConstraint(fields=['generic_name'], name='unique_access_shortage_generic_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='asphdrugshortagedata',
+            constraint=models.UniqueConstraint(fields=['generic_name'], name='unique_asph_shortage_generic_name'),
+        ),
+    ]
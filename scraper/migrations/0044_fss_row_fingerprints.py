@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0043_staging_loader_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FSSChangeSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inserted_ndcs', models.JSONField(blank=True, default=list)),
+                ('updated_ndcs', models.JSONField(blank=True, default=list)),
+                ('deleted_ndcs', models.JSONField(blank=True, default=list)),
+                ('stats', models.JSONField(blank=True, default=dict)),
+                ('consolidated', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fssdrug',
+            name='row_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='fsspricing',
+            name='row_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0044_fss_row_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('last_item', models.CharField(blank=True, default='', max_length=255)),
+                ('file_sizes', models.JSONField(blank=True, default=dict)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+from scraper.ndc import normalize_ndc
+
+BATCH_SIZE = 1000
+NDC_SOURCE_FIELDS = {'FSSDrug': 'ndc_with_dashes', 'FOIAUniqueNDCData': 'ndc_code', 'DODDrugData': 'ndc_code'}
+
+
+def backfill_ndc_keys(apps, schema_editor):
+    for model_name, source_field in NDC_SOURCE_FIELDS.items():
+        model = apps.get_model('scraper', model_name)
+        batch = []
+        for row in model.objects.only('id', source_field).iterator(chunk_size=BATCH_SIZE):
+            row.ndc_key = normalize_ndc(getattr(row, source_field))
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['ndc_key'])
+                batch = []
+        model.objects.bulk_update(batch, ['ndc_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0045_scrapecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doddrugdata',
+            name='ndc_key',
+            field=models.CharField(blank=True, db_index=True, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name='foiauniquendcdata',
+            name='ndc_key',
+            field=models.CharField(blank=True, db_index=True, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name='fssdrug',
+            name='ndc_key',
+            field=models.CharField(blank=True, db_index=True, max_length=11, null=True),
+        ),
+        migrations.RunPython(backfill_ndc_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0046_ndc_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fssdrug',
+            index=models.Index(fields=['ingredient', 'strength'], name='scraper_fss_ingredi_db09f2_idx'),
+        ),
+    ]
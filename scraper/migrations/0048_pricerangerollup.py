@@ -0,0 +1,48 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+from scraper.fetch_data.price_rollups import GROUP_FIELDS, summarize_price_ranges
+
+
+def build_rollups(apps, schema_editor):
+    FSSPricing = apps.get_model('scraper', 'FSSPricing')
+    PriceRangeRollup = apps.get_model('scraper', 'PriceRangeRollup')
+    pricings = FSSPricing.objects.values_list(*(f'drug__{field}' for field in GROUP_FIELDS), 'price_type', 'price')
+    PriceRangeRollup.objects.bulk_create(
+        [
+            PriceRangeRollup(**dict(zip(GROUP_FIELDS + ['price_type'], key)), **values)
+            for key, values in summarize_price_ranges(pricings.iterator()).items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0047_fssdrug_ingredient_strength_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRangeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient', models.CharField(max_length=300)),
+                ('strength', models.CharField(max_length=200)),
+                ('dosage_form', models.CharField(max_length=200)),
+                ('route', models.CharField(max_length=200)),
+                ('price_type', models.CharField(max_length=100)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pricing_count', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ingredient', 'strength', 'dosage_form', 'route', 'price_type'), name='unique_price_range_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
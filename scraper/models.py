@@ -1,4 +1,26 @@
 from django.db import models
+from django.db.models import Max, Min
+from .ndc import NDC_KEY_LENGTH, normalize_ndc
+
+
+class NDCKeyedModel(models.Model):
+    """
+    A model carrying an NDC in the format of its source, plus the canonical 11-digit ndc_key
+    derived from it on save. Sources are joined on ndc_key.
+    """
+    ndc_source_field = "ndc_code"
+    ndc_key = models.CharField(max_length=NDC_KEY_LENGTH, blank=True, null=True, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.ndc_key = normalize_ndc(getattr(self, self.ndc_source_field))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.ndc_source_field in update_fields:
+            kwargs["update_fields"] = {*update_fields, "ndc_key"}
+        super().save(*args, **kwargs)
+
 
 class FSSVendor(models.Model):
     vendor_name = models.CharField(max_length=500)
@@ -25,7 +47,9 @@ class Manufacturer(models.Model):
     def __str__(self):
         return self.name
 
-class FSSDrug(models.Model):
+class FSSDrug(NDCKeyedModel):
+    ndc_source_field = "ndc_with_dashes"
+
     contract = models.ForeignKey(FSSContract, on_delete=models.CASCADE, related_name='drugs')
     vendor = models.ForeignKey(FSSVendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='drugs')
     ndc_with_dashes = models.CharField(max_length=50) 
@@ -53,6 +77,13 @@ class FSSDrug(models.Model):
     offers=models.IntegerField(null=True,blank=True)
     estimated_annual_spend = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)  # New field
     notes = models.TextField(null=True, blank=True)
+    row_fingerprint = models.CharField(max_length=64, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Drug detail pages aggregate the prices of every drug with the same ingredient and strength
+            models.Index(fields=['ingredient', 'strength']),
+        ]
 
     def __str__(self):
         return self.trade_name
@@ -64,6 +95,8 @@ class FSSPricing(models.Model):
     price_stop_date = models.DateField()
     price_type = models.CharField(max_length=100)
     non_taa_compliance = models.CharField(max_length=255)
+    row_fingerprint = models.CharField(max_length=64, blank=True, null=True)
+
     def __str__(self):
         return f"{self.drug.trade_name} - ${self.price}"
 
@@ -78,6 +111,17 @@ class PotentialLead(models.Model):
     route = models.CharField(max_length=300, blank=True, null=True)
     strength = models.CharField(max_length=300, blank=True, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'active_ingredient', 'applicant_holder', 'application_number', 'te_code',
+                    'market_status', 'dosage_form', 'route', 'strength',
+                ],
+                name='unique_potential_lead',
+            ),
+        ]
+
     def __str__(self):
         return self.active_ingredient
 
@@ -87,6 +131,11 @@ class AccessDrugShortageData(models.Model):
     generic_name = models.CharField(max_length=500, blank=True,  null=True)
     shortage_status = models.CharField(max_length=255)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['generic_name'], name='unique_access_shortage_generic_name'),
+        ]
+
     def __str__(self):
         return f"{self.generic_name} - {self.shortage_status}"
 
@@ -97,12 +146,17 @@ class AsphDrugShortageData(models.Model):
     revision_date = models.DateField()
     created_date = models.DateField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['generic_name'], name='unique_asph_shortage_generic_name'),
+        ]
+
     def __str__(self):
         return f"{self.generic_name} - Revision: {self.revision_date}, Created: {self.created_date}"
 
 
 
-class FOIAUniqueNDCData(models.Model):
+class FOIAUniqueNDCData(NDCKeyedModel):
     ndc_code = models.CharField(max_length=20, unique=True)
     description = models.CharField(max_length=255)
     total_quantity_purchased = models.IntegerField(default=0)
@@ -151,7 +205,7 @@ class FOIAStationData(models.Model):
 
 
 
-class DODDrugData(models.Model):
+class DODDrugData(NDCKeyedModel):
     ndc_code = models.CharField(max_length=100)
     description = models.TextField(max_length=500)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -189,4 +243,90 @@ class DataInsertionRecord(models.Model):
     date_inserted = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.drug_type} data inserted on {self.date_inserted}"
\ No newline at end of file
+        return f"{self.drug_type} data inserted on {self.date_inserted}"
+
+
+class FSSChangeSet(models.Model):
+    inserted_ndcs = models.JSONField(default=list, blank=True)
+    updated_ndcs = models.JSONField(default=list, blank=True)
+    deleted_ndcs = models.JSONField(default=list, blank=True)
+    stats = models.JSONField(default=dict, blank=True)
+    consolidated = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def touched_ndcs(self):
+        return set(self.inserted_ndcs) | set(self.updated_ndcs) | set(self.deleted_ndcs)
+
+    def __str__(self):
+        return (
+            f"FSS changes on {self.created_at}: {len(self.inserted_ndcs)} inserted, "
+            f"{len(self.updated_ndcs)} updated, {len(self.deleted_ndcs)} deleted"
+        )
+
+
+class ScrapeCheckpoint(models.Model):
+    """
+    How far a scraper got through its input, so an interrupted run can resume. `position`
+    items of the input identified by `fingerprint` have been written, and `file_sizes` holds
+    the size of each output file at that point.
+    """
+    source = models.CharField(max_length=50, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    position = models.PositiveIntegerField(default=0)
+    last_item = models.CharField(max_length=255, blank=True, default="")
+    file_sizes = models.JSONField(default=dict, blank=True)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} checkpoint at item {self.position} ({'completed' if self.completed else 'in progress'})"
+
+
+PRICE_TYPES = ("FSS", "NC", "Big4")
+
+
+class PriceRangeRollupQuerySet(models.QuerySet):
+    def price_type_ranges(self):
+        """
+        Min and max price of each price type across these rollup rows, in one grouped query.
+        Price types without pricings report 0 for both.
+        """
+        ranges = {price_type: {"min": 0, "max": 0} for price_type in PRICE_TYPES}
+        grouped = self.filter(price_type__in=PRICE_TYPES).values("price_type").annotate(
+            min=Min("min_price"), max=Max("max_price")
+        ).order_by()
+        for price_range in grouped:
+            ranges[price_range["price_type"]] = {"min": price_range["min"], "max": price_range["max"]}
+        return ranges
+
+
+class PriceRangeRollup(models.Model):
+    """
+    FSS pricing statistics of one price type over every drug sharing an ingredient, strength,
+    dosage form and route. Maintained by the FSS ingest for the groups it touches; see
+    scraper.fetch_data.price_rollups.
+    """
+    ingredient = models.CharField(max_length=300)
+    strength = models.CharField(max_length=200)
+    dosage_form = models.CharField(max_length=200)
+    route = models.CharField(max_length=200)
+    price_type = models.CharField(max_length=100)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    median_price = models.DecimalField(max_digits=10, decimal_places=2)
+    pricing_count = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PriceRangeRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ingredient', 'strength', 'dosage_form', 'route', 'price_type'],
+                name='unique_price_range_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient} {self.strength} {self.dosage_form} {self.route} - {self.price_type}"
@@ -0,0 +1,31 @@
+import re
+
+NDC_KEY_LENGTH = 11
+# Labeler, product and package segment widths of the 11-digit (5-4-2) billing format
+NDC_SEGMENT_WIDTHS = (5, 4, 2)
+NDC_SEPARATORS_RE = re.compile(r"[\s-]+")
+
+
+def normalize_ndc(value):
+    """
+    Canonical 11-digit NDC for a code as any of the sources store it, or None if it can't be
+    read as one.
+
+    Dashed codes (4-4-2, 5-3-2, 5-4-1 or 5-4-2) have each segment zero-padded to 5-4-2. An
+    undashed code is taken to be in the 11-digit format already; shorter ones lost their
+    leading zeros on the way through a spreadsheet and are padded back.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if "-" in value:
+        segments = [segment.strip() for segment in value.split("-")]
+        if len(segments) != len(NDC_SEGMENT_WIDTHS) or not all(segment.isdigit() for segment in segments):
+            return None
+        if any(len(segment) > width for segment, width in zip(segments, NDC_SEGMENT_WIDTHS)):
+            return None
+        return "".join(segment.zfill(width) for segment, width in zip(segments, NDC_SEGMENT_WIDTHS))
+    digits = NDC_SEPARATORS_RE.sub("", value)
+    if not digits.isdigit() or len(digits) > NDC_KEY_LENGTH:
+        return None
+    return digits.zfill(NDC_KEY_LENGTH)
@@ -1,15 +1,20 @@
-import json
 import os
 from decimal import Decimal, InvalidOperation
 
 
-from django.shortcuts import get_object_or_404
 import pandas as pd
-from celery import shared_task
+from celery import chain, chord, group, shared_task
+from celery.exceptions import Ignore
+from celery.utils import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from .models import *
-from .fetch_data.scraper import PharmaScraper
+from .fetch_data.scraper import SOURCE_SHARDS, PharmaScraper
 from .fetch_data.insert_foia_drug_data_from_file import FetchFoiaFile
 from .fetch_data.insert_dod_data import InsertDODDrugData
+from .fetch_data.insert_fss_data import InsertFSSData
+from .fetch_data.data_wrangling import RECORDS_DIR, cleaned_data_path, read_cleaned_data
+from .fetch_data.staging_loader import CSVStagingLoader
 from django.utils import timezone
 from celery.signals import task_prerun, task_success, task_failure
 import logging
@@ -22,132 +27,42 @@ scraping_logger = logging.getLogger('scraping')
 logger = logging.getLogger(__name__)
 
 
-def get_manufacturer(name):
-    if pd.notna(name) and name.strip():
-        manufacturer, created = Manufacturer.objects.update_or_create(name=name.strip())
-        return manufacturer
-    return None
-
-
 def insert_main_data(df):
-    inserted_rows = 0
-    for idx, row in df.iterrows():
-
-        vendor, _ = FSSVendor.objects.update_or_create(vendor_name=row["VendorName"])
-        contract, _ = FSSContract.objects.update_or_create(
-            contract_number=row["ContractNumber"],
-            defaults={
-                "contract_start_date": pd.to_datetime(row["ContractStartDate"]).date(),
-                "contract_stop_date": pd.to_datetime(row["ContractStopDate"]).date(),
-                "vendor": vendor,
-            },
-        )
-        drug, _ = FSSDrug.objects.update_or_create(
-            ndc_with_dashes=row["NDCWithDashes"],
-            contract=contract,
-            vendor=vendor,
-            trade_name=row["TradeName"],
-            generic_name=row["Generic"],
-            dosage_form=row["DosageForm"],
-            strength=row["Strength"],
-            route=row["Route"],
-            va_class=row["VAClass"],
-            covered=row["Covered"] == "T",
-            prime_vendor=row["PrimeVendor"] == "T",
-            ingredient=row["Ingredient"],
-            package_description=row["PackageDescription"],
-        )
-
-        FSSPricing.objects.update_or_create(
-            drug=drug,
-            price=row["Price"],
-            price_start_date=pd.to_datetime(row["PriceStartDate"]).date(),
-            price_stop_date=pd.to_datetime(row["PriceStopDate"]).date(),
-            price_type=row["PriceType"],
-            non_taa_compliance=row["Non-TAA"],
-        )
-        inserted_rows += 1
-    return inserted_rows
+    """
+    Apply the cleaned price file, returning inserted/updated/unchanged/deleted counts per model.
+    The touched NDCs are recorded as an FSSChangeSet.
+    """
+    return InsertFSSData().insert_main_data(df)
 
 
 def insert_daily_med_data(df):
-    for idx, row in df.iterrows():
-        # Fetch the drug object based on the NDC code
-        drug = FSSDrug.objects.filter(ndc_with_dashes=row["NDC Code"]).first()
-
-        # If the drug exists, update its fields
-        if drug:
-            drug.manufactured_by = get_manufacturer(row.get("Manufactured By"))
-            drug.manufactured_for = get_manufacturer(row.get("Manufactured For"))
-            drug.distributed_by = get_manufacturer(row.get("Distributed By"))
-
-            # Handle image URLs
-            image_urls = row.get("Image URLs")
-            if image_urls:
-                # If the image URLs are stored as a JSON string, load them
-                try:
-                    drug.image_urls = json.loads(image_urls)
-                except json.JSONDecodeError:
-                    # If the image URLs are stored as a comma-separated list, split them
-                    drug.image_urls = [url.strip() for url in image_urls.split(",")]
-
-            # Save the drug object with the updated data
-            drug.save()
+    """
+    Link FSS drugs to their manufacturers and images from the DailyMed records.
+    """
+    return CSVStagingLoader().load("daily_med", df)
 
 
 def insert_sam_gov_data(df):
-
-    for idx, row in df.iterrows():
-        awarded_value = float(row.get("Awarded Value", 0))
-        estimated_annual_quantities = row.get(
-            "Estimated Annual Quantities", ""
-        ).replace(",", "")
-        contract = get_object_or_404(FSSContract, contract_number=row["ContractNumber"])
-
-        contract.awardee = row["Awardee"]
-        contract.awarded_value = awarded_value
-        contract.estimated_annual_quantities = estimated_annual_quantities
-        contract.save()
+    """
+    Update FSS contracts with the award details scraped from sam.gov.
+    """
+    return CSVStagingLoader().load("sam_gov", df)
 
 
 def insert_orange_book_data(df):
-
-    for index, row in df.iterrows():
-
-        obj, created = PotentialLead.objects.update_or_create(
-            active_ingredient=row["Ingredient"],
-            applicant_holder=row["Applicant Holder"],
-            application_number=row["Appl. No."],
-            te_code=row.get("TE Code", ""),
-            market_status=row["Mkt.Status"],
-            dosage_form=row.get("Dosage Form", ""),
-            route=row.get("Route", ""),
-            strength=row.get(
-                "Strength",
-            ),
-        )
+    """
+    Add new Orange Book products as potential leads.
+    """
+    return CSVStagingLoader().load("orange_book", df)
 
 
 def insert_drug_shortage_data(df_access, df_asph):
-    # Insert drug shortage data from the Access data file
-    for idx, row in df_access.iterrows():
-        defaults = {
-            "shortage_status": row["SHORTAGE STATUS"],
-        }
-        AccessDrugShortageData.objects.update_or_create(
-            generic_name=row["GENERIC NAME"], defaults=defaults
-        )
-
-    # Insert drug shortage data from the ASPH data file
-    for idx, row in df_asph.iterrows():
-        defaults = {
-            "revision_date": pd.to_datetime(row["REVISION DATE"], errors="coerce"),
-            "created_date": pd.to_datetime(row["CREATED DATE"], errors="coerce"),
-            "shortage_status": row["SHORTAGE STATUS"],
-        }
-        AsphDrugShortageData.objects.update_or_create(
-            generic_name=row["GENERIC NAME"], defaults=defaults
-        )
+    """
+    Upsert the Access data and ASPH drug shortage lists by generic name.
+    """
+    access_stats = CSVStagingLoader().load("access_data_drug_shortage", df_access)
+    asph_stats = CSVStagingLoader().load("asph_drug_shortage", df_asph)
+    return access_stats, asph_stats
 
 
 def insert_ndc_drug_data(df):
@@ -209,7 +124,7 @@ def update_fss_drug_model_with_ndc_data(df):
     Process the DataFrame, update the FSSDrug model, and return the count of inserted rows and unmatched records.
     """
     unmatched_records = []
-    output_dir = "scraper/fetch_data/records/daily_med"
+    output_dir = os.path.join(RECORDS_DIR, "daily_med")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
@@ -266,41 +181,24 @@ def insert_scraped_data_async():
     
     scraping_logger.info("Inserting data started...")
     file_paths = {
-        "main": os.path.join(
-            "scraper", "fetch_data", "cleaned_data", "cleaned_vaFssPharmPrices.csv"
-        ),
          "national_contract_list": os.path.join(
             "scraper", "fetch_data", "raw_data", "National_Contract_List.csv"
         ),
 
-        "daily_med": os.path.join(
-            "scraper", "fetch_data", "records", "daily_med", "drug_data_daily_med.csv"
-        ),
-        "sam_gov": os.path.join(
-            "scraper", "fetch_data", "records", "sam_gov", "sam_gov_records.csv"
-        ),
-        "orange_book": os.path.join(
-            "scraper", "fetch_data", "records", "orange_book", "orange_book_records.csv"
-        ),
-        "access_data_drug_shortage": os.path.join(
-            "scraper",
-            "fetch_data",
-            "records",
-            "drug_shortage",
-            "access_data_drug_shortage.csv",
-        ),
-        "asph_drug_shortage": os.path.join(
-            "scraper",
-            "fetch_data",
-            "records",
-            "drug_shortage",
-            "asph_drug_shortage.csv",
-        ),
+        "daily_med": os.path.join(RECORDS_DIR, "daily_med", "drug_data_daily_med.csv"),
+        "sam_gov": os.path.join(RECORDS_DIR, "sam_gov", "sam_gov_records.csv"),
+        "orange_book": os.path.join(RECORDS_DIR, "orange_book", "orange_book_records.csv"),
+        "access_data_drug_shortage": os.path.join(RECORDS_DIR, "drug_shortage", "access_data_drug_shortage.csv"),
+        "asph_drug_shortage": os.path.join(RECORDS_DIR, "drug_shortage", "asph_drug_shortage.csv"),
     }
 
     try:
         # Load all data first if files exist
         dfs = {}
+        if os.path.exists(cleaned_data_path()):
+            dfs["main"] = read_cleaned_data()
+        else:
+            scraping_logger.error(f"File not found: {cleaned_data_path()}")
         for key, path in file_paths.items():
             full_path = os.path.abspath(path)
             if not os.path.exists(full_path):
@@ -311,9 +209,12 @@ def insert_scraped_data_async():
         # Process the data
         if "main" in dfs:
             scraping_logger.info("Inserting main data...")
-            #inserted_rows =22
-            inserted_rows = insert_main_data(dfs["main"])
-            scraping_logger.info(f"{inserted_rows} rows inserted from main data.")
+            main_data_stats = insert_main_data(dfs["main"])
+            for model_name, counts in main_data_stats.items():
+                scraping_logger.info(
+                    f"{model_name}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                    f"{counts['unchanged']} unchanged, {counts['deleted']} deleted from main data."
+                )
             
             inserted_rows, unmatched_records = update_fss_drug_model_with_ndc_data(dfs["national_contract_list"])
             scraping_logger.info(f"{inserted_rows} rows inserted for national_contract_list data.")
@@ -322,15 +223,17 @@ def insert_scraped_data_async():
                 # print(f"Unmatched records: {unmatched_records}") 
               
             #insert_daily_med_data(dfs["daily_med"])
-            scraping_logger.info(f"{inserted_rows} rows inserted for daily_med data.")
-            insert_sam_gov_data(dfs["sam_gov"])
-            scraping_logger.info(f"{inserted_rows} rows inserted for sam_govd data.")
-            insert_orange_book_data(dfs["orange_book"])
-            scraping_logger.info(f"{inserted_rows} rows inserted for orange_book data.")
-            insert_drug_shortage_data(
+            sam_gov_stats = insert_sam_gov_data(dfs["sam_gov"])
+            scraping_logger.info(f"{sam_gov_stats['merged']} rows merged for sam_gov data, {sam_gov_stats['rejected']} rejected.")
+            orange_book_stats = insert_orange_book_data(dfs["orange_book"])
+            scraping_logger.info(f"{orange_book_stats['merged']} rows merged for orange_book data, {orange_book_stats['rejected']} rejected.")
+            access_stats, asph_stats = insert_drug_shortage_data(
                  dfs["access_data_drug_shortage"], dfs["asph_drug_shortage"]
              )
-            scraping_logger.info(f"{inserted_rows} rows inserted for drug_shortage data.")
+            scraping_logger.info(
+                f"{access_stats['merged'] + asph_stats['merged']} rows merged for drug_shortage data, "
+                f"{access_stats['rejected'] + asph_stats['rejected']} rejected."
+            )
             
             DataInsertionRecord.objects.create(drug_type='FSS')
 
@@ -341,11 +244,16 @@ def insert_scraped_data_async():
 
 # Scraping Async Task
 @shared_task(bind=True)
-def run_pharma_scraper_async(self):
+def run_pharma_scraper_async(self, resume=False):
+    """
+    Scrape every source in this worker and insert the results; start_scrape_pipeline spreads
+    the same steps over several workers. With resume, the scrapers continue from the
+    checkpoints of an interrupted run instead of starting over.
+    """
     try:
         start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        scraping_logger.info(f"Scraping started at {start_time}...")
-        scraper = PharmaScraper(scraping_logger)
+        scraping_logger.info(f"Scraping {'resumed' if resume else 'started'} at {start_time}...")
+        scraper = PharmaScraper(scraping_logger, resume=resume)
         scraper.run()
         scraping_logger.info("Started inserting scraped data...")
         insert_scraped_data_async()
@@ -357,6 +265,94 @@ def run_pharma_scraper_async(self):
         scraping_logger.error(f"Failed to process data: {str(e)}")
         raise e
 
+def start_scrape_pipeline(resume=False):
+    """
+    Run the scrape as a Celery canvas so it can spread over several workers:
+
+        prepare_scrape_data -> chord(scrape_source_shard for every shard of every source)
+                            -> insert_scraped_shards -> consolidate_scraped_data
+
+    The returned pipeline id is the first task's id and is what the ScrapingStatus row records.
+    """
+    pipeline_id = uuid()
+    shards = group(
+        scrape_source_shard.si(pipeline_id=pipeline_id, source=source, index=index, total=total, resume=resume)
+        for source, total in SOURCE_SHARDS.items()
+        for index in range(total)
+    )
+    pipeline = chain(
+        prepare_scrape_data.si(pipeline_id=pipeline_id, resume=resume).set(task_id=pipeline_id),
+        chord(shards, insert_scraped_shards.si(pipeline_id=pipeline_id)),
+        consolidate_scraped_data.si(pipeline_id=pipeline_id),
+    )
+    ScrapingStatus.objects.create(start_time=timezone.now(), status='running', task_id=pipeline_id)
+    pipeline.apply_async(link_error=scrape_pipeline_failed.si(pipeline_id=pipeline_id))
+    scraping_logger.info(f"Scraping pipeline {pipeline_id} {'resumed' if resume else 'started'} at {timezone.now()}")
+    return pipeline_id
+
+
+def ensure_pipeline_running(pipeline_id):
+    # Revoking only reaches the task that is running; later stages stop here instead
+    if ScrapingStatus.objects.filter(task_id=pipeline_id, status='stopped').exists():
+        scraping_logger.info(f"Scraping pipeline {pipeline_id} was stopped.")
+        raise Ignore()
+
+
+@shared_task
+def prepare_scrape_data(pipeline_id, resume=False):
+    ensure_pipeline_running(pipeline_id)
+    if not settings.SCRAPER_DATA_DIR:
+        # The later stages read this stage's files and each other's from whichever worker runs them
+        raise ImproperlyConfigured(
+            "SCRAPER_DATA_DIR must be set to a directory shared by every Celery worker to run the scrape pipeline."
+        )
+    scraper = PharmaScraper(scraping_logger, resume=resume)
+    scraper.prepare()
+    if not scraper.error_queue.empty():
+        raise Exception(f"Failed to prepare the price data: {scraper.error_queue.get()}")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def scrape_source_shard(self, pipeline_id, source, index, total, resume=False):
+    """
+    Scrape shard `index` of `total` of one source. A failed shard is retried from its
+    checkpoint.
+    """
+    ensure_pipeline_running(pipeline_id)
+    shard = (index, total) if total > 1 else None
+    try:
+        PharmaScraper(scraping_logger, resume=resume).scrape_source(source, shard)
+    except Exception as e:
+        scraping_logger.error(f"Scraping {source} shard {index + 1}/{total} failed: {str(e)}")
+        raise self.retry(exc=e, kwargs={**self.request.kwargs, "resume": True})
+
+
+@shared_task
+def insert_scraped_shards(pipeline_id):
+    ensure_pipeline_running(pipeline_id)
+    scraper = PharmaScraper(scraping_logger)
+    for source, total in SOURCE_SHARDS.items():
+        if total > 1:
+            scraper.merge_source_shards(source, total)
+    insert_scraped_data_async()
+
+
+@shared_task
+def consolidate_scraped_data(pipeline_id):
+    ensure_pipeline_running(pipeline_id)
+    populate_consolidated_table()
+    ScrapingStatus.objects.filter(task_id=pipeline_id).update(status='completed', end_time=timezone.now())
+    scraping_logger.info(f"Scraping pipeline {pipeline_id} completed at {timezone.now()}")
+
+
+@shared_task
+def scrape_pipeline_failed(pipeline_id):
+    ScrapingStatus.objects.filter(task_id=pipeline_id, status='running').update(
+        status='failed', end_time=timezone.now()
+    )
+    scraping_logger.error(f"Scraping pipeline {pipeline_id} failed at {timezone.now()}")
+
+
 @task_prerun.connect(sender=run_pharma_scraper_async)
 def task_prerun_handler(sender=None, task_id=None, task=None, **kwargs):
     ScrapingStatus.objects.create(start_time=timezone.now(), status='running', task_id=task_id)
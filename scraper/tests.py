@@ -1,3 +1,591 @@
-from django.test import TestCase
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from scraper.fetch_data.attachment_cache import AttachmentCache
+from scraper.fetch_data.attachment_parser import AttachmentParser, AttachmentParserPool, worker_log_config
+from scraper.fetch_data.checkpoint import ScrapeCheckpointer
+from scraper.fetch_data.data_wrangling import CleanedDataWriter, DataWrangling
+from scraper.fetch_data.fetch_from_orange_book import FetchOrangeBook
+from scraper.fetch_data.fetch_from_sam_gov import FetchSamGov
+from scraper.fetch_data.http_client import AsyncFetchClient, host_limit
+from scraper.fetch_data.insert_fss_data import InsertFSSData
+from scraper.fetch_data.manufacturer_parser import ManufacturerParser
+from scraper.fetch_data.shards import merge_shards, shard_path
+from scraper.fetch_data.staging_loader import CSVStagingLoader
+from scraper.models import (
+    AsphDrugShortageData, FSSChangeSet, FSSContract, FSSDrug, FSSPricing, FSSVendor, Manufacturer, PotentialLead,
+    PriceRangeRollup,
+)
+from scraper.ndc import normalize_ndc
+from scraper.task import prepare_scrape_data
 
 # Create your tests here.
+
+
+class ManufacturerParserTests(SimpleTestCase):
+    def setUp(self):
+        self.parser = ManufacturerParser()
+
+    def test_parses_labelled_blocks(self):
+        fields, confidence = self.parser.parse(
+            "Manufactured by: Cipla Ltd. Verna Goa, India "
+            "Manufactured for: Cipla USA, Inc. Warren, NJ 07059 Revised: 10/2023"
+        )
+        self.assertEqual(fields["Manufactured By"], "Cipla Ltd. Verna Goa, India")
+        self.assertEqual(fields["Manufactured For"], "Cipla USA, Inc. Warren, NJ 07059")
+        self.assertEqual(fields["Distributed By"], "")
+        self.assertGreaterEqual(confidence, self.parser.threshold)
+
+    def test_distributed_and_marketed_by(self):
+        fields, confidence = self.parser.parse(
+            "Distributed and Marketed by: Teva Pharmaceuticals USA, Inc. North Wales, PA 19454 Rev. A 5/2020"
+        )
+        self.assertEqual(fields["Distributed By"], "Teva Pharmaceuticals USA, Inc. North Wales, PA 19454")
+        self.assertGreaterEqual(confidence, self.parser.threshold)
+
+    def test_low_confidence_falls_back(self):
+        calls = []
+        fallback = {"Manufactured By": "From LLM", "Manufactured For": "", "Distributed By": ""}
+
+        result = self.parser.extract(
+            "Manufactured by: Site A Manufactured by: Site B", lambda: calls.append(1) or fallback
+        )
+
+        self.assertEqual(result, fallback)
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.parser.stats, {"parsed": 0, "fallback": 1})
+
+    def test_no_label_has_zero_confidence(self):
+        fields, confidence = self.parser.parse("Store at 20 to 25 C")
+        self.assertEqual(confidence, 0.0)
+        self.assertEqual(set(fields.values()), {""})
+
+
+PRICE_FILE = os.getenv("FSS_PRICE_FILE", "vaFssPharmPrices.xlsx")
+
+
+class GenericColumnParityTests(SimpleTestCase):
+    """
+    parse_generic_column must return exactly what the row-by-row parse_generic_value returns.
+    """
+
+    samples = [
+        "ATORVASTATIN CALCIUM 10MG TAB",
+        "INSULIN LISPRO 100UNT/ML INJ,SOLN,3ML",
+        "SODIUM CHLORIDE 0.9% INJ,BAG,1000ML",
+        "AMOXICILLIN 250MG/5ML SUSP,ORAL",
+        "TRIAMCINOLONE ACETONIDE 0.1% CREAM,TOP",
+        "METFORMIN HCL 500MG TAB,SA",
+        "FLUTICASONE 50MCG/ACTUAT SPRAY,NASAL",
+        "MG SULFATE MG",
+        "ESTRADIOL VAG RING",
+        "ADALIMUMAB 40MG/0.4ML INJ,PEN,0.4ML",
+        "CALCIUM CARBONATE, CHEWABLE TAB",
+        "LEVOTHYROXINE NA #25MCG TAB",
+        "EC-ORAL",
+        "",
+    ]
+
+    def setUp(self):
+        self.wrangler = DataWrangling()
+
+    def assert_parity(self, generic):
+        expected = [self.wrangler.parse_generic_value(value) for value in generic]
+        parsed = self.wrangler.parse_generic_column(generic, use_cache=False)
+        self.assertEqual(list(parsed.index), list(generic.index))
+        self.assertEqual([tuple(row) for row in parsed.itertuples(index=False)], expected)
+
+    def test_parity_on_samples(self):
+        self.assert_parity(pd.Series(self.samples, index=range(100, 100 + len(self.samples))))
+
+    @unittest.skipUnless(os.path.exists(PRICE_FILE), "FSS price file not downloaded")
+    def test_parity_on_price_file(self):
+        self.assert_parity(pd.read_excel(PRICE_FILE)["Generic"])
+
+
+class CleanedDataWriterTests(SimpleTestCase):
+    def test_chunks_with_differing_types_share_one_file(self):
+        chunks = [
+            pd.DataFrame({"NDC": ["00000-0000-01"], "Price": [1.5], "Offers": [2], "Notes": [None]}),
+            pd.DataFrame({"NDC": [12345], "Price": [2.0], "Offers": [None], "Notes": ["late"]}),
+        ]
+        path = os.path.join(tempfile.mkdtemp(), "cleaned.parquet")
+        with CleanedDataWriter(path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+        df = pd.read_parquet(path)
+        self.assertEqual(writer.rows_written, 2)
+        self.assertEqual(list(df["NDC"]), ["00000-0000-01", "12345"])
+        self.assertEqual(list(df["Offers"].fillna(-1)), [2.0, -1])
+        self.assertEqual(list(df["Notes"].fillna("")), ["", "late"])
+
+
+class OrangeBookSearchPlanTests(SimpleTestCase):
+    def setUp(self):
+        self.fetcher = FetchOrangeBook(logging.getLogger(__name__))
+        self.searches = []
+        self.found = {"ASPIRIN", "CODEINE+PHOSPHATE"}
+        self.failing = set()
+        patcher = mock.patch.object(self.fetcher, "search_orange_book", side_effect=self.search_orange_book)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.fetcher, "parse_table_to_dataframe", side_effect=pd.DataFrame)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search_orange_book(self, term):
+        self.searches.append(term)
+        if term in self.failing:
+            raise httpx.ConnectError("connection refused")
+        return [{"Search": term}] if term in self.found else None
+
+    def test_ingredients_sharing_a_first_word_cost_one_search(self):
+        ingredients = ["ASPIRIN", "ASPIRIN LYSINE", "CODEINE PHOSPHATE", "CODEINE SULFATE"]
+        self.assertEqual(self.fetcher.prefetch_ingredients(ingredients), 4)
+        # ASPIRIN found a table, so ASPIRIN+LYSINE is never searched
+        self.assertCountEqual(self.searches, ["ASPIRIN", "CODEINE", "CODEINE+PHOSPHATE", "CODEINE+SULFATE"])
+
+        results = {ingredient: self.fetcher.fetch_data_from_orange_book(ingredient) for ingredient in ingredients}
+        self.assertEqual(len(self.searches), 4)
+        self.assertEqual(list(results["ASPIRIN LYSINE"]["Search"]), ["ASPIRIN"])
+        self.assertEqual(list(results["CODEINE PHOSPHATE"]["Search"]), ["CODEINE+PHOSPHATE"])
+        self.assertTrue(results["CODEINE SULFATE"].empty)
+
+    def test_failed_search_is_logged_and_retried_by_its_ingredient(self):
+        self.failing = {"CODEINE"}
+        with self.assertLogs(self.fetcher.logger, "ERROR"):
+            self.fetcher.prefetch_ingredients(["ASPIRIN", "CODEINE PHOSPHATE"])
+        self.assertNotIn("CODEINE", self.fetcher.search_results)
+
+        with self.assertRaises(httpx.ConnectError):
+            self.fetcher.fetch_data_from_orange_book("CODEINE PHOSPHATE")
+        self.assertEqual(self.searches.count("CODEINE"), 2)
+
+
+class OrangeBookMatchTests(SimpleTestCase):
+    def setUp(self):
+        self.fetcher = FetchOrangeBook(logging.getLogger(__name__))
+        self.records = self.fetcher.index_records(pd.DataFrame({
+            "VendorName": ["ACME INC"], "DosageForm": ["Tablet"], "Strength": ["10mg"],
+        }))
+
+    def match(self, applicants, dosages):
+        results = pd.DataFrame({
+            "Applicant Holder": applicants, "Dosage Form": dosages, "Strength": ["10MG"] * len(applicants),
+        })
+        return list(self.fetcher.match_results(self.records, self.fetcher.index_results(results))["_position"])
+
+    def test_missing_dosage_form_does_not_match(self):
+        self.assertEqual(self.match(["ACME INC", "ACME INC"], ["TABLET;ORAL", None]), [0])
+
+    def test_missing_applicant_is_another_applicant(self):
+        self.assertEqual(self.match(["ACME INC", None], ["TABLET;ORAL", "TABLET;ORAL"]), [1])
+
+
+class AsyncDownloadTests(SimpleTestCase):
+    def test_concurrent_downloads_of_one_path(self):
+        body = [b"x" * 1000, b"y" * 1000, b"z" * 1000]
+
+        async def stream():
+            for chunk in body:
+                await asyncio.sleep(0.01)  # Lets the other download interleave with this one
+                yield chunk
+
+        requests = []
+
+        async def handler(request):
+            requests.append(request)
+            return httpx.Response(200, headers={"Content-Length": str(len(b"".join(body)))}, content=stream())
+
+        client = AsyncFetchClient(offline=False)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        path = os.path.join(tempfile.mkdtemp(), "download")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            responses = list(executor.map(lambda _: client.download("https://example.com/file", path), range(2)))
+
+        self.assertTrue(all(response is not None for response in responses))
+        # Neither download had to be retried after the other one moved its file
+        self.assertEqual(len(requests), 2)
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"".join(body))
+        self.assertFalse(os.path.exists(f"{path}.part"))
+        # The path's lock went with its last download
+        self.assertEqual(len(client.download_locks), 0)
+
+
+class AttachmentParserPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = AttachmentParserPool(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+        self.file_path = os.path.join(tempfile.mkdtemp(), "requirements.xlsx")
+        pd.DataFrame({
+            "DESCRIPTION": ["ATORVASTATIN CALCIUM TAB 10MG"], "TOTAL ESTIMATED ANNUAL USAGE": [1200],
+        }).to_excel(self.file_path, index=False)
+
+    def test_parses_in_a_worker_process(self):
+        result_df = self.pool.parse(self.file_path)
+        self.assertEqual(list(result_df["Estimated Annual Quantities"]), [1200])
+        self.assertNotIn(os.getpid(), self.pool.workers)
+
+    def test_timed_out_worker_is_killed_and_replaced(self):
+        self.pool.timeout = 0.01  # Shorter than a worker takes to start
+        self.assertIsNone(self.pool.parse(self.file_path))
+        self.assertEqual(self.pool.workers, {})
+
+        self.pool.timeout = 120
+        self.assertFalse(self.pool.parse(self.file_path).empty)
+
+    def test_workers_log_to_stderr_only(self):
+        log_config = worker_log_config(settings.LOGGING)
+        self.assertEqual(
+            [handler["class"] for handler in log_config["handlers"].values()], ["logging.StreamHandler"]
+        )
+        self.assertEqual(log_config["loggers"]["scraping"]["level"], settings.LOGGING["loggers"]["scraping"]["level"])
+        self.assertEqual(log_config["loggers"]["scraping"]["handlers"], ["stderr"])
+
+
+class SamGovAttachmentTests(SimpleTestCase):
+    """
+    Attachments are downloaded and parsed through stand-ins for the HTTP client and the parser
+    pool, which count their calls.
+    """
+
+    def setUp(self):
+        self.fetcher = FetchSamGov(logging.getLogger(__name__))
+        self.fetcher.attachment_cache = AttachmentCache(tempfile.mkdtemp())
+        self.fetcher.http_client = SimpleNamespace(download=self.download)
+        self.fetcher.attachment_parser = SimpleNamespace(parse=self.parse)
+        self.calls = {"download": 0, "parse": 0}
+        self.calls_lock = threading.Lock()
+        self.parse_result = pd.DataFrame({"Ingredient": ["ATORVASTATIN"]})
+
+    def count(self, name):
+        with self.calls_lock:
+            self.calls[name] += 1
+
+    def download(self, url, path):
+        self.count("download")
+        with open(path, "wb") as file:
+            file.write(b"attachment")
+        return SimpleNamespace(headers={"Content-Disposition": 'attachment; filename="requirements.xlsx"'})
+
+    def parse(self, file_path):
+        self.count("parse")
+        time.sleep(0.05)  # Long enough for the other thread to reach the same attachment
+        with open(file_path, "rb") as file:
+            file.read()
+        return self.parse_result
+
+    def get(self):
+        return self.fetcher.get_attachment_data("https://sam.gov/files/1", "resource:1:2024-01-01")
+
+    def test_concurrent_requests_share_one_download_and_parse(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda _: self.get(), range(2)))
+
+        self.assertEqual(self.calls, {"download": 1, "parse": 1})
+        for result in results:
+            self.assertEqual(list(result["Ingredient"]), ["ATORVASTATIN"])
+
+    def test_failed_parse_is_not_cached(self):
+        self.parse_result = None
+        self.assertTrue(self.get().empty)
+
+        self.parse_result = pd.DataFrame({"Ingredient": ["ATORVASTATIN"]})
+        self.assertEqual(list(self.get()["Ingredient"]), ["ATORVASTATIN"])
+        # The file kept after the failure is parsed again without downloading it
+        self.assertEqual(self.calls, {"download": 1, "parse": 2})
+
+    def test_missing_file_is_downloaded_again(self):
+        self.parse_result = None
+        self.get()
+        for name in os.listdir(self.fetcher.attachment_cache.files_dir):
+            if name.endswith(".xlsx"):
+                os.remove(os.path.join(self.fetcher.attachment_cache.files_dir, name))
+
+        self.parse_result = pd.DataFrame({"Ingredient": ["ATORVASTATIN"]})
+        self.assertEqual(list(self.get()["Ingredient"]), ["ATORVASTATIN"])
+        self.assertEqual(self.calls, {"download": 2, "parse": 2})
+
+    def test_unreadable_file_is_not_an_empty_table(self):
+        file_path = os.path.join(tempfile.mkdtemp(), "requirements.xlsx")
+        with open(file_path, "wb") as file:
+            file.write(b"not a workbook")
+        self.assertIsNone(AttachmentParser(logging.getLogger(__name__)).process_file(file_path))
+
+
+class NormalizeNDCTests(SimpleTestCase):
+    def test_dashed_formats_pad_to_5_4_2(self):
+        self.assertEqual(normalize_ndc("0002-1433-80"), "00002143380")
+        self.assertEqual(normalize_ndc("50242-040-62"), "50242004062")
+        self.assertEqual(normalize_ndc("60575-4112-1"), "60575411201")
+        self.assertEqual(normalize_ndc("00002-1433-80"), "00002143380")
+
+    def test_undashed_codes(self):
+        self.assertEqual(normalize_ndc("00002143380"), "00002143380")
+        # Leading zeros dropped by a spreadsheet
+        self.assertEqual(normalize_ndc("2143380"), "00002143380")
+
+    def test_unreadable_codes(self):
+        for value in (None, "", "N/A", "1234-5678", "123456-1234-12", "123456789012"):
+            self.assertIsNone(normalize_ndc(value))
+
+
+class ScrapeCheckpointerTests(TestCase):
+    items = ["NDC-1", "NDC-2", "NDC-3", "NDC-4"]
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "records.csv")
+
+    def scrape(self, items, resume=False, fail_at=None):
+        checkpoint = ScrapeCheckpointer("test", [self.path], resume=resume)
+        done = checkpoint.start(items)
+        if not done:
+            with open(self.path, "w") as file:
+                file.write("NDC\n")
+        for position, item in enumerate(items[done:], done + 1):
+            with open(self.path, "a") as file:
+                file.write(f"{item}\n")
+                if position == fail_at:
+                    file.write("partial row")
+                    raise RuntimeError("worker killed")
+            checkpoint.advance(position, item)
+        checkpoint.finish()
+        with open(self.path) as file:
+            return file.read()
+
+    def test_resumed_run_matches_clean_run(self):
+        clean = self.scrape(self.items)
+        with self.assertRaises(RuntimeError):
+            self.scrape(self.items, fail_at=3)
+        self.assertEqual(self.scrape(self.items, resume=True), clean)
+
+    def test_changed_input_starts_over(self):
+        with self.assertRaises(RuntimeError):
+            self.scrape(self.items, fail_at=3)
+        self.assertEqual(self.scrape(self.items[1:], resume=True), "NDC\nNDC-2\nNDC-3\nNDC-4\n")
+
+
+class ShardTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "records.csv")
+
+    def write_shard(self, index, total, rows):
+        with open(shard_path(self.path, (index, total)), "w") as file:
+            file.write("NDC\n" + "".join(f"{row}\n" for row in rows))
+
+    def test_merge_drops_repeated_rows(self):
+        self.write_shard(0, 2, ["NDC-1", "NDC-2"])
+        self.write_shard(1, 2, ["NDC-2", "NDC-3"])
+        self.assertEqual(merge_shards(self.path, 2, dedupe=True), 3)
+        with open(self.path) as file:
+            self.assertEqual(file.read().split(), ["NDC", "NDC-1", "NDC-2", "NDC-3"])
+
+    def test_missing_shard_is_named(self):
+        self.write_shard(0, 2, ["NDC-1"])
+        with self.assertRaisesRegex(FileNotFoundError, "Shard 2/2"):
+            merge_shards(self.path, 2)
+        # The other shard is kept for the retried merge
+        self.assertTrue(os.path.exists(shard_path(self.path, (0, 2))))
+
+    def test_shards_share_the_host_limit(self):
+        url = "https://dailymed.nlm.nih.gov/dailymed/search.cfm"
+        self.assertEqual(host_limit(url), 8)
+        self.assertEqual(host_limit(url, (0, 4)), 2)
+        self.assertEqual(host_limit(url, (3, 8)), 1)
+        self.assertEqual(host_limit("https://www.ashp.org/drug-shortages", (0, 4)), 1)
+
+    def test_set_shard_from_several_threads(self):
+        client = AsyncFetchClient(offline=False)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            list(executor.map(client.set_shard, [None] * 5))
+        client.set_shard((0, 4))
+        self.assertEqual(client.shard, (0, 4))
+        self.assertEqual(client.host_semaphores, {})
+
+
+class ScrapePipelineTests(TestCase):
+    @override_settings(SCRAPER_DATA_DIR=None)
+    def test_pipeline_needs_shared_data_dir(self):
+        with self.assertRaisesRegex(ImproperlyConfigured, "SCRAPER_DATA_DIR"):
+            prepare_scrape_data("pipeline-1")
+
+
+def fss_price_row(ndc, price, price_type="FSS", strength="10MG"):
+    return {
+        "VendorName": "Acme", "ContractNumber": "36F79722D0001", "ContractStartDate": "2026-01-01",
+        "ContractStopDate": "2027-01-01", "NDCWithDashes": ndc, "TradeName": "Drug", "Generic": "Aspirin",
+        "DosageForm": "TAB", "Strength": strength, "Route": "ORAL", "VAClass": "CN101", "Covered": "T",
+        "PrimeVendor": "F", "Ingredient": "ASPIRIN", "PackageDescription": "", "PriceType": price_type,
+        "PriceStartDate": "2026-01-01", "PriceStopDate": "2027-01-01", "Price": price, "Non-TAA": "",
+    }
+
+
+class PriceRangeRollupTests(TestCase):
+    price_row = staticmethod(fss_price_row)
+
+    def ingest(self, *rows):
+        InsertFSSData().insert_main_data(pd.DataFrame(rows))
+        return {
+            (rollup.strength, rollup.price_type): (rollup.min_price, rollup.max_price, rollup.median_price, rollup.pricing_count)
+            for rollup in PriceRangeRollup.objects.all()
+        }
+
+    def test_ingest_refreshes_touched_groups(self):
+        rollups = self.ingest(
+            self.price_row("00000-0000-01", "1.00"),
+            self.price_row("00000-0000-02", "2.00"),
+            self.price_row("00000-0000-03", "4.00"),
+            self.price_row("00000-0000-03", "9.00", price_type="NC"),
+            self.price_row("00000-0000-04", "5.00", strength="20MG"),
+        )
+        self.assertEqual(rollups[("10MG", "FSS")], (Decimal("1.00"), Decimal("4.00"), Decimal("2.00"), 3))
+        self.assertEqual(rollups[("10MG", "NC")], (Decimal("9.00"), Decimal("9.00"), Decimal("9.00"), 1))
+
+        # A price change, a dropped pricing and a drug moving to another strength
+        rollups = self.ingest(
+            self.price_row("00000-0000-01", "1.50"),
+            self.price_row("00000-0000-02", "2.00"),
+            self.price_row("00000-0000-03", "4.00", strength="20MG"),
+            self.price_row("00000-0000-04", "5.00", strength="20MG"),
+        )
+        self.assertEqual(rollups[("10MG", "FSS")], (Decimal("1.50"), Decimal("2.00"), Decimal("1.75"), 2))
+        self.assertEqual(rollups[("20MG", "FSS")], (Decimal("4.00"), Decimal("5.00"), Decimal("4.50"), 2))
+        self.assertNotIn(("10MG", "NC"), rollups)
+
+
+class InsertFSSDataTests(TestCase):
+    def setUp(self):
+        self.rows = [
+            fss_price_row("00000-0000-01", "1.00"),
+            fss_price_row("00000-0000-02", "2.00"),
+            fss_price_row("00000-0000-02", "3.00", price_type="NC"),
+        ]
+        InsertFSSData().insert_main_data(pd.DataFrame(self.rows))
+
+    def ingest(self, rows):
+        loader = InsertFSSData()
+        with CaptureQueriesContext(connection) as queries:
+            stats = loader.insert_main_data(pd.DataFrame(rows))
+        writes = [
+            query["sql"].split()[0] for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        return stats, loader.change_set, writes
+
+    def prices(self):
+        return sorted(FSSPricing.objects.values_list("drug__ndc_with_dashes", "price_type", "price"))
+
+    def test_unchanged_reload_writes_nothing(self):
+        stats, change_set, writes = self.ingest(self.rows)
+
+        self.assertEqual(change_set.touched_ndcs, set())
+        # Only the change set itself is recorded
+        self.assertEqual(writes, ["INSERT"])
+        self.assertEqual(stats["FSSDrug"], {"inserted": 0, "updated": 0, "unchanged": 2, "deleted": 0})
+        self.assertEqual(stats["FSSPricing"], {"inserted": 0, "updated": 0, "unchanged": 3, "deleted": 0})
+
+    def test_changed_price_is_an_update(self):
+        stats, change_set, _ = self.ingest([self.rows[0], self.rows[1], fss_price_row("00000-0000-02", "3.50", "NC")])
+
+        self.assertEqual(stats["FSSPricing"], {"inserted": 0, "updated": 1, "unchanged": 2, "deleted": 0})
+        self.assertEqual((change_set.inserted_ndcs, change_set.updated_ndcs), ([], ["00000-0000-02"]))
+        self.assertIn(("00000-0000-02", "NC", Decimal("3.50")), self.prices())
+
+    def test_removed_row_is_recorded_as_a_delete(self):
+        stats, change_set, _ = self.ingest(self.rows[1:])
+
+        self.assertEqual(stats["FSSDrug"]["deleted"], 1)
+        self.assertEqual(change_set.deleted_ndcs, ["00000-0000-01"])
+        self.assertEqual(change_set.updated_ndcs, [])
+        self.assertFalse(FSSDrug.objects.filter(ndc_with_dashes="00000-0000-01").exists())
+        self.assertEqual(len(self.prices()), 2)
+
+    def test_empty_file_is_refused(self):
+        with self.assertRaises(ValueError):
+            InsertFSSData().insert_main_data(pd.DataFrame(columns=list(self.rows[0])))
+
+        self.assertEqual(FSSDrug.objects.count(), 2)
+        self.assertEqual(len(self.prices()), 3)
+        self.assertEqual(FSSChangeSet.objects.count(), 1)
+
+
+class CSVStagingLoaderORMTests(TestCase):
+    def setUp(self):
+        self.loader = CSVStagingLoader(rejected_dir=tempfile.mkdtemp())
+
+    def test_orange_book_skips_existing_leads(self):
+        row = {
+            "Ingredient": "ASPIRIN", "Applicant Holder": "ACME", "Appl. No.": "N1", "TE Code": "",
+            "Mkt.Status": "RX", "Dosage Form": "TAB", "Route": "ORAL", "Strength": "10MG",
+        }
+        self.assertEqual(self.loader.load("orange_book", pd.DataFrame([row, row]))["merged"], 1)
+        stats = self.loader.load("orange_book", pd.DataFrame([row, {**row, "Mkt.Status": None}]))
+        self.assertEqual((stats["merged"], stats["rejected"]), (0, 1))
+        self.assertEqual(PotentialLead.objects.count(), 1)
+
+    def test_awarded_values_the_column_cannot_hold_are_rejected(self):
+        vendor = FSSVendor.objects.create(vendor_name="Acme")
+        contract = FSSContract.objects.create(
+            contract_number="C1", contract_start_date="2026-01-01", contract_stop_date="2027-01-01", vendor=vendor
+        )
+        rows = [
+            {"ContractNumber": "C1", "Awardee": "Acme", "Awarded Value": value, "Estimated Annual Quantities": "1"}
+            for value in ("12,345,678,901.00", "9999999999.999", "NaN", "Infinity", "9999999999.99")
+        ]
+        stats = self.loader.load("sam_gov", pd.DataFrame(rows))
+        self.assertEqual(stats["rejected"], 4)
+        contract.refresh_from_db()
+        self.assertEqual(contract.awarded_value, Decimal("9999999999.99"))
+
+    def test_shortages_keep_the_last_row(self):
+        rows = [
+            {"GENERIC NAME": "ASPIRIN", "SHORTAGE STATUS": "Current", "REVISION DATE": "2026-01-01", "CREATED DATE": "2025-01-01"},
+            {"GENERIC NAME": "ASPIRIN", "SHORTAGE STATUS": "Resolved", "REVISION DATE": "2026-02-01", "CREATED DATE": "2025-01-01"},
+        ]
+        self.loader.load("asph_drug_shortage", pd.DataFrame(rows[:1]))
+        self.loader.load("asph_drug_shortage", pd.DataFrame(rows))
+        shortage = AsphDrugShortageData.objects.get()
+        self.assertEqual((shortage.shortage_status, str(shortage.revision_date)), ("Resolved", "2026-02-01"))
+
+    def test_contracts_and_manufacturers_are_updated(self):
+        vendor = FSSVendor.objects.create(vendor_name="Acme")
+        contract = FSSContract.objects.create(
+            contract_number="C1", contract_start_date="2026-01-01", contract_stop_date="2027-01-01", vendor=vendor
+        )
+        drug = FSSDrug.objects.create(
+            contract=contract, vendor=vendor, ndc_with_dashes="00000-0000-01", trade_name="Drug", dosage_form="TAB",
+            strength="10MG", route="ORAL", va_class="CN101", covered=True, prime_vendor=False, ingredient="ASPIRIN",
+        )
+        self.loader.load("sam_gov", pd.DataFrame([{
+            "ContractNumber": "C1", "Awardee": "Acme", "Awarded Value": "$1,000.50", "Estimated Annual Quantities": "1,000",
+        }]))
+        self.loader.load("daily_med", pd.DataFrame([{
+            "NDC Code": "00000-0000-01", "Manufactured By": "Maker", "Manufactured For": "Acme",
+            "Distributed By": None, "Image URLs": "a.png, b.png",
+        }]))
+
+        contract.refresh_from_db()
+        drug.refresh_from_db()
+        self.assertEqual((contract.awarded_value, contract.estimated_annual_quantities), (Decimal("1000.50"), "1000"))
+        self.assertEqual((drug.manufactured_by.name, drug.manufactured_for.name, drug.distributed_by), ("Maker", "Acme", None))
+        self.assertEqual(drug.image_urls, ["a.png", "b.png"])
+        self.assertEqual(Manufacturer.objects.count(), 2)
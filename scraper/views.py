@@ -52,7 +52,9 @@ class PharmaScraperView(APIView):
             #run_pharma_scraper()
             
             #Production
-            run_pharma_scraper_async.delay()  
+            # {"resume": true} continues an interrupted run from its checkpoints
+            resume = str(request.data.get("resume", "")).lower() in ("1", "true")
+            start_scrape_pipeline(resume=resume)
             return Response(
                 {"success": True, "message": "Scraper execution started. Please check the status later."},
                 status=status.HTTP_202_ACCEPTED
@@ -1,15 +1,33 @@
 from django.contrib import admin
-from .models import ConsolidatedDrugData, ConsolidatedDrugPrice
+from .models import ConsolidatedBuild, ConsolidatedDrugData, ConsolidatedDrugPrice
+from .task import activate_build
 # Register your models here.
 
+@admin.register(ConsolidatedBuild)
+class ConsolidatedBuildAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'activated_at', 'is_active', 'row_count']
+    actions = ['activate_selected_build']
+
+    @admin.action(description="Activate selected build (rollback)")
+    def activate_selected_build(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one build to activate.", level='error')
+            return
+        activate_build(queryset.get())
+
+
 @admin.register(ConsolidatedDrugData)
 class ConsolidatedDrugDataAdmin(admin.ModelAdmin):
     list_display = ['generic_name', 'ndc_code', 'ingredient', 'dosage_form', 'strength','id']
     search_fields = ['strength','generic_name','ndc_code','ingredient']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).active()
+
 
 @admin.register(ConsolidatedDrugPrice)
 class ConsolidatedDrugPricedmin(admin.ModelAdmin):
     search_fields = ['drug__trade_name', 'price_type', 'non_taa_compliance']
 
-  
\ No newline at end of file
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(drug__build__is_active=True)
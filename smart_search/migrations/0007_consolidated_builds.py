@@ -0,0 +1,48 @@
+# Generated by Django 5.0.4 on 2026-10-18 16:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def adopt_existing_rows(apps, schema_editor):
+    # Rows built before builds existed become the initial active build
+    ConsolidatedBuild = apps.get_model('smart_search', 'ConsolidatedBuild')
+    ConsolidatedDrugData = apps.get_model('smart_search', 'ConsolidatedDrugData')
+    row_count = ConsolidatedDrugData.objects.count()
+    if row_count:
+        build = ConsolidatedBuild.objects.create(is_active=True, activated_at=timezone.now(), row_count=row_count)
+        ConsolidatedDrugData.objects.update(build=build)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_search', '0006_alter_consolidateddrugdata_contract_awardee_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsolidatedBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('row_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_consolidated_build')],
+            },
+        ),
+        migrations.AddField(
+            model_name='consolidateddrugdata',
+            name='build',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='drugs', to='smart_search.consolidatedbuild'),
+        ),
+        migrations.AddIndex(
+            model_name='consolidateddrugdata',
+            index=models.Index(fields=['build', 'ndc_code'], name='smart_searc_build_i_92044a_idx'),
+        ),
+        migrations.RunPython(adopt_existing_rows, migrations.RunPython.noop),
+    ]
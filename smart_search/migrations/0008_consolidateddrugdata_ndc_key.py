@@ -0,0 +1,40 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+from scraper.ndc import normalize_ndc
+
+BATCH_SIZE = 1000
+
+
+def backfill_ndc_keys(apps, schema_editor):
+    # Existing builds keep their rows; the next rebuild joins the sources on the new key
+    ConsolidatedDrugData = apps.get_model('smart_search', 'ConsolidatedDrugData')
+    batch = []
+    for drug in ConsolidatedDrugData.objects.only('id', 'ndc_code').iterator(chunk_size=BATCH_SIZE):
+        drug.ndc_key = normalize_ndc(drug.ndc_code)
+        batch.append(drug)
+        if len(batch) == BATCH_SIZE:
+            ConsolidatedDrugData.objects.bulk_update(batch, ['ndc_key'])
+            batch = []
+    ConsolidatedDrugData.objects.bulk_update(batch, ['ndc_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_search', '0007_consolidated_builds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consolidateddrugdata',
+            name='ndc_key',
+            field=models.CharField(blank=True, max_length=11, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='consolidateddrugdata',
+            index=models.Index(fields=['build', 'ndc_key'], name='smart_searc_build_i_d2c7f1_idx'),
+        ),
+        migrations.RunPython(backfill_ndc_keys, migrations.RunPython.noop),
+    ]
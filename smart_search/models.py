@@ -5,8 +5,38 @@ from django.db import models
 
 from django.db import models
 
+
+class ConsolidatedBuild(models.Model):
+    """
+    One full rebuild of the consolidated table. Readers only see rows of the active build,
+    so a rebuild is swapped in by flipping is_active and can be rolled back the same way.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+    row_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'], condition=models.Q(is_active=True), name='single_active_consolidated_build'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Build {self.id} ({'active' if self.is_active else 'inactive'}, {self.row_count} rows)"
+
+
+class ConsolidatedDrugDataQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(build__is_active=True)
+
+
 class ConsolidatedDrugData(models.Model):
+    build = models.ForeignKey(ConsolidatedBuild, related_name='drugs', on_delete=models.CASCADE, null=True, blank=True)
     ndc_code = models.CharField(max_length=100)
+    # Canonical 11-digit NDC the sources were joined on, None if ndc_code couldn't be read as one
+    ndc_key = models.CharField(max_length=11, blank=True, null=True)
     trade_name = models.CharField(max_length=500, blank=True, null=True)
     generic_name = models.CharField(max_length=500, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
@@ -50,6 +80,14 @@ class ConsolidatedDrugData(models.Model):
     min_big4_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     max_big4_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
+    objects = ConsolidatedDrugDataQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['build', 'ndc_code']),
+            models.Index(fields=['build', 'ndc_key']),
+        ]
+
     def __str__(self):
         return f"{self.ndc_code} - {self.description or self.trade_name or 'No Description'}"
 
@@ -1,143 +1,263 @@
 import logging
 from celery import shared_task
 from scraper.models import *
-from .models import ConsolidatedDrugData, ConsolidatedDrugPrice
-from django.db.models import Min, Max, Case, When
+from .models import ConsolidatedBuild, ConsolidatedDrugData, ConsolidatedDrugPrice
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F, Min, Max, Case, When, Q
+from django.db.models.functions import Coalesce
+from scraper.ndc import normalize_ndc
 # Set up logging
 logger = logging.getLogger(__name__)
 
-@shared_task
-def populate_consolidated_table():
-    logger.info("Starting to populate the consolidated table.")
+BATCH_SIZE = 1000
+# Inactive builds kept around after a swap so a bad rebuild can be rolled back
+KEEP_PREVIOUS_BUILDS = 1
+
+PRICE_RANGES = {
+    'min_fss_price': Min(Case(When(price_type='FSS', then='price'))),
+    'max_fss_price': Max(Case(When(price_type='FSS', then='price'))),
+    'min_nc_price': Min(Case(When(price_type='NC', then='price'))),
+    'max_nc_price': Max(Case(When(price_type='NC', then='price'))),
+    'min_big4_price': Min(Case(When(price_type='Big4', then='price'))),
+    'max_big4_price': Max(Case(When(price_type='Big4', then='price'))),
+}
+
+
+def fit_to_field(field_name, value):
+    # Source columns can be wider than the consolidated ones (e.g. contract awardee)
+    max_length = ConsolidatedDrugData._meta.get_field(field_name).max_length
+    if max_length and isinstance(value, str):
+        return value[:max_length]
+    return value
+
+
+def filter_ndcs(queryset, code_field, keys, prefix=''):
+    """
+    Restrict a queryset to the given row keys: the canonical ndc_key, or the source's own code
+    for rows whose NDC couldn't be normalized.
+    """
+    if keys is None:
+        return queryset
+    return queryset.filter(
+        Q(**{f'{prefix}ndc_key__in': keys}) | Q(**{f'{prefix}ndc_key__isnull': True, f'{prefix}{code_field}__in': keys})
+    )
+
+
+def consolidated_row(rows, ndc_key, ndc_code):
+    # Sources are joined on ndc_key; the first source to supply an NDC names the row
+    return rows.setdefault(ndc_key or ndc_code, {'ndc_code': ndc_code, 'ndc_key': ndc_key})
 
-    # Populate from FSSDrug
-    fss_drugs = FSSDrug.objects.all()
-    logger.info(f"Found {fss_drugs.count()} FSSDrug records to process.")
 
+def build_consolidated_rows(ndcs=None):
+    """
+    Build the consolidated rows and their prices in memory from a handful of queries.
+
+    FSS drugs are applied first, then FOIA and DOD data on top for the same NDC, as the
+    row-by-row rebuild did. When several FSS drugs share an NDC the latest one supplies the
+    descriptive columns, and the min/max prices cover all of them. Rows are keyed by the
+    canonical ndc_key, so the dashed FSS codes meet the undashed FOIA and DOD ones.
+    """
+    rows, prices = {}, {}
+
+    fss_drugs = filter_ndcs(FSSDrug.objects.all(), 'ndc_with_dashes', ndcs).order_by('id').values(
+        'ndc_key', 'ndc_with_dashes', 'trade_name', 'generic_name', 'package_description', 'dosage_form', 'strength',
+        'route', 'ingredient', 'covered', 'prime_vendor', 'va_class', 'notes',
+        vendor_name=F('vendor__vendor_name'),
+        contract_number=F('contract__contract_number'),
+        contract_awardee=F('contract__awardee'),
+        contract_awarded_value=F('contract__awarded_value'),
+        contract_start_date=F('contract__contract_start_date'),
+        contract_stop_date=F('contract__contract_stop_date'),
+        manufactured_by_name=F('manufactured_by__name'),
+        manufactured_by_address=F('manufactured_by__address'),
+        manufactured_for_name=F('manufactured_for__name'),
+        distributed_by_name=F('distributed_by__name'),
+    )
     for drug in fss_drugs:
-        try:
-            # Get all related pricing records for the drug
-            pricings = FSSPricing.objects.filter(drug=drug)
-
-            price_ranges = pricings.aggregate(
-            fss_min_price=Min(Case(When(price_type='FSS', then='price'))),
-            fss_max_price=Max(Case(When(price_type='FSS', then='price'))),
-            nc_min_price=Min(Case(When(price_type='NC', then='price'))),
-            nc_max_price=Max(Case(When(price_type='NC', then='price'))),
-            big4_min_price=Min(Case(When(price_type='Big4', then='price'))),
-            big4_max_price=Max(Case(When(price_type='Big4', then='price')))
+        row = consolidated_row(rows, drug.pop('ndc_key'), drug.pop('ndc_with_dashes'))
+        drug['manufactured_by'] = drug.pop('manufactured_by_name')
+        drug['manufactured_for'] = drug.pop('manufactured_for_name')
+        drug['distributed_by'] = drug.pop('distributed_by_name')
+        drug['source'] = 'VA'
+        row.update(drug)
+
+    fss_pricings = filter_ndcs(FSSPricing.objects.all(), 'ndc_with_dashes', ndcs, prefix='drug__').annotate(
+        row_key=Coalesce('drug__ndc_key', 'drug__ndc_with_dashes')
     )
+    price_ranges = fss_pricings.values('row_key').annotate(**PRICE_RANGES).order_by()
+    for price_range in price_ranges:
+        rows[price_range.pop('row_key')].update(price_range)
 
-            consolidated_drug, created = ConsolidatedDrugData.objects.update_or_create(
-                ndc_code=drug.ndc_with_dashes,
-                defaults={
-                    'trade_name': drug.trade_name,
-                    'generic_name': drug.generic_name,
-                    'package_description': drug.package_description,
-                    'dosage_form': drug.dosage_form,
-                    'strength': drug.strength,
-                    'route': drug.route,
-                    'ingredient': drug.ingredient,
-                    'covered': drug.covered,
-                    'prime_vendor': drug.prime_vendor,
-                    'va_class': drug.va_class,
-                    
-                    'vendor_name': drug.vendor.vendor_name if drug.vendor else None,
-                    'contract_number': drug.contract.contract_number,
-                    'contract_awardee': drug.contract.awardee,
-                    'contract_awarded_value': drug.contract.awarded_value,
-                    'contract_start_date': drug.contract.contract_start_date,
-                    'contract_stop_date': drug.contract.contract_stop_date,
-                    
-                    'manufactured_by': drug.manufactured_by.name if drug.manufactured_by else None,
-                    'manufactured_by_address': drug.manufactured_by.address if drug.manufactured_by else None,
-                    'manufactured_for': drug.manufactured_for.name if drug.manufactured_for else None,
-                    'distributed_by': drug.distributed_by.name if drug.distributed_by else None,
-                    'notes': drug.notes,
-                    'source': 'VA',
-
-                    # Insert the min/max prices for each price type
-                    'min_fss_price':  price_ranges['fss_min_price'],
-                    'max_fss_price':  price_ranges['fss_max_price'],
-                    'min_nc_price':  price_ranges['nc_min_price'],
-                    'max_nc_price':  price_ranges['nc_max_price'],
-                    'min_big4_price':  price_ranges['big4_min_price'],
-                    'max_big4_price':  price_ranges['big4_max_price'],
-                }
-            )
-            action = "Created" if created else "Updated"
-            logger.info(f"{action} ConsolidatedDrugData for NDC {drug.ndc_with_dashes} from FSSDrug.")
-
-            # Now populate the related prices
-            for price in pricings:
-                ConsolidatedDrugPrice.objects.update_or_create(
-                    drug=consolidated_drug,
-                    price=price.price,
-                    price_start_date=price.price_start_date,
-                    price_stop_date=price.price_stop_date,
-                    price_type=price.price_type,
-                    defaults={
-                        'non_taa_compliance': price.non_taa_compliance,
-                    }
-                )
-                logger.info(f"Updated price for NDC {drug.ndc_with_dashes} with price {price.price}.")
-        except Exception as e:
-            logger.error(f"Error processing FSSDrug with NDC {drug.ndc_with_dashes}: {e}")
-
-    # Populate from FOIAUniqueNDCData
-    foia_drugs = FOIAUniqueNDCData.objects.all()
-    logger.info(f"Found {foia_drugs.count()} FOIAUniqueNDCData records to process.")
+    fss_prices = fss_pricings.order_by('id').values(
+        'row_key', 'price', 'price_start_date', 'price_stop_date', 'price_type', 'non_taa_compliance'
+    )
+    for price in fss_prices:
+        key = (price['price'], price['price_start_date'], price['price_stop_date'], price['price_type'])
+        prices.setdefault(price['row_key'], {})[key] = price['non_taa_compliance']
 
+    foia_drugs = filter_ndcs(FOIAUniqueNDCData.objects.all(), 'ndc_code', ndcs).order_by('id').values(
+        'ndc_key', 'ndc_code', 'description', 'dosage_form', 'strength', 'ingredient', 'total_quantity_purchased',
+        'total_publishable_dollars_spent', 'notes',
+        manufactured_by_name=F('manufactured_by__name'),
+        manufactured_for_name=F('manufactured_for__name'),
+        distributed_by_name=F('distributed_by__name'),
+    )
     for foia in foia_drugs:
-        try:
-            consolidated_drug, created = ConsolidatedDrugData.objects.update_or_create(
-                ndc_code=foia.ndc_code,
-                defaults={
-                    'description': foia.description,
-                    'dosage_form': foia.dosage_form,
-                    'strength': foia.strength,
-                    'ingredient': foia.ingredient,
-                    'total_quantity_purchased': foia.total_quantity_purchased,
-                    'total_publishable_dollars_spent': foia.total_publishable_dollars_spent,
-                    'manufactured_by': foia.manufactured_by.name if foia.manufactured_by else None,
-                    'manufactured_for': foia.manufactured_for.name if foia.manufactured_for else None,
-                    'distributed_by': foia.distributed_by.name if foia.distributed_by else None,
-                    'notes': foia.notes,
-                    'source': 'FOIA'
-                }
-            )
-            logger.info(f"Updated ConsolidatedDrugData for NDC {foia.ndc_code} from FOIAUniqueNDCData.")
-        except Exception as e:
-            logger.error(f"Error processing FOIAUniqueNDCData with NDC {foia.ndc_code}: {e}")
-
-    # Populate from DODDrugData
-    dod_drugs = DODDrugData.objects.all()
-    logger.info(f"Found {dod_drugs.count()} DODDrugData records to process.")
+        row = consolidated_row(rows, foia.pop('ndc_key'), foia.pop('ndc_code'))
+        foia['manufactured_by'] = foia.pop('manufactured_by_name')
+        foia['manufactured_for'] = foia.pop('manufactured_for_name')
+        foia['distributed_by'] = foia.pop('distributed_by_name')
+        foia['source'] = 'FOIA'
+        row.update(foia)
 
+    dod_drugs = filter_ndcs(DODDrugData.objects.all(), 'ndc_code', ndcs).order_by('id').values(
+        'ndc_key', 'ndc_code', 'price'
+    )
     for dod in dod_drugs:
-        try:
-            consolidated_drug, created = ConsolidatedDrugData.objects.update_or_create(
-                ndc_code=dod.ndc_code,
-                defaults={
-                    'source': 'DOD'
-                }
-            )
-            action = "Created" if created else "Updated"
-            logger.info(f"{action} ConsolidatedDrugData for NDC {dod.ndc_code} from DODDrugData.")
-
-            # Now populate the related prices
-            ConsolidatedDrugPrice.objects.update_or_create(
-                drug=consolidated_drug,
-                price=dod.price,
-                price_start_date=None,  # Assuming there's no start date for DOD prices
-                price_stop_date=None,   # Assuming there's no stop date for DOD prices
-                price_type= None,       # Assuming DOD has a distinct price type
-                defaults={
-                    'non_taa_compliance': None,  # Assuming no non-TAA compliance info for DOD
-                }
+        consolidated_row(rows, dod['ndc_key'], dod['ndc_code'])['source'] = 'DOD'
+        prices.setdefault(dod['ndc_key'] or dod['ndc_code'], {})[(dod['price'], None, None, None)] = None
+
+    return rows, prices
+
+
+def write_consolidated_rows(build, rows, prices, ndcs=None):
+    """
+    Write the built rows into a build, replacing its rows for the given NDC keys first.
+    """
+    if ndcs is not None:
+        stale = filter_ndcs(build.drugs.all(), 'ndc_code', ndcs)
+        ConsolidatedDrugPrice.objects.filter(drug__in=stale).delete()
+        stale.delete()
+
+    consolidated_drugs = ConsolidatedDrugData.objects.bulk_create(
+        [
+            ConsolidatedDrugData(build=build, **{field: fit_to_field(field, value) for field, value in row.items()})
+            for row in rows.values()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    if any(drug.pk is None for drug in consolidated_drugs):
+        # bulk_create does not return primary keys on every backend
+        consolidated_drugs = filter_ndcs(build.drugs.all(), 'ndc_code', list(rows))
+
+    ConsolidatedDrugPrice.objects.bulk_create(
+        [
+            ConsolidatedDrugPrice(
+                drug=drug, price=price, price_start_date=start_date, price_stop_date=stop_date,
+                price_type=price_type, non_taa_compliance=non_taa_compliance,
             )
-            logger.info(f"Updated price for NDC {dod.ndc_code} with price {dod.price}.")
-        except Exception as e:
-            logger.error(f"Error processing DODDrugData with NDC {dod.ndc_code}: {e}")
+            for drug in consolidated_drugs
+            for (price, start_date, stop_date, price_type), non_taa_compliance in prices.get(drug.ndc_key or drug.ndc_code, {}).items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    return len(consolidated_drugs)
+
+
+def delete_build(build):
+    ConsolidatedDrugPrice.objects.filter(drug__build=build).delete()
+    ConsolidatedDrugData.objects.filter(build=build).delete()
+    build.delete()
+
+
+def activate_build(build):
+    """
+    Point readers at the given build. Both updates commit together, so readers see either
+    the old build or the new one.
+    """
+    with transaction.atomic():
+        ConsolidatedBuild.objects.filter(is_active=True).exclude(id=build.id).update(is_active=False)
+        build.is_active = True
+        build.activated_at = timezone.now()
+        build.save(update_fields=['is_active', 'activated_at'])
+    logger.info(f"Consolidated build {build.id} is now active.")
+
+
+def prune_builds(current_build):
+    """
+    Delete builds older than the current one, keeping the latest previously active ones for rollback.
+    """
+    older_builds = ConsolidatedBuild.objects.filter(id__lt=current_build.id, is_active=False).order_by('-id')
+    keep_ids = list(older_builds.filter(activated_at__isnull=False).values_list('id', flat=True)[:KEEP_PREVIOUS_BUILDS])
+    for build in older_builds.exclude(id__in=keep_ids):
+        delete_build(build)
+        logger.info(f"Deleted old consolidated build {build.id}.")
+
+
+def rollback_consolidated_build():
+    """
+    Re-activate the most recent build that was active before the current one.
+    """
+    active_build = ConsolidatedBuild.objects.filter(is_active=True).first()
+    previous_builds = ConsolidatedBuild.objects.filter(is_active=False, activated_at__isnull=False)
+    if active_build:
+        previous_builds = previous_builds.filter(id__lt=active_build.id)
+    previous_build = previous_builds.order_by('-id').first()
+    if previous_build is None:
+        logger.warning("No previous consolidated build to roll back to.")
+        return None
+
+    activate_build(previous_build)
+    return previous_build
+
+
+def rebuild_consolidated_table():
+    """
+    Build a complete new version of the consolidated table next to the active one and swap it in.
+    """
+    build = ConsolidatedBuild.objects.create()
+    try:
+        rows, prices = build_consolidated_rows()
+        build.row_count = write_consolidated_rows(build, rows, prices)
+        build.save(update_fields=['row_count'])
+    except Exception:
+        delete_build(build)
+        raise
+
+    activate_build(build)
+    prune_builds(build)
+    return build.row_count
+
+
+def refresh_consolidated_ndcs(build, ndcs):
+    """
+    Refresh the given NDCs inside the active build in one short transaction.
+    """
+    ndcs = sorted({normalize_ndc(ndc) or ndc for ndc in ndcs})
+    rows, prices = build_consolidated_rows(ndcs)
+    with transaction.atomic():
+        written = write_consolidated_rows(build, rows, prices, ndcs)
+        build.row_count = build.drugs.count()
+        build.save(update_fields=['row_count'])
+    return written
+
+
+@shared_task
+def populate_consolidated_table(incremental=False):
+    """
+    Rebuild ConsolidatedDrugData from the FSS, FOIA and DOD tables.
+
+    A full rebuild writes a new build and swaps it in atomically. With incremental=True only
+    the NDCs recorded in FSS change sets since the last run are refreshed in the active build;
+    FOIA and DOD loads are not tracked by change sets and need a full rebuild.
+    """
+    change_sets = list(FSSChangeSet.objects.filter(consolidated=False))
+    active_build = ConsolidatedBuild.objects.filter(is_active=True).first()
+    if incremental and active_build is None:
+        logger.info("No active consolidated build yet, running a full rebuild instead.")
+        incremental = False
+    logger.info(f"Starting to populate the consolidated table ({'incremental' if incremental else 'full'}).")
+
+    if incremental:
+        ndcs = set()
+        for change_set in change_sets:
+            ndcs |= change_set.touched_ndcs
+        logger.info(f"Found {len(ndcs)} NDCs changed since the last consolidation.")
+        written = refresh_consolidated_ndcs(active_build, sorted(ndcs)) if ndcs else 0
+    else:
+        written = rebuild_consolidated_table()
 
-    logger.info("Consolidated table populated successfully.")
\ No newline at end of file
+    FSSChangeSet.objects.filter(id__in=[change_set.id for change_set in change_sets]).update(consolidated=True)
+    logger.info(f"Consolidated table populated successfully with {written} NDCs.")
+    return written
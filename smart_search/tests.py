@@ -1,3 +1,99 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from scraper.models import DODDrugData, FOIAUniqueNDCData, FSSContract, FSSDrug, FSSPricing, FSSVendor
+from smart_search.models import ConsolidatedBuild, ConsolidatedDrugData, ConsolidatedDrugPrice
+from smart_search.task import (
+    activate_build, build_consolidated_rows, rebuild_consolidated_table, rollback_consolidated_build,
+    write_consolidated_rows,
+)
+
+
+class ConsolidatedRebuildTests(TestCase):
+    def setUp(self):
+        vendor = FSSVendor.objects.create(vendor_name="Acme")
+        self.contract = FSSContract.objects.create(
+            contract_number="36F79722D0001", contract_start_date="2026-01-01", contract_stop_date="2027-01-01",
+            vendor=vendor,
+        )
+        self.vendor = vendor
+        # Two FSS drugs share an NDC; FOIA and DOD store it undashed
+        self.add_drug("00002-1433-80", "Drug A", [("FSS", "1.00")])
+        self.add_drug("00002-1433-80", "Drug B", [("FSS", "3.00"), ("NC", "5.00")])
+        FOIAUniqueNDCData.objects.create(
+            ndc_code="00002143380", description="Aspirin 10mg", total_publishable_dollars_spent=Decimal("7.00")
+        )
+        FOIAUniqueNDCData.objects.create(ndc_code="11111222233", description="FOIA only")
+        DODDrugData.objects.create(ndc_code="00002143380", description="Aspirin", price=Decimal("4.00"), quantity=1)
+
+    def add_drug(self, ndc, trade_name, prices):
+        drug = FSSDrug.objects.create(
+            contract=self.contract, vendor=self.vendor, ndc_with_dashes=ndc, trade_name=trade_name, dosage_form="TAB",
+            strength="10MG", route="ORAL", va_class="CN101", covered=True, prime_vendor=False, ingredient="ASPIRIN",
+        )
+        for price_type, price in prices:
+            FSSPricing.objects.create(
+                drug=drug, price=Decimal(price), price_start_date="2026-01-01", price_stop_date="2027-01-01",
+                price_type=price_type, non_taa_compliance="",
+            )
+        return drug
+
+    def active_ndcs(self):
+        return sorted(ConsolidatedDrugData.objects.active().values_list("ndc_code", flat=True))
+
+    def test_rebuild_joins_the_sources_on_ndc_key(self):
+        self.assertEqual(rebuild_consolidated_table(), 2)
+
+        drug = ConsolidatedDrugData.objects.active().get(ndc_key="00002143380")
+        self.assertEqual(drug.ndc_code, "00002-1433-80")
+        # The latest FSS drug names the row, FOIA adds its columns and DOD is applied last
+        self.assertEqual((drug.trade_name, drug.description, drug.source), ("Drug B", "Aspirin 10mg", "DOD"))
+        self.assertEqual((drug.min_fss_price, drug.max_fss_price), (Decimal("1.00"), Decimal("3.00")))
+        self.assertEqual((drug.min_nc_price, drug.max_nc_price), (Decimal("5.00"), Decimal("5.00")))
+        self.assertIsNone(drug.min_big4_price)
+        self.assertEqual(
+            sorted((price.price_type or "", price.price) for price in drug.prices.all()),
+            [("", Decimal("4.00")), ("FSS", Decimal("1.00")), ("FSS", Decimal("3.00")), ("NC", Decimal("5.00"))],
+        )
+
+        foia_only = ConsolidatedDrugData.objects.active().get(ndc_code="11111222233")
+        self.assertEqual((foia_only.source, foia_only.prices.count()), ("FOIA", 0))
+
+    def test_readers_see_a_build_only_once_it_is_activated(self):
+        rebuild_consolidated_table()
+        self.add_drug("00003-0000-01", "Drug C", [("FSS", "2.00")])
+
+        build = ConsolidatedBuild.objects.create()
+        rows, prices = build_consolidated_rows()
+        write_consolidated_rows(build, rows, prices)
+        self.assertEqual(self.active_ndcs(), ["00002-1433-80", "11111222233"])
+
+        activate_build(build)
+        self.assertEqual(self.active_ndcs(), ["00002-1433-80", "00003-0000-01", "11111222233"])
+        self.assertEqual(ConsolidatedBuild.objects.get(is_active=True), build)
+
+    def test_rollback_returns_to_the_previous_build(self):
+        rebuild_consolidated_table()
+        first_build = ConsolidatedBuild.objects.get(is_active=True)
+        self.add_drug("00003-0000-01", "Drug C", [("FSS", "2.00")])
+        rebuild_consolidated_table()
+
+        self.assertEqual(rollback_consolidated_build(), first_build)
+        self.assertEqual(ConsolidatedBuild.objects.get(is_active=True), first_build)
+        self.assertEqual(self.active_ndcs(), ["00002-1433-80", "11111222233"])
+
+    def test_rollback_without_a_previous_build(self):
+        rebuild_consolidated_table()
+        self.assertIsNone(rollback_consolidated_build())
+
+    def test_pruning_keeps_the_active_and_previous_builds(self):
+        for _ in range(3):
+            rebuild_consolidated_table()
+
+        builds = list(ConsolidatedBuild.objects.order_by("id"))
+        self.assertEqual([build.is_active for build in builds], [False, True])
+        self.assertEqual(
+            set(ConsolidatedDrugData.objects.values_list("build", flat=True)), {build.id for build in builds}
+        )
+        self.assertFalse(ConsolidatedDrugPrice.objects.exclude(drug__build__in=builds).exists())
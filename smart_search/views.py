@@ -537,7 +537,7 @@ class ConsolidatedDrugSearchAPIView(viewsets.ModelViewSet):
         general_filters = [f for f in filters if f not in price_filters]
 
         # Apply filters
-        results = ConsolidatedDrugData.objects.all()
+        results = ConsolidatedDrugData.objects.active()
         results = self.apply_general_filters(general_filters, results)
 
         if not results.exists():
@@ -585,7 +585,7 @@ class ConsolidatedDrugSearchAPIView(viewsets.ModelViewSet):
             general_filters = [f for f in filters if f not in price_filters]
 
             # Apply filters to the queryset
-            queryset = ConsolidatedDrugData.objects.all()
+            queryset = ConsolidatedDrugData.objects.active()
             queryset = self.apply_general_filters(general_filters, queryset)
             queryset = self.apply_price_filters(price_filters, queryset)
 
@@ -644,8 +644,9 @@ class ConsolidatedDrugSearchAPIView(viewsets.ModelViewSet):
 class PopulateConsolidatedTableView(APIView):
     def post(self, request, *args, **kwargs):
         
-        # Trigger the background task
-        populate_consolidated_table.delay()
+        # Trigger the background task; incremental only refreshes NDCs changed since the last run
+        incremental = str(request.data.get('incremental', '')).lower() in ('1', 'true')
+        populate_consolidated_table.delay(incremental=incremental)
         
         #For local
         #populate_consolidated_table()